@@ -158,7 +158,7 @@ class QuestionAdmin(OrderedInlineModelAdminMixin, OrderedModelAdmin, ParentLinks
         'id', 'description', 'theme', 'link_to_questionnaire', 'link_to_control')
     readonly_fields = ('id', 'link_to_questionnaire', 'link_to_control')
     raw_id_fields = ('theme',)
-    list_filter = ('theme__questionnaire__control',)
+    list_filter = ('control',)
     search_fields = ('description',)
     inlines = (QuestionFileInline, ResponseFileInline,)
 
@@ -1,19 +1,15 @@
-from functools import partial
-
 import django.dispatch
-import os
-import magic
 from django.conf import settings
 from django.http import HttpResponseForbidden
 from control.serializers import ControlSerializer, ControlListSerializer
 from django.http import HttpResponse
-from django.db import connection
+from django.db import connection, transaction
 from actstream import action
-from django.core.files import File
 from django.db.models import Q
+from django.shortcuts import get_object_or_404
 from rest_framework import (decorators, generics, mixins, serializers, status,
                             viewsets)
-from rest_framework.exceptions import ParseError, PermissionDenied, ValidationError
+from rest_framework.exceptions import NotFound, ParseError, PermissionDenied, ValidationError
 
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
@@ -22,12 +18,19 @@ from control.permissions import (ControlIsNotDeleted, OnlyRepondantCanAccess,
                                  OnlyInspectorCanCreate, OnlyAuthenticatedCanAccess,
                                  OnlyEditorCanChangeQuestionnaire,
                                  ControlDemandeurAccess, QuestionnaireIsDraft)
+from logs.actions import add_log_entries, make_log_entry
 from user_profiles.models import Access
+from uploads.validation import UploadError, check_uploaded_file, get_upload_rejection
 from user_profiles.serializers import AccessSerializer, UserProfileSerializer
 
 from . import serializers as control_serializers
+from .clone import clone_questionnaires, count_files
 from .models import (Control, Question, QuestionFile, Questionnaire, QuestionnaireFile,
                      ResponseFile, Theme)
+from .tasks import copy_questionnaires, generate_questionnaire_document
+from .trash import TrashError, set_trashed
+from .tree_loader import load_control_trees, load_questionnaire_trees
+from .tree_upsert import upsert_questionnaire_tree
 
 # This signal is triggered after the questionnaire is created via the API
 questionnaire_api_post_save = django.dispatch.Signal()
@@ -35,12 +38,27 @@ questionnaire_api_post_save = django.dispatch.Signal()
 questionnaire_api_post_update = django.dispatch.Signal()
 
 
+def start_questionnaires_copy(questionnaires, control, user):
+    """
+    Copy the questionnaires into the control as drafts edited by the user. Copies attaching
+    more than CLONE_SYNC_MAX_FILES files are made in the background : None is returned.
+    """
+    copy_fields = {'editor': user, 'is_draft': True, 'is_replied': False, 'is_finalized': False}
+    if count_files(questionnaires) <= settings.CLONE_SYNC_MAX_FILES:
+        return clone_questionnaires(questionnaires, control, **copy_fields)
+    questionnaire_ids = list(questionnaires.values_list('id', flat=True))
+    transaction.on_commit(
+        lambda: copy_questionnaires.delay(questionnaire_ids, control.id, user.id))
+    return None
+
+
 class ControlViewSet(mixins.CreateModelMixin,
                      mixins.ListModelMixin,
                      mixins.UpdateModelMixin,
                      viewsets.GenericViewSet):
     permission_classes_by_action = {
         "create": (OnlyInspectorCanCreate,),
+        "clone": (OnlyInspectorCanCreate,),
         "update": (ControlDemandeurAccess,),
     }
 
@@ -62,7 +80,10 @@ class ControlViewSet(mixins.CreateModelMixin,
 
     def get_queryset(self):
         if not self.request.user.is_anonymous:
-            return Control.objects.filter(Q(access__in=self.request.user.profile.access.all()) & Q(is_deleted=False))
+            queryset = self.request.user.profile.access_rights.controls()
+            if self.action == 'list':
+                queryset = load_control_trees(queryset, profile=self.request.user.profile)
+            return queryset
 
     def add_log_entry(self, control, verb):
         action_details = {
@@ -106,15 +127,41 @@ class ControlViewSet(mixins.CreateModelMixin,
         return response
 
     
+    @decorators.action(detail=True, methods=['post'], url_path='clone')
+    def clone(self, request, pk):
+        """
+        Create a control with a copy of the questionnaires of this one. The copied
+        questionnaires can be chosen with the `questionnaires` list of ids.
+        """
+        control_source = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            control = serializer.save()
+            Access.objects.create(
+                access_type='demandeur', userprofile=request.user.profile, control=control)
+            self.add_log_duplicate_entry(
+                controlSource=control_source, controlDestination=control, verb='created control')
+            questionnaires = control_source.questionnaires.all()
+            # As in QuestionnaireViewSet, only the demandeurs see the drafts.
+            if not request.user.profile.access_rights.is_demandeur(control_source):
+                questionnaires = questionnaires.filter(is_draft=False)
+            if 'questionnaires' in request.data:
+                questionnaires = questionnaires.filter(id__in=request.data['questionnaires'])
+            copies = start_questionnaires_copy(questionnaires, control, request.user)
+        control = load_control_trees(Control.objects.filter(id=control.id)).get()
+        response_status = status.HTTP_201_CREATED if copies is not None else status.HTTP_202_ACCEPTED
+        return Response(ControlSerializer(control).data, status=response_status)
+
     @decorators.action(detail=True, methods=['get'], url_path='quest_themes')
     def quest_themes(self, request, pk):
-        quest_themes_list = Control.objects.filter(id=pk)
+        quest_themes_list = load_control_trees(Control.objects.filter(id=pk))
         ctl_Serializer = ControlSerializer(quest_themes_list, many=True)
         return Response(ctl_Serializer.data)
     
     @decorators.action(detail=False, methods=['get'], url_path='controls_list')
     def controls_list(self, request):
-        ctl_list = Control.objects.filter(Q(access__in=self.request.user.profile.access.all()) & Q(is_deleted=False))
+        ctl_list = self.request.user.profile.access_rights.controls()
         ctl_Serializer = ControlListSerializer(ctl_list, many=True)
         return Response(ctl_Serializer.data)
     
@@ -172,11 +219,40 @@ class QuestionViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
 
     def get_queryset(self):
         queryset = Question.objects.filter(
-            theme__questionnaire__in=self.request.user.profile.questionnaires)
+            questionnaire__in=self.request.user.profile.questionnaires)
+        queryset = queryset \
+            .select_related('theme__questionnaire__control') \
+            .prefetch_related('question_files', 'response_files__author')
         return queryset
 
 
-class QuestionFileViewSet(mixins.DestroyModelMixin,
+class FileUploadMixin(object):
+    """
+    Checks of the file uploaded to create the object, with uploads.validation.
+    """
+
+    def create(self, request, *args, **kwargs):
+        # A file rejected by the upload handler while it was received is missing from
+        # the request : the rejection is returned instead of the serializer errors.
+        rejection = get_upload_rejection(request)
+        if rejection is not None:
+            raise ValidationError(rejection.message)
+        return super().create(request, *args, **kwargs)
+
+    def get_uploaded_file(self):
+        files = self.request.FILES.getlist('file')
+        if len(files) > 1:
+            raise ValidationError("Le téléchargement de plusieurs fichiers via un seul champ est interdit.")
+        file = files[0] if files else None
+        try:
+            check_uploaded_file(self.request, file)
+        except UploadError as e:
+            raise ValidationError(e.message)
+        return file
+
+
+class QuestionFileViewSet(FileUploadMixin,
+                          mixins.DestroyModelMixin,
                           mixins.ListModelMixin,
                           mixins.CreateModelMixin,
                           viewsets.GenericViewSet):
@@ -185,24 +261,10 @@ class QuestionFileViewSet(mixins.DestroyModelMixin,
     filterset_fields = ('question',)
     permission_classes = (ControlDemandeurAccess, ControlIsNotDeleted, QuestionnaireIsDraft)
 
-    def file_extension_is_valid(self, extension):
-        
-        split_extensions = extension.split(".")
-        if len(split_extensions) > 2: 
-            return False
-        normalized_extension = f".{split_extensions[-1].lower()}"
-        return normalized_extension not in settings.UPLOAD_FILE_EXTENSION_BLACKLIST
-
-    def file_mime_type_is_valid(self, mime_type):
-        blacklist = settings.UPLOAD_FILE_MIME_TYPE_BLACKLIST
-        if any(match.lower() in mime_type.lower() for match in blacklist):
-            return False
-        return True
-    
     def get_queryset(self):
         queryset = QuestionFile.objects.filter(
-            Q(question__theme__questionnaire__control__is_deleted=False) &
-            Q(question__theme__questionnaire__in=self.request.user.profile.questionnaires)
+            Q(control__is_deleted=False) &
+            Q(questionnaire__in=self.request.user.profile.questionnaires)
         )
         return queryset
 
@@ -211,32 +273,14 @@ class QuestionFileViewSet(mixins.DestroyModelMixin,
         # Before creating the QuestionFile, let's check that permission are ok for
         # the associated Question object.
         self.check_object_permissions(self.request, question)
-        files = self.request.FILES.getlist('file')
-        if len(files) > 1:
-            raise ValidationError("Le téléchargement de plusieurs fichiers via un seul champ est interdit.")
+        serializer.save(file=self.get_uploaded_file())
 
-        if any(header.lower() in ['x-infection-found', 'x-virus-name'] for header in self.request.headers):
-            raise ValidationError(
-                "Ce fichier a été notifié comme contenant un virus, merci de vérifier celui-ci avant de le déposer à nouveau."
-            )
 
-        file = files[0] if files else None
-
-        file_extension = os.path.splitext(file.name)[1]
-        if not self.file_extension_is_valid(file_extension):
-            raise ValidationError(f"Cette extension de fichier n'est pas autorisée : {file_extension}")
-
-        mime_type = magic.from_buffer(file.read(2048), mime=True)
-        if not self.file_mime_type_is_valid(mime_type):
-           raise ValidationError(f"Ce type de fichier n'est pas autorisé : {mime_type}")
-
-
-        serializer.save(file=file)
-
-class QuestionnaireFileViewSet(mixins.DestroyModelMixin,
-                          mixins.ListModelMixin,
-                          mixins.CreateModelMixin,
-                          viewsets.GenericViewSet):
+class QuestionnaireFileViewSet(FileUploadMixin,
+                               mixins.DestroyModelMixin,
+                               mixins.ListModelMixin,
+                               mixins.CreateModelMixin,
+                               viewsets.GenericViewSet):
     serializer_class = control_serializers.QuestionnaireFileSerializer
     parser_classes = (MultiPartParser, FormParser)
     filterset_fields = ('questionnaire',)
@@ -246,52 +290,21 @@ class QuestionnaireFileViewSet(mixins.DestroyModelMixin,
         queryset = QuestionnaireFile.objects.filter(
             questionnaire__in=self.request.user.profile.questionnaires)
         return queryset
-    
-    def file_extension_is_valid(self, extension):
-        
-        split_extensions = extension.split(".")
-        if len(split_extensions) > 2: 
-            return False
-        normalized_extension = f".{split_extensions[-1].lower()}"
-        return normalized_extension not in settings.UPLOAD_FILE_EXTENSION_BLACKLIST
-
-    def file_mime_type_is_valid(self, mime_type):
-        blacklist = settings.UPLOAD_FILE_MIME_TYPE_BLACKLIST
-        if any(match.lower() in mime_type.lower() for match in blacklist):
-            return False
-        return True
-    
+
     def perform_create(self, serializer):
         questionnaire = serializer.validated_data['questionnaire']
 
         self.check_object_permissions(self.request, questionnaire)
+        serializer.save(file=self.get_uploaded_file())
 
-        files = self.request.FILES.getlist('file')
-        if len(files) > 1:
-            raise ValidationError("Le téléchargement de plusieurs fichiers via un seul champ est interdit.")
-
-        if any(header.lower() in ['x-infection-found', 'x-virus-name'] for header in self.request.headers):
-            raise ValidationError(
-                "Ce fichier a été notifié comme contenant un virus, merci de vérifier celui-ci avant de le déposer à nouveau."
-            )
-
-        file = files[0] if files else None
-
-        file_extension = os.path.splitext(file.name)[1]
-        if not self.file_extension_is_valid(file_extension):
-            raise ValidationError(f"Cette extension de fichier n'est pas autorisée : {file_extension}")
-
-        mime_type = magic.from_buffer(file.read(2048), mime=True)
-        if not self.file_mime_type_is_valid(mime_type):
-           raise ValidationError(f"Ce type de fichier n'est pas autorisé : {mime_type}")
 
-        """MAX_SIZE_BYTES = 1048576 * settings.UPLOAD_FILE_MAX_SIZE_MB
-        if file.size > MAX_SIZE_BYTES:
-            raise ValidationError(
-                f"La taille du fichier dépasse la limite autorisée de {settings.UPLOAD_FILE_MAX_SIZE_MB} Mo."
-            )
-        """
-        serializer.save(file=file)
+def add_trash_action_log(user, response_file):
+    action_details = {
+        'sender': user,
+        'verb': 'trashed response-file' if response_file.is_deleted else 'untrashed response-file',
+        'target': response_file,
+    }
+    action.send(**action_details)
 
 
 class ResponseFileTrash(mixins.UpdateModelMixin, generics.GenericAPIView):
@@ -300,37 +313,57 @@ class ResponseFileTrash(mixins.UpdateModelMixin, generics.GenericAPIView):
 
     def get_queryset(self):
         queryset = ResponseFile.objects.filter(
-            question__theme__questionnaire__control__in=Control.objects.filter(access__in=self.request.user.profile.access.all())) # Modifier par les controls des access
+            control__in=self.request.user.profile.access_rights.control_ids(include_deleted=True))
         return queryset
 
     def put(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
 
     def perform_update(self, serializer):
-        instance = self.get_object()
-
-        if not serializer.validated_data['is_deleted']:
-            # un-trash : not implemented yet
-            raise serializers.ValidationError('Vous ne pouvez sortir un fichier réponse de la corbeille.')
-
-        if instance.is_deleted:
-            raise serializers.ValidationError('Vous ne pouvez mettre à la corbeille un fichier qui y est déja.')
-
-        # Save a new file, that gets uploaded to the deleted files path.
-        deleted_file = File(instance.file, name=instance.basename)
-        serializer.save(file=deleted_file)
+        instance = serializer.instance
+        # The file is renamed to or from the trash, instead of being copied.
+        try:
+            set_trashed(instance, serializer.validated_data['is_deleted'])
+        except TrashError as e:
+            raise serializers.ValidationError(str(e))
+        add_trash_action_log(self.request.user, instance)
+
+
+class ResponseFileBulkTrash(generics.GenericAPIView):
+    """
+    Move several response files to the trash, or out of it.
+    The files which are already there are left unchanged.
+    """
+    serializer_class = control_serializers.ResponseFileBulkTrashSerializer
+    permission_classes = (OnlyRepondantCanAccess,)
 
-        # Log deletion action
-        if serializer.validated_data['is_deleted']:
-            action_details = {
-                'sender': self.request.user,
-                'verb': 'trashed response-file',
-                'target': instance,
-            }
-            action.send(**action_details)
+    def get_queryset(self):
+        queryset = ResponseFile.objects.filter(
+            control__in=self.request.user.profile.access_rights.control_ids(include_deleted=True))
+        return queryset.select_related('control', 'questionnaire', 'question__theme')
 
-        # Delete file left at old path
-        instance.file.delete(False)
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+        is_deleted = serializer.validated_data['is_deleted']
+        response_files = list(self.get_queryset().filter(id__in=ids))
+        if len(response_files) != len(ids):
+            raise NotFound("Fichier déposé introuvable.")
+        for response_file in response_files:
+            self.check_object_permissions(request, response_file)
+        moved_ids, errors = [], {}
+        for response_file in response_files:
+            if response_file.is_deleted == is_deleted:
+                continue
+            try:
+                set_trashed(response_file, is_deleted)
+            except TrashError as e:
+                errors[response_file.id] = str(e)
+                continue
+            add_trash_action_log(request.user, response_file)
+            moved_ids.append(response_file.id)
+        return Response({'moved': sorted(moved_ids), 'errors': errors})
 
 
 class ThemeViewSet(mixins.UpdateModelMixin, viewsets.GenericViewSet):
@@ -339,7 +372,7 @@ class ThemeViewSet(mixins.UpdateModelMixin, viewsets.GenericViewSet):
 
     def get_queryset(self):
         questionnaires = Questionnaire.objects.filter(
-            control__in=Control.objects.filter(access__in=self.request.user.profile.access.all()))
+            control__in=self.request.user.profile.access_rights.control_ids(include_deleted=True))
         queryset = Theme.objects.filter(questionnaire__in=questionnaires)
         return queryset
 
@@ -351,6 +384,7 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
     permission_classes_by_action = {
         "create": (ControlDemandeurAccess, OnlyEditorCanChangeQuestionnaire, QuestionnaireIsDraft),
         "update": (OnlyAuthenticatedCanAccess, ControlIsNotDeleted),
+        "clone": (ControlDemandeurAccess,),
     }
 
     def get_permissions(self):
@@ -365,15 +399,15 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
             control = questionnaire.control
         except Exception:
             control = Control.objects.get(pk=self.request.data.get("control"))
-        queryset = Questionnaire.objects.filter(
-            control__in=Control.objects.filter(access__in=self.request.user.profile.access.all()))
-        if not self.request.user.profile.access.filter(Q(control=control) & Q(access_type='demandeur')).exists():
+        queryset = Questionnaire.objects.with_reply_flags().filter(
+            control__in=self.request.user.profile.access_rights.control_ids(include_deleted=True))
+        if not self.request.user.profile.access_rights.is_demandeur(control, include_deleted=True):
             queryset = queryset.filter(is_draft=False)
         return queryset
 
     
 
-    def __create_or_update(self, request, save_questionnaire_func, is_update):
+    def __create_or_update(self, request, is_update, partial=False):
         if is_update:
             pre_existing_qr = self.get_object()  # throws 404 if no qr
             control = pre_existing_qr.control
@@ -381,7 +415,7 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
             if pre_existing_qr.is_draft is True:
                 # Only Inspector can publish a Questionnaire
                 if request.data.get("is_draft") is False:
-                    if not request.user.profile.access.filter(Q(control=control) & Q(access_type='demandeur')).exists():
+                    if not request.user.profile.access_rights.is_demandeur(control):
                         e = PermissionDenied(
                             detail=(
                                 "Only inspectors can publish questionnaires "
@@ -392,7 +426,7 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
                     verb = "published"
                 else:
                     # Only Editor can change a Questionnaire
-                    if not request.user.profile.access.filter(Q(control=control) & Q(access_type='demandeur')).exists():
+                    if not request.user.profile.access_rights.is_demandeur(control):
                         e = PermissionDenied(
                             detail=(
                                 "Only editors can edit questionnaires "
@@ -414,7 +448,7 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
                     pre_existing_qr.is_replied is False
                     and request.data.get("is_replied") is True
                 ):
-                    if not request.user.profile.access.filter(Q(control=control) & Q(access_type='repondant')).exists():
+                    if not request.user.profile.access_rights.is_repondant(control):
                         e = PermissionDenied(
                             detail=("Only auditeds can answer questionnaires."),
                             code=status.HTTP_403_FORBIDDEN
@@ -426,7 +460,7 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
                     and pre_existing_qr.is_finalized is False
                     and request.data.get("is_finalized") is True
                 ):
-                    if not request.user.profile.access.filter(Q(control=control) & Q(access_type='demandeur')).exists():
+                    if not request.user.profile.access_rights.is_demandeur(control):
                         e = PermissionDenied(
                             detail=(
                                 "Only inspectors can finalize questionnaires "
@@ -440,7 +474,7 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
                     pre_existing_qr.is_draft is False
                     and pre_existing_qr.end_date != request.data.get("end_date")
                 ):
-                    if not request.user.profile.access.filter(Q(control=control) & Q(access_type='demandeur')).exists():
+                    if not request.user.profile.access_rights.is_demandeur(control):
                         e = PermissionDenied(
                             detail=(
                                 "Only inspectors can change response date "
@@ -460,45 +494,72 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
             pre_existing_qr = None
             verb = "created"
 
-        def log(saved_object):
-            self.__log_action(request.user, verb, saved_object, saved_qr.control)
-
         validated_themes_and_questions = self.__validate_all(request, verb, pre_existing_qr)
-        response = save_questionnaire_func()
-        saved_qr = Questionnaire.objects.get(id=response.data['id'])
-        saved_qr.editor = request.user
-        saved_qr.save()
-
-        log(saved_qr)
-
-        if is_update:
-            def log_delete(saved_object):
-                self.__log_action(request.user, 'deleted', saved_object, saved_qr.control)
-
-            self.__delete_objects_not_in_request_data(qr_in_db=saved_qr,
-                                                      themes_request_data=validated_themes_and_questions,
-                                                      log_delete_func=log_delete)
-
-        self.__save_themes_and_questions(qr_in_db=saved_qr,
-                                         themes_request_data=validated_themes_and_questions,
-                                         log_func=log)
+        with transaction.atomic():
+            # The questionnaire is saved without serializing its tree : the response data
+            # is built once the tree is saved.
+            serializer = self.get_serializer(pre_existing_qr, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            saved_qr = serializer.save()
+            saved_qr.editor = request.user
+            saved_qr.save()
+            changes = upsert_questionnaire_tree(saved_qr, validated_themes_and_questions)
+            log_entries = [self.__make_log_entry(request.user, verb, saved_qr, saved_qr.control)]
+            log_entries.extend(
+                self.__make_log_entry(request.user, 'deleted', deleted_object, saved_qr.control)
+                for deleted_object in changes.deleted)
+            log_entries.extend(
+                self.__make_log_entry(request.user, verb, saved_object, saved_qr.control)
+                for saved_object in changes.saved)
+            add_log_entries(log_entries)
+            if verb == "published":
+                # The document is ready before the audited users download it.
+                transaction.on_commit(
+                    lambda: generate_questionnaire_document.delay(saved_qr.id))
 
         # Use the read serializer to output the response data.
-        response.data = control_serializers.QuestionnaireSerializer(instance=saved_qr).data
+        saved_qr = load_questionnaire_trees(Questionnaire.objects.filter(id=saved_qr.id)).get()
+        data = control_serializers.QuestionnaireSerializer(instance=saved_qr).data
         if not is_update:
             questionnaire_api_post_save.send(sender=Questionnaire, instance=saved_qr)
         questionnaire_api_post_update.send(sender=Questionnaire, instance=saved_qr, session_user=self.request.user)
-        return response
+        response_status = status.HTTP_200_OK if is_update else status.HTTP_201_CREATED
+        return Response(data, status=response_status)
 
-    def create(self, request, *args, **kwargs):
-        save_questionnaire_func = partial(super(QuestionnaireViewSet, self).create, request, *args, **kwargs)
+    @decorators.action(detail=True, methods=['post'], url_path='clone')
+    def clone(self, request, pk):
+        """
+        Copy this questionnaire as a draft, at the end of its control or of the control
+        given in `control`.
+        """
+        access_rights = request.user.profile.access_rights
+        questionnaire = get_object_or_404(
+            Questionnaire.objects
+            .filter(control__in=access_rights.control_ids(include_deleted=True))
+            .filter(
+                Q(is_draft=False) |
+                Q(control__in=access_rights.control_ids('demandeur', include_deleted=True))),
+            pk=pk)
+        self.check_object_permissions(request, questionnaire)
+        control_id = request.data.get('control', questionnaire.control_id)
+        control = get_object_or_404(
+            request.user.profile.access_rights.controls('demandeur'), pk=control_id)
+        with transaction.atomic():
+            copies = start_questionnaires_copy(
+                Questionnaire.objects.filter(id=questionnaire.id), control, request.user)
+            if copies is None:
+                return Response({'control': control.id}, status=status.HTTP_202_ACCEPTED)
+            for copy in copies:
+                self.__log_action(request.user, 'created', copy, control)
+        copy = load_questionnaire_trees(Questionnaire.objects.filter(id=copies[0].id)).get()
+        data = control_serializers.QuestionnaireSerializer(instance=copy).data
+        return Response(data, status=status.HTTP_201_CREATED)
 
-        return self.__create_or_update(request, save_questionnaire_func, is_update=False)
+    def create(self, request, *args, **kwargs):
+        return self.__create_or_update(request, is_update=False)
 
     def update(self, request, *args, **kwargs):
-        save_questionnaire_func = partial(super(QuestionnaireViewSet, self).update, request, *args, **kwargs)
-
-        return self.__create_or_update(request, save_questionnaire_func, is_update=True)
+        return self.__create_or_update(request, is_update=True, partial=kwargs.pop('partial', False))
 
     def __validate_all(self, request, verb, questionnaire_in_db=None):
         """
@@ -526,14 +587,14 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
                 code=status.HTTP_403_FORBIDDEN,
             )
             raise e
-        if control is not None and not request.user.profile.access.all().filter(control__id=control.id).exists():
+        if control is not None and not request.user.profile.access_rights.has_access(control):
             e = PermissionDenied(
                 detail=(
                     'Users can only create questionnaires '
                     'in active controls that they belong to.'),
                 code=status.HTTP_403_FORBIDDEN)
             raise e
-        if verb == "created" and control is not None and control not in request.user.profile.user_controls('demandeur'):
+        if verb == "created" and control is not None and not request.user.profile.access_rights.is_demandeur(control):
             e = PermissionDenied(
                 detail=(
                     'Users can only create questionnaires '
@@ -543,101 +604,6 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
 
         return serializer.validated_data.get('themes', [])
 
-    def __delete_objects_not_in_request_data(self, qr_in_db, themes_request_data, log_delete_func):
-        """
-        This is for an questionnaire update request only.
-        This function deletes objects (questions or themes) that are present in the request data, but not in the DB.
-        Example :
-        The request has : themes: [ {id:1, title:"AAA"}, {id:3, title:"CCC"} ]
-        The DB has themes with ids 1, 2 and 3.
-        This function will delete theme 2 from DB.
-
-        Note that in request data, themes and questions don't always have an id : objects created in front-end don't
-        have an id because they haven't been saved to DB yet.
-
-        :param qr_in_db: questionnaire currently in DB.
-        :param themes_request_data: list of themes coming from update request.
-        :param function for logging the action of deleting.
-        :return:
-        """
-
-        def __find_child_theme_by_id(parent_questionnaire, theme_id):
-            return self.__find_child_obj_by_id(parent_questionnaire, theme_id, Theme)
-
-        # remove themes from DB if they aren't in request data.
-        theme_ids_in_request = [theme_request_data.get('id') for theme_request_data in themes_request_data]
-        for theme_in_db in qr_in_db.themes.all():
-            if theme_in_db.id not in theme_ids_in_request:
-                theme_in_db.delete()
-                log_delete_func(theme_in_db)
-
-        for theme_request_data in themes_request_data:
-            # Find theme in DB corresponding to theme in request_data.
-            theme_in_db = __find_child_theme_by_id(qr_in_db, theme_request_data.get('id'))
-            if theme_in_db is None:
-                continue
-
-            questions_request_data = theme_request_data.get('questions', [])
-            question_ids_in_request = \
-                [question_request_data.get('id') for question_request_data in questions_request_data]
-            for question_in_db in theme_in_db.questions.all():
-                # if question not in request : delete it.
-                if question_in_db.id not in question_ids_in_request:
-                    question_in_db.delete()
-                    log_delete_func(question_in_db)
-
-    def __find_child_obj_by_id(self, parent_obj, child_id, child_class):
-        """
-        Look through the children of parent_obj, and return a child object with id=child_id. If not found return none.
-        :param parent_obj: e.g. an instance of Questionnaire
-        :param child_id: e.g. 3 (we are looking for a child with id=3)
-        :param child_class: e.g. Theme (the children to look through are of type Theme)
-        :return:
-        """
-        if parent_obj is None or child_id is None:
-            return None
-        child_class_name_plural = child_class.__name__.lower() + 's'
-
-        children = getattr(parent_obj, child_class_name_plural)
-        children_ids = children.all().values_list('id')
-        if children_ids.filter(id=child_id).exists():
-            return child_class.objects.get(id=child_id)
-        return None
-
-    def __save_themes_and_questions(self, qr_in_db, themes_request_data, log_func):
-        """
-        For create- or update-questionnaire request : save the data from the request in the db.
-        If the object in request
-        data (theme or question) has an id, we try to find a corresponding existing object in DB and update it.
-        Otherwise we will create a new object in DB.
-        Example :
-        The request has : themes: [ {id:2, title:"AAA"}, {title:"BBB"}, {id:12345, title:"CCC"} ]
-        The DB has one theme with id 2.
-        This function will update theme 2, create a new theme "BBB", and create a new theme "CCC" (because the id is
-        bad, so it is ignored.)
-        :param qr_in_db: questionnaire currently saved in DB
-        :param themes_request_data: themes coming from the data in the http request
-        :param verb: create or update
-        :return:
-        """
-
-        for theme_request_data in themes_request_data:
-            theme_in_db = self.__find_child_obj_by_id(qr_in_db, theme_request_data.get('id'), Theme)
-            theme_serializer = control_serializers.ThemeSerializer(theme_in_db, data=theme_request_data)
-            theme_serializer.is_valid(raise_exception=True)
-            saved_theme = theme_serializer.save(questionnaire=qr_in_db)
-            log_func(saved_theme)
-
-            questions_data = theme_request_data.get('questions', [])
-            for question_data in questions_data:
-                question_in_db = self.__find_child_obj_by_id(
-                    saved_theme, question_data.get('id'), Question)
-                question_serializer = control_serializers.QuestionUpdateSerializer(
-                    question_in_db, data=question_data)
-                question_serializer.is_valid(raise_exception=True)
-                saved_question = question_serializer.save(theme=saved_theme)
-                log_func(saved_question)
-
     def __log_action(self, user, verb, saved_object, control):
         action_details = {
             'sender': user,
@@ -646,3 +612,7 @@ class QuestionnaireViewSet(mixins.CreateModelMixin,
             'target': control,
         }
         action.send(**action_details)
+
+    def __make_log_entry(self, user, verb, saved_object, control):
+        verb = verb + ' ' + saved_object.__class__.__name__.lower()
+        return make_log_entry(verb, user, saved_object, target=control)
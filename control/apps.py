@@ -9,4 +9,5 @@ class ControlConfig(AppConfig):
 
     def ready(self):
         if 'migrate' not in sys.argv:
+            import control.checks  # noqa
             import control.signals  # noqa
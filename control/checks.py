@@ -0,0 +1,26 @@
+from django.core.checks import Error, Tags, register
+
+from .tree_fields import get_unsynced_objects
+
+
+@register(Tags.database)
+def check_tree_fields(app_configs, databases=None, **kwargs):
+    """
+    Check the foreign keys copied on the questions and files, when run with
+    `manage.py check --database default`.
+    """
+    if databases is None:
+        return []
+    errors = []
+    for alias in databases:
+        for queryset in get_unsynced_objects():
+            count = queryset.using(alias).count()
+            if count:
+                errors.append(Error(
+                    f'{count} {queryset.model._meta.label} objects have questionnaire or '
+                    f'control foreign keys that differ from their parent.',
+                    hint='Run control.tree_fields.sync_tree_fields() in `manage.py shell`.',
+                    obj=queryset.model,
+                    id='control.E001',
+                ))
+    return errors
@@ -0,0 +1,180 @@
+"""
+Server-side deep copy of questionnaires : the whole tree is created with bulk_create,
+and the attached files are duplicated on the storage without going through the browser.
+"""
+import os
+import shutil
+
+from django.db import transaction
+from django.db.models import Max
+
+from .managers import bulk_create_ordered
+from .models import Question, Questionnaire, QuestionFile, QuestionnaireFile, Theme
+
+
+# Fields that are never copied from the original questionnaire.
+QUESTIONNAIRE_EXCLUDED_FIELDS = (
+    'id', 'control', 'order', 'uploaded_file', 'generated_file', 'generated_file_fingerprint')
+
+
+def copy_stored_file(field_file, instance):
+    """
+    Duplicate the file of `field_file` for `instance`, under the name given by the
+    upload_to of the field. On a local storage the file is hard-linked when possible,
+    and copied otherwise, never over an existing file.
+    Return the name of the new file.
+    """
+    field = field_file.field
+    storage = field_file.storage
+    basename = os.path.basename(field_file.name)
+    name = storage.get_available_name(
+        field.generate_filename(instance, basename), max_length=field.max_length)
+    try:
+        source_path = field_file.path
+        target_path = storage.path(name)
+    except NotImplementedError:
+        with field_file.open('rb') as source_file:
+            return storage.save(name, source_file, max_length=field.max_length)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    while True:
+        try:
+            os.link(source_path, target_path)
+            return name
+        except FileExistsError:
+            # A file was saved under this name meanwhile.
+            pass
+        except OSError:
+            # The file is copied into a new file only : the file found under the name
+            # may share its content with other files.
+            try:
+                with open(source_path, 'rb') as source_file, \
+                        open(target_path, 'xb') as target_file:
+                    shutil.copyfileobj(source_file, target_file)
+                return name
+            except FileExistsError:
+                pass
+        name = storage.get_available_name(name, max_length=field.max_length)
+        target_path = storage.path(name)
+
+
+def count_files(questionnaires):
+    """
+    Number of files that a copy of the given questionnaires will duplicate.
+    """
+    return QuestionnaireFile.objects.filter(questionnaire__in=questionnaires).count() + \
+        QuestionFile.objects.filter(questionnaire__in=questionnaires).count()
+
+
+class TreeCopier(object):
+    """
+    Copy the content of questionnaires into other questionnaires, with a constant number
+    of queries. The copied files are removed if the copy fails.
+    """
+
+    def __init__(self):
+        self.copied_files = []
+
+    def copy_file(self, original, copy):
+        copy.file.name = copy_stored_file(original.file, copy)
+        self.copied_files.append(copy.file)
+
+    def delete_copied_files(self):
+        for copied_file in self.copied_files:
+            copied_file.storage.delete(copied_file.name)
+        self.copied_files = []
+
+    def copy_questionnaire_files(self, copies):
+        """
+        `copies` maps the original questionnaires ids to their copy.
+        """
+        questionnaire_files = []
+        for original in QuestionnaireFile.objects.filter(questionnaire__in=copies.keys()):
+            copy = QuestionnaireFile(
+                questionnaire=copies[original.questionnaire_id], order=original.order)
+            self.copy_file(original, copy)
+            questionnaire_files.append(copy)
+        bulk_create_ordered(QuestionnaireFile, questionnaire_files)
+
+    def copy_themes(self, copies):
+        """
+        Copy the themes, questions and question files. `copies` maps the original
+        questionnaires ids to their copy.
+        """
+        originals = list(Theme.objects.filter(questionnaire__in=copies.keys()))
+        themes = bulk_create_ordered(Theme, [
+            Theme(
+                questionnaire=copies[theme.questionnaire_id], title=theme.title,
+                order=theme.order)
+            for theme in originals
+        ])
+        theme_copies = {
+            original.id: copy for original, copy in zip(originals, themes)}
+
+        originals = list(Question.objects.filter(theme__in=theme_copies.keys()))
+        questions = []
+        for question in originals:
+            theme = theme_copies[question.theme_id]
+            questions.append(Question(
+                theme=theme, questionnaire=theme.questionnaire,
+                control=theme.questionnaire.control, description=question.description,
+                order=question.order))
+        questions = bulk_create_ordered(Question, questions)
+        question_copies = {
+            original.id: copy for original, copy in zip(originals, questions)}
+
+        question_files = []
+        for original in QuestionFile.objects.filter(question__in=question_copies.keys()):
+            question = question_copies[original.question_id]
+            copy = QuestionFile(
+                question=question, questionnaire=question.questionnaire,
+                control=question.control, order=original.order)
+            self.copy_file(original, copy)
+            question_files.append(copy)
+        bulk_create_ordered(QuestionFile, question_files)
+
+
+def clone_questionnaires(questionnaires, control, **overrides):
+    """
+    Copy the given questionnaires, with their themes, questions and attached files, at the
+    end of `control`. The fields of the copies can be changed with `overrides`.
+    The generated and uploaded questionnaire files are not copied : they are generated
+    again when needed.
+    Return the copies, in the order of the given questionnaires.
+    """
+    questionnaires = list(questionnaires)
+    copier = TreeCopier()
+    try:
+        with transaction.atomic():
+            last_order = control.questionnaires.aggregate(last_order=Max('order'))['last_order']
+            next_order = 0 if last_order is None else last_order + 1
+            copies = []
+            for offset, original in enumerate(questionnaires):
+                fields = {
+                    field.attname: getattr(original, field.attname)
+                    for field in Questionnaire._meta.concrete_fields
+                    if field.name not in QUESTIONNAIRE_EXCLUDED_FIELDS + tuple(overrides)
+                }
+                fields.update(overrides)
+                copies.append(Questionnaire(control=control, order=next_order + offset, **fields))
+            copies = bulk_create_ordered(Questionnaire, copies)
+            copies_by_original_id = {
+                original.id: copy for original, copy in zip(questionnaires, copies)}
+            copier.copy_questionnaire_files(copies_by_original_id)
+            copier.copy_themes(copies_by_original_id)
+    except Exception:
+        copier.delete_copied_files()
+        raise
+    return copies
+
+
+def clone_themes(original_questionnaire, new_questionnaire):
+    """
+    Copy the themes, questions and question files of a questionnaire into another one.
+    """
+    copier = TreeCopier()
+    try:
+        with transaction.atomic():
+            copier.copy_themes({original_questionnaire.id: new_questionnaire})
+    except Exception:
+        copier.delete_copied_files()
+        raise
@@ -1,10 +1,23 @@
+import copy
+import hashlib
+import io
+import json
+import multiprocessing
 import ntpath
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
-
+import django
+from django.apps import apps
 from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.files.base import ContentFile
+from django.db import transaction
 
 from docxtpl import DocxTemplate, RichText
+from docx import Document
+from jinja2 import Environment
 
 from .upload_path import questionnaire_file_path
 
@@ -18,13 +31,178 @@ class DocxMixin(object):
         return RichText(value)
 
 
-def generate_questionnaire_file(questionnaire):
+def get_template_path():
+    return os.path.join(settings.TEMPLATE_DIR, 'ecc', 'questionnaire.docx')
+
+
+class CachingEnvironment(Environment):
+    """
+    Jinja environment compiling each source string only once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compiled_templates = {}
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals is not None or template_class is not None:
+            return super().from_string(source, globals, template_class)
+        template = self.compiled_templates.get(source)
+        if template is None:
+            template = super().from_string(source)
+            self.compiled_templates[source] = template
+        return template
+
+
+class LoadedTemplate(object):
+    """
+    A docx template parsed once : the document is copied for each render, and the
+    patched XML and compiled Jinja templates of its parts are kept for the next renders.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime_ns = os.stat(path).st_mtime_ns
+        self.document = Document(path)
+        self.patched_xml = {}
+        self.jinja_env = CachingEnvironment(autoescape=True)
+
+
+class PreparedDocxTemplate(DocxTemplate):
+    """
+    DocxTemplate rendering a copy of an already loaded template.
     """
-    Generate a word Docx document for the given questionnaire.
+
+    def __init__(self, loaded_template):
+        super().__init__(loaded_template.path)
+        self.loaded_template = loaded_template
+
+    def init_docx(self, reload=True):
+        if not self.docx or (self.is_rendered and reload):
+            self.docx = copy.deepcopy(self.loaded_template.document)
+            self.is_rendered = False
+
+    def patch_xml(self, src_xml):
+        patched_xml = self.loaded_template.patched_xml.get(src_xml)
+        if patched_xml is None:
+            patched_xml = super().patch_xml(src_xml)
+            self.loaded_template.patched_xml[src_xml] = patched_xml
+        return patched_xml
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        if jinja_env is None and autoescape:
+            jinja_env = self.loaded_template.jinja_env
+        super().render(context, jinja_env, autoescape)
+
+
+class TemplateRegistry(object):
+    """
+    The docx templates loaded by the process, loaded again when their file changes.
+    """
+
+    def __init__(self):
+        self.templates = {}
+        self.lock = threading.Lock()
+
+    def get_template(self, path):
+        """
+        Return a PreparedDocxTemplate of the file, ready for one render.
+        """
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self.lock:
+            loaded_template = self.templates.get(path)
+            if loaded_template is None or loaded_template.mtime_ns != mtime_ns:
+                loaded_template = LoadedTemplate(path)
+                self.templates[path] = loaded_template
+        return PreparedDocxTemplate(loaded_template)
+
+    def clear(self):
+        with self.lock:
+            self.templates.clear()
+
+
+template_registry = TemplateRegistry()
+
+
+def get_questionnaire_fingerprint(questionnaire):
+    """
+    Hash of everything the generated document is made of : the template, and the
+    questionnaire with its control, themes, questions and question files.
+    """
+    QuestionFile = apps.get_model('control.QuestionFile')
+    control = questionnaire.control
+    content = [
+        os.stat(get_template_path()).st_mtime_ns,
+        Site.objects.all()[0].domain,
+        [control.reference_code, control.title, control.depositing_organization],
+        [
+            questionnaire.order, questionnaire.title, questionnaire.description,
+            questionnaire.sent_date, questionnaire.end_date,
+        ],
+        list(questionnaire.themes.values_list('id', 'order', 'title')),
+        list(questionnaire.questions.values_list('id', 'theme_id', 'order', 'description')),
+        list(QuestionFile.objects
+             .filter(questionnaire=questionnaire)
+             .values_list('question_id', 'order', 'file')),
+    ]
+    serialized = json.dumps(content, default=str, sort_keys=True)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def is_questionnaire_file_up_to_date(questionnaire, fingerprint):
+    generated_file = questionnaire.generated_file
+    return questionnaire.generated_file_fingerprint == fingerprint and \
+        bool(generated_file) and generated_file.storage.exists(generated_file.name)
+
+
+def update_questionnaire_file(questionnaire):
+    """
+    Generate the document of the questionnaire, unless the document already generated
+    has the same fingerprint, or a file was uploaded instead.
+    Concurrent calls wait for each other with a lock on the questionnaire row, so the
+    same document is never generated twice.
+    Return True if the document was generated.
+    """
+    if questionnaire.uploaded_file:
+        return False
+    fingerprint = get_questionnaire_fingerprint(questionnaire)
+    if is_questionnaire_file_up_to_date(questionnaire, fingerprint):
+        return False
+    Questionnaire = apps.get_model('control.Questionnaire')
+    with transaction.atomic():
+        locked = Questionnaire.objects \
+            .select_for_update() \
+            .only('generated_file', 'generated_file_fingerprint') \
+            .get(pk=questionnaire.pk)
+        if is_questionnaire_file_up_to_date(locked, fingerprint):
+            # Generated by a concurrent call while we were waiting for the lock.
+            questionnaire.generated_file = locked.generated_file.name
+            questionnaire.generated_file_fingerprint = fingerprint
+            return False
+        generate_questionnaire_file(questionnaire, fingerprint)
+    return True
+
+
+def get_questionnaire_to_render(questionnaire_id):
+    """
+    Load the questionnaire with its whole tree, for the template not to query each
+    question and its files.
+    """
+    Questionnaire = apps.get_model('control.Questionnaire')
+    return Questionnaire.objects \
+        .select_related('control') \
+        .prefetch_related('themes__questions__question_files') \
+        .get(pk=questionnaire_id)
+
+
+def render_questionnaire_file(questionnaire):
+    """
+    Render the word Docx document of the given questionnaire in its file.
     The generated docment is based on a Docx template.
     This is made possible thanks to docxtepl Python package.
+    Return the name of the file in the storage of the generated files.
     """
-    doc = DocxTemplate(settings.TEMPLATE_DIR + "/ecc/questionnaire.docx")
+    doc = template_registry.get_template(get_template_path())
     context = {
         'questionnaire': questionnaire,
         'description': RichText(questionnaire.description)
@@ -34,13 +212,73 @@ def generate_questionnaire_file(questionnaire):
     doc.render(context, autoescape=True)
     filename = f'Questionnaire-{questionnaire.numbering}.docx'
     # Why do we need both relative and absolte path?
-    # For django's FileField, we need a relative path from the root of the MEDIA_ROOT.
+    # For django's FileField, we need a relative path from the root of the storage.
     # For saving the file via DocxTemplate, we need to absolute path.
     relative_path = questionnaire_file_path(questionnaire, filename)
-    absolute_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    storage = questionnaire.generated_file.storage
+    try:
+        absolute_path = storage.path(relative_path)
+    except NotImplementedError:
+        # Without local path, e.g. in an object storage, the document is uploaded under a
+        # new name if the previous one still exists : the previous document stays
+        # downloadable until the questionnaire points to the new one.
+        content = io.BytesIO()
+        doc.save(content)
+        return storage.save(relative_path, ContentFile(content.getvalue()))
     file_folder = ntpath.split(absolute_path)[0]
     if not os.path.exists(file_folder):
         os.makedirs(file_folder)
-    doc.save(absolute_path)
+    # The document replaces the previous one at once, as it may be downloaded meanwhile.
+    temporary_path = f'{absolute_path}.{os.getpid()}.tmp'
+    doc.save(temporary_path)
+    os.replace(temporary_path, absolute_path)
+    return relative_path
+
+
+def render_questionnaire_file_by_id(questionnaire_id):
+    return render_questionnaire_file(get_questionnaire_to_render(questionnaire_id))
+
+
+_render_pool = None
+
+
+def get_render_pool():
+    """
+    Pool of processes rendering the documents out of the web workers, when
+    QUESTIONNAIRE_DOCX_PROCESSES is set. Each process keeps its loaded templates.
+    """
+    global _render_pool
+    if not settings.QUESTIONNAIRE_DOCX_PROCESSES:
+        return None
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=settings.QUESTIONNAIRE_DOCX_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup)
+    return _render_pool
+
+
+def generate_questionnaire_file(questionnaire, fingerprint=''):
+    """
+    Generate a word Docx document for the given questionnaire, from its saved data.
+    """
+    Questionnaire = type(questionnaire)
+    previous_name = Questionnaire.objects.filter(pk=questionnaire.pk) \
+        .values_list('generated_file', flat=True).first()
+    render_pool = get_render_pool()
+    if render_pool is None:
+        relative_path = render_questionnaire_file_by_id(questionnaire.pk)
+    else:
+        # The pool only reads the questionnaire : the row is locked by the caller.
+        relative_path = render_pool.submit(
+            render_questionnaire_file_by_id, questionnaire.pk).result()
+    # Only the file fields are saved : a full save would bump the modification date.
     questionnaire.generated_file = relative_path
-    questionnaire.save()
+    questionnaire.generated_file_fingerprint = fingerprint
+    Questionnaire.objects.filter(pk=questionnaire.pk).update(
+        generated_file=relative_path, generated_file_fingerprint=fingerprint)
+    if previous_name and previous_name != relative_path:
+        # The document was uploaded under a new name : the previous one is not used anymore
+        # once the new name is committed.
+        storage = questionnaire.generated_file.storage
+        transaction.on_commit(lambda: storage.delete(previous_name))
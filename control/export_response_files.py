@@ -1,88 +1,161 @@
+import csv
+import os
 import xlsxwriter
 
 from datetime import date
 from .models import ResponseFile
+from .upload_path import strip_file_prefix
 from tempfile import NamedTemporaryFile
 
 from django.utils import timezone
 
 
+# Rows are fetched from the database by chunks of this size.
+CHUNK_SIZE = 2000
+
+COLUMNS = [
+    'N° de Thème',
+    'Thème',
+    'N° de Question',
+    'Question',
+    'Fichiers déposés',
+    'Déposé par',
+    'Date de dépôt',
+    'Heure de dépôt',
+    'Commentaires',
+]
+
+CONTROL_COLUMNS = ['N° de Questionnaire'] + COLUMNS
+
+
 def get_files_for_export(questionnaire):
     queryset = ResponseFile.objects \
-            .filter(question__theme__questionnaire=questionnaire) \
+            .filter(questionnaire=questionnaire) \
             .filter(is_deleted=False) \
+            .select_related('questionnaire', 'question__theme', 'author') \
             .order_by('question__theme__order', 'question__order', 'created') \
             .all()
     return queryset
 
 
+def get_control_files_for_export(control):
+    """
+    Response files of the published questionnaires of the control.
+    """
+    return ResponseFile.objects \
+        .filter(control=control, is_deleted=False, questionnaire__is_draft=False) \
+        .order_by('questionnaire__order', 'question__theme__order', 'question__order', 'created')
+
+
+ROW_FIELDS = (
+    'question__theme__order', 'question__theme__title', 'question__order',
+    'question__description', 'file', 'author__first_name', 'author__last_name', 'created',
+)
+
+
+def make_row(theme_order, theme_title, question_order, description, file_name, first_name,
+             last_name, created):
+    created = timezone.localtime(created)
+    return (
+        theme_order + 1,
+        theme_title,
+        f"{theme_order + 1}.{question_order + 1}",
+        description,
+        strip_file_prefix(os.path.basename(file_name)),
+        f"{first_name} {last_name}",
+        created.strftime('%Y-%m-%d'),
+        created.strftime('%H:%M:%S'),
+    )
+
+
+def iter_response_file_rows(questionnaire):
+    """
+    Rows of the response file list, read with a single query without loading the
+    response files, their questions and authors as objects.
+    """
+    values = get_files_for_export(questionnaire).values_list(*ROW_FIELDS)
+    for row_values in values.iterator(chunk_size=CHUNK_SIZE):
+        yield make_row(*row_values)
+
+
+def iter_control_response_file_rows(control):
+    """
+    Rows of the response file list of all the published questionnaires of the control,
+    starting with the questionnaire number (see CONTROL_COLUMNS).
+    """
+    values = get_control_files_for_export(control).values_list('questionnaire__order', *ROW_FIELDS)
+    for questionnaire_order, *row_values in values.iterator(chunk_size=CHUNK_SIZE):
+        yield (questionnaire_order + 1,) + make_row(*row_values)
+
+
+def get_header_rows(questionnaire):
+    rows = [
+        ['Organisme interrogé', questionnaire.control.depositing_organization],
+        ['Procédure', questionnaire.control.title],
+        ['Dossier', f'/{questionnaire.control.reference_code}'],
+        ['Fichier exporté le', date.today().strftime("%A %d %B %Y")],
+        ['Fichier publié le', questionnaire.sent_date_display],
+        [],
+        [],
+        ['Questionnaire', f'Questionnaire {questionnaire.numbering} : {questionnaire.title}'],
+    ]
+    if questionnaire.end_date:
+        rows.append(['Date limite de réponse', questionnaire.end_date_display])
+    rows.append([])
+    return rows
+
+
+def write_response_file_list_in_xlsx(questionnaire, output):
+    """
+    Write the XLSX list of the response files to output, a path or a binary file.
+    The rows are flushed to disk as they are written (constant_memory mode), which does
+    not support Excel tables : the column headers get an autofilter instead.
+    """
+    options = {'remove_timezone': True, 'constant_memory': True}
+    with xlsxwriter.Workbook(output, options) as workbook:
+        worksheet = workbook.add_worksheet()
+        worksheet.set_column('A:L', 20)
+        row_number = 0
+        for row in get_header_rows(questionnaire):
+            worksheet.write_row(row_number, 0, row)
+            row_number += 1
+        header_row_number = row_number
+        worksheet.write_row(row_number, 0, COLUMNS, workbook.add_format({'bold': True}))
+        for row in iter_response_file_rows(questionnaire):
+            row_number += 1
+            worksheet.write_row(row_number, 0, row)
+        worksheet.autofilter(header_row_number, 0, row_number, len(COLUMNS) - 1)
+
+
 def generate_response_file_list_in_xlsx(questionnaire):
-    row_counter = 0
-
-    def add_row(worksheet, row_contents):
-        nonlocal row_counter
-        worksheet.write_row(row_counter, 0, row_contents)
-        row_counter += 1
-        return row_counter - 1
-
-    with NamedTemporaryFile(delete=False, mode='w') as f:
-        with xlsxwriter.Workbook(f.name, {'remove_timezone': True}) as workbook:
-            worksheet = workbook.add_worksheet()
-
-            add_row(worksheet, ['Organisme interrogé',
-                                questionnaire.control.depositing_organization])
-            add_row(worksheet, ['Procédure',
-                                questionnaire.control.title])
-            add_row(worksheet, ['Dossier',
-                                f'/{questionnaire.control.reference_code}'])
-            add_row(worksheet, ['Fichier exporté le',
-                                date.today().strftime("%A %d %B %Y")])
-            add_row(worksheet, ['Fichier publié le',
-                                questionnaire.sent_date_display])
-            add_row(worksheet, [])
-            add_row(worksheet, [])
-            add_row(worksheet, ['Questionnaire',
-                    f'Questionnaire {questionnaire.numbering } : { questionnaire.title }'])
-
-            if questionnaire.end_date:
-                add_row(worksheet, ['Date limite de réponse',
-                                    questionnaire.end_date_display])
-            add_row(worksheet, [])
-
-            worksheet.set_column('A:L', 20)
-
-            columns = [
-                {'header': 'N° de Thème'},
-                {'header': 'Thème'},
-                {'header': 'N° de Question'},
-                {'header': 'Question'},
-                {'header': 'Fichiers déposés'},
-                {'header': 'Déposé par'},
-                {'header': 'Date de dépôt'},
-                {'header': 'Heure de dépôt'},
-                {'header': 'Commentaires'}
-            ]
-
-            data = [
-                (
-                    file.question.theme.numbering,
-                    file.question.theme.title,
-                    f"{file.theme.numbering}.{file.question.numbering}",
-                    file.question.description,
-                    file.basename,
-                    f"{file.author.first_name} {file.author.last_name}",
-                    timezone.localtime(file.created).strftime('%Y-%m-%d'),
-                    timezone.localtime(file.created).strftime('%H:%M:%S'),
-                )
-                for file in get_files_for_export(questionnaire)
-            ]
-
-            opts = {
-                'data': data,
-                'columns': columns
-            }
-
-            table_size = f'A11:I{len(data) + 11}'
-            worksheet.add_table(table_size, opts)
-
-        return f
+    """
+    Write the XLSX list of the response files to a temporary file, to be removed by the
+    caller.
+    """
+    with NamedTemporaryFile(delete=False, suffix='.xlsx') as f:
+        write_response_file_list_in_xlsx(questionnaire, f)
+    return f
+
+
+class Echo(object):
+    """
+    File-like object returning what is written, for csv.writer to format the lines
+    yielded to a StreamingHttpResponse.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_response_file_list_csv(questionnaire):
+    """
+    Lines of the CSV list of the response files, formatted for Excel : with a BOM for the
+    encoding to be detected, and semicolons as separators.
+    """
+    writer = csv.writer(Echo(), delimiter=';')
+    yield '\ufeff'
+    for row in get_header_rows(questionnaire):
+        yield writer.writerow(row)
+    yield writer.writerow(COLUMNS)
+    for row in iter_response_file_rows(questionnaire):
+        yield writer.writerow(row)
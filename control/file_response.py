@@ -0,0 +1,152 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from django_sendfile import sendfile
+
+
+SIMPLE_SENDFILE_BACKEND = 'django_sendfile.backends.simple'
+
+RANGE_HEADER_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange(object):
+    """
+    File-like object that only reads the given byte range of a file.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def make_etag(stat):
+    """
+    The ETag changes whenever the file is rewritten: it is made of its size and mtime.
+    """
+    return f'"{stat.st_size:x}-{int(stat.st_mtime * 1000000):x}"'
+
+
+def parse_range_header(header, size):
+    """
+    Return the (start, end) byte positions requested by a Range header, end included.
+    Only single ranges are supported : None is returned for anything else, which means
+    the whole file should be sent.
+    Raise ValueError if the range cannot be satisfied.
+    """
+    match = RANGE_HEADER_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range : the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('Unsatisfiable range')
+    return start, min(end, size - 1)
+
+
+def if_range_passes(request, etag, last_modified):
+    """
+    A range request is only honoured if the If-Range validator, when present, still
+    matches the current version of the file.
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and if_range_date >= last_modified
+
+
+def stream_file(request, path, filename, size, etag, last_modified):
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    range_header = request.META.get('HTTP_RANGE')
+    byte_range = None
+    if range_header and if_range_passes(request, etag, last_modified):
+        try:
+            byte_range = parse_range_header(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is None:
+        return FileResponse(
+            open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+    start, end = byte_range
+    length = end - start + 1
+    response = FileResponse(
+        FileRange(open(path, 'rb'), start, length), as_attachment=True, filename=filename,
+        content_type=content_type, status=206)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = length
+    return response
+
+
+def make_file_response(request, path, filename):
+    """
+    Build the response sending the file at the given absolute path as an attachment.
+
+    The file transfer is handed off to the front web server (nginx X-Accel-Redirect,
+    Apache X-Sendfile...) through django-sendfile2, so that the uWSGI worker is released
+    as soon as the permissions are checked. With the simple backend (development, tests),
+    the file is streamed in chunks.
+
+    ETag and Last-Modified validators are sent, so that a browser does not download the
+    same content twice (If-None-Match, If-Modified-Since), and so that an interrupted
+    download can be resumed (Range, If-Range).
+    """
+    stat = os.stat(path)
+    etag = make_etag(stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if settings.SENDFILE_BACKEND == SIMPLE_SENDFILE_BACKEND:
+            response = stream_file(request, path, filename, stat.st_size, etag, last_modified)
+        else:
+            response = sendfile(request, path, attachment=True, attachment_filename=filename)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def make_stored_file_response(request, stored_file, filename):
+    """
+    Build the response sending the file of a FileField as an attachment. A file without
+    local path, in an object storage, is downloaded from the storage itself : the browser
+    is redirected to a signed URL, valid for a few minutes.
+    """
+    try:
+        path = stored_file.path
+    except NotImplementedError:
+        return HttpResponseRedirect(
+            stored_file.storage.get_download_url(stored_file.name, filename))
+    return make_file_response(request, path, filename)
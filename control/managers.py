@@ -0,0 +1,54 @@
+from django.apps import apps
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ordered_model.models import OrderedModelQuerySet
+
+
+def bulk_create_ordered(model, objs):
+    """
+    Insert ordered objects keeping their order field : OrderedModelQuerySet.bulk_create
+    would query the next order of each parent.
+    """
+    return super(OrderedModelQuerySet, model.objects.all()).bulk_create(objs)
+
+
+def count_subquery(queryset):
+    """
+    Count the rows of a queryset correlated to the outer query with OuterRef.
+    """
+    counts = queryset.order_by().values('questionnaire').annotate(count=Count('id'))
+    return Coalesce(Subquery(counts.values('count'), output_field=IntegerField()), Value(0))
+
+
+class QuestionnaireQuerySet(OrderedModelQuerySet):
+
+    def with_reply_flags(self):
+        """
+        Annotate the questionnaires with :
+        - has_response_files : whether any file was deposited (used by `has_replies`)
+        - answered_question_count : number of questions having at least one response file
+        - unanswered_question_count : number of questions without any response file
+        """
+        Question = apps.get_model('control.Question')
+        ResponseFile = apps.get_model('control.ResponseFile')
+        questions = Question.objects.filter(questionnaire=OuterRef('pk'))
+        answered_questions = questions.filter(
+            Exists(ResponseFile.objects.filter(question=OuterRef('pk'))))
+        return self.annotate(
+            has_response_files=Exists(
+                ResponseFile.objects.filter(questionnaire=OuterRef('pk'))),
+            question_count=count_subquery(questions),
+            answered_question_count=count_subquery(answered_questions),
+        ).annotate(
+            unanswered_question_count=F('question_count') - F('answered_question_count'),
+        )
+
+    def due_on(self, due_dates):
+        """
+        Questionnaires sent and not finalized, of active controls, whose answer is due on one
+        of due_dates : the filter on end_date uses its index.
+        """
+        return self.filter(
+            end_date__in=due_dates, is_draft=False, is_finalized=False,
+            control__deleted_at__isnull=True, control__is_deleted=False)
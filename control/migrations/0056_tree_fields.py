@@ -0,0 +1,64 @@
+# Generated by Django 3.2.17 on 2026-10-18 15:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_tree_fields(apps, schema_editor):
+    Theme = apps.get_model('control', 'Theme')
+    Question = apps.get_model('control', 'Question')
+    QuestionFile = apps.get_model('control', 'QuestionFile')
+    ResponseFile = apps.get_model('control', 'ResponseFile')
+    themes = Theme.objects.filter(pk=models.OuterRef('theme_id'))
+    Question.objects.update(
+        questionnaire=models.Subquery(themes.values('questionnaire_id')[:1]),
+        control=models.Subquery(themes.values('questionnaire__control_id')[:1]),
+    )
+    questions = Question.objects.filter(pk=models.OuterRef('question_id'))
+    for model in (QuestionFile, ResponseFile):
+        model.objects.update(
+            questionnaire=models.Subquery(questions.values('questionnaire_id')[:1]),
+            control=models.Subquery(questions.values('control_id')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0055_control_is_pinned'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='control',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='questions', to='control.control', verbose_name='procédure'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='questionnaire',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='questions', to='control.questionnaire', verbose_name='questionnaire'),
+        ),
+        migrations.AddField(
+            model_name='questionfile',
+            name='control',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='question_files', to='control.control', verbose_name='procédure'),
+        ),
+        migrations.AddField(
+            model_name='questionfile',
+            name='questionnaire',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='question_files', to='control.questionnaire', verbose_name='questionnaire'),
+        ),
+        migrations.AddField(
+            model_name='responsefile',
+            name='control',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='response_files', to='control.control', verbose_name='procédure'),
+        ),
+        migrations.AddField(
+            model_name='responsefile',
+            name='questionnaire',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='response_files', to='control.questionnaire', verbose_name='questionnaire'),
+        ),
+        migrations.RunPython(
+            fill_tree_fields, reverse_code=lambda apps, schema_editor: None)
+    ]
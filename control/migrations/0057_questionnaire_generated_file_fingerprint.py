@@ -0,0 +1,18 @@
+# Generated by Django 3.2.17 on 2026-10-18 15:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0056_tree_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questionnaire',
+            name='generated_file_fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Le fichier généré est à jour tant que cette empreinte ne change pas.', max_length=64, verbose_name='empreinte du fichier généré'),
+        ),
+    ]
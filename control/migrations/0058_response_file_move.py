@@ -0,0 +1,32 @@
+# Generated by Django 3.2.17 on 2026-10-18 16:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0057_questionnaire_generated_file_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseFileMove',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('source', models.CharField(max_length=2000, verbose_name="chemin d'origine")),
+                ('target', models.CharField(max_length=2000, verbose_name='chemin de destination')),
+                ('is_deleted', models.BooleanField(verbose_name='vers la corbeille')),
+                ('response_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moves', to='control.responsefile', verbose_name='fichier déposé')),
+            ],
+            options={
+                'verbose_name': 'Déplacement de fichier déposé',
+                'verbose_name_plural': 'Déplacements de fichiers déposés',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.17 on 2026-10-18 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0058_response_file_move'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='questionnaire',
+            name='end_date',
+            field=models.DateField(blank=True, db_index=True, help_text='Date de réponse souhaitée', null=True, verbose_name='échéance'),
+        ),
+    ]
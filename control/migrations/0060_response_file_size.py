@@ -0,0 +1,18 @@
+# Generated by Django 3.2.17 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0059_questionnaire_end_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='responsefile',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='taille'),
+        ),
+    ]
@@ -15,6 +15,7 @@ from django_softdelete.models import SoftDeleteModel
 from soft_deletion.managers import DeletableQuerySet
 
 from .docx import DocxMixin
+from .managers import QuestionnaireQuerySet
 from .upload_path import questionnaire_file_path, question_file_path, response_file_path, questionnaire_pj_file_path, Prefixer
 
 from user_profiles.models import UserProfile
@@ -31,31 +32,60 @@ class WithNumberingMixin(object):
     numbering.fget.short_description = 'Numérotation'
 
 
-class FileInfoMixin(object):
+class ParentTrackingMixin(object):
     """
-    Add common helpers for file information.
+    Remember the parent loaded from the database, to know on save if the object was moved.
+    Inheriting classes should set `parent_field` to the name of the parent foreign key.
     """
+    parent_field = None
 
-    @property
-    def control(self):
-        if isinstance(self, QuestionFile):
-            if not self.question:
-                return None
-            return self.question.control
-        if not self.questionnaire:
-            return None
-        return self.questionnaire.control
-        
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get(f'{cls.parent_field}_id')
+        return instance
 
     @property
-    def questionnaire(self):
-        if isinstance(self, QuestionFile):
-            if not self.question:
-                return None
-            return self.question.questionnaire
-        if not self.questionnnaire:
-            return None
-        return self.questionnaire
+    def parent_has_moved(self):
+        if self._state.adding:
+            return False
+        parent_id = getattr(self, f'{self.parent_field}_id')
+        return parent_id != getattr(self, '_loaded_parent_id', None)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_parent_id = getattr(self, f'{self.parent_field}_id')
+
+
+class TreeFieldsMixin(ParentTrackingMixin):
+    """
+    Questions, question files and response files have `questionnaire` and `control`
+    foreign keys, copied from their parent, so that they can be scoped with a single
+    indexed filter. They are set when the object is created or moved.
+    """
+
+    def set_tree_fields(self):
+        parent = getattr(self, self.parent_field)
+        if parent is None:
+            self.questionnaire_id = None
+            self.control_id = None
+        elif isinstance(parent, Theme):
+            self.questionnaire_id = parent.questionnaire_id
+            self.control_id = parent.questionnaire.control_id if parent.questionnaire else None
+        else:
+            self.questionnaire_id = parent.questionnaire_id
+            self.control_id = parent.control_id
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or self.parent_has_moved:
+            self.set_tree_fields()
+        super().save(*args, **kwargs)
+
+
+class FileInfoMixin(object):
+    """
+    Add common helpers for file information.
+    """
 
     @property
     def theme(self):
@@ -149,13 +179,13 @@ class Control(SoftDeleteModel):
         return f'[ID{self.id}] - {self.title}'
 
 
-class Questionnaire(OrderedModel, WithNumberingMixin, DocxMixin):
+class Questionnaire(ParentTrackingMixin, OrderedModel, WithNumberingMixin, DocxMixin):
     title = models.CharField("titre", max_length=255)
     sent_date = models.DateField(
         verbose_name="date d'envoi", blank=True, null=True,
         help_text="Date de transmission du questionnaire")
     end_date = models.DateField(
-        verbose_name="échéance", blank=True, null=True,
+        verbose_name="échéance", blank=True, null=True, db_index=True,
         help_text="Date de réponse souhaitée")
     description = models.TextField("description", blank=True)
     editor = models.ForeignKey(
@@ -173,6 +203,10 @@ class Questionnaire(OrderedModel, WithNumberingMixin, DocxMixin):
         null=True, blank=True,
         help_text=(
             "Ce fichier est généré automatiquement quand le questionnaire est enregistré."))
+    generated_file_fingerprint = models.CharField(
+        verbose_name="empreinte du fichier généré", max_length=64, blank=True, default="",
+        editable=False,
+        help_text="Le fichier généré est à jour tant que cette empreinte ne change pas.")
     control = models.ForeignKey(
         to='Control', verbose_name='procédure', related_name='questionnaires',
         null=True, default=0, blank=True, on_delete=models.CASCADE)
@@ -189,11 +223,21 @@ class Questionnaire(OrderedModel, WithNumberingMixin, DocxMixin):
         help_text="Ce questionnaire a-t-il été finalisé par le demandeur ?")
     modified = models.DateTimeField('modifié', auto_now=True, null=True)
 
+    objects = QuestionnaireQuerySet.as_manager()
+    parent_field = 'control'
+
     class Meta:
         ordering = ('control', 'order')
         verbose_name = "Questionnaire"
         verbose_name_plural = "Questionnaires"
 
+    def save(self, *args, **kwargs):
+        has_moved = self.parent_has_moved
+        super().save(*args, **kwargs)
+        if has_moved:
+            for model in (Question, QuestionFile, ResponseFile):
+                model.objects.filter(questionnaire=self).update(control=self.control_id)
+
     @property
     def file(self):
         """
@@ -255,11 +299,12 @@ class Questionnaire(OrderedModel, WithNumberingMixin, DocxMixin):
 
     @property
     def has_replies(self):
-        for theme in self.themes.all():
-            for question in theme.questions.all():
-                if len(question.response_files.all()) > 0:
-                    return True
-        return False
+        """
+        Use the annotation from `Questionnaire.objects.with_reply_flags()` when present.
+        """
+        if hasattr(self, 'has_response_files'):
+            return self.has_response_files
+        return ResponseFile.objects.filter(questionnaire=self).exists()
 
     def __str__(self):
         display_text = f'[ID{self.id}]'
@@ -281,6 +326,10 @@ class QuestionnaireFile(OrderedModel, FileInfoMixin):
         verbose_name = 'Questionnaire: Fichier Annexe'
         verbose_name_plural = 'Questionnaire: Fichiers Annexes'
 
+    @property
+    def control(self):
+        return self.questionnaire.control
+
     @property
     def url(self):
         return reverse('send-questionnaire-pj-file', args=[self.id])
@@ -300,18 +349,30 @@ class QuestionnaireFile(OrderedModel, FileInfoMixin):
         return self.basename
 
 
-class Theme(OrderedModel, WithNumberingMixin):
+class Theme(ParentTrackingMixin, OrderedModel, WithNumberingMixin):
     title = models.CharField("titre", max_length=255)
     questionnaire = models.ForeignKey(
         to='Questionnaire', verbose_name='questionnaire', related_name='themes',
         null=True, blank=True, on_delete=models.CASCADE)
     order_with_respect_to = 'questionnaire'
+    parent_field = 'questionnaire'
 
     class Meta:
         ordering = ('questionnaire', 'order')
         verbose_name = "Thème"
         verbose_name_plural = "Thèmes"
 
+    def save(self, *args, **kwargs):
+        has_moved = self.parent_has_moved
+        super().save(*args, **kwargs)
+        if has_moved:
+            tree_fields = {'questionnaire': self.questionnaire_id, 'control': None}
+            if self.questionnaire:
+                tree_fields['control'] = self.questionnaire.control_id
+            Question.objects.filter(theme=self).update(**tree_fields)
+            for model in (QuestionFile, ResponseFile):
+                model.objects.filter(question__theme=self).update(**tree_fields)
+
     @property
     def control(self):
         if not self.questionnaire:
@@ -329,29 +390,32 @@ class Theme(OrderedModel, WithNumberingMixin):
         return display_text
 
 
-class Question(OrderedModel, WithNumberingMixin, DocxMixin):
+class Question(TreeFieldsMixin, OrderedModel, WithNumberingMixin, DocxMixin):
     description = models.TextField("description")
     theme = models.ForeignKey(
         'theme', verbose_name='thème', related_name='questions',
         null=True, blank=True, on_delete=models.CASCADE)
+    questionnaire = models.ForeignKey(
+        to='Questionnaire', verbose_name='questionnaire', related_name='questions',
+        null=True, blank=True, editable=False, on_delete=models.CASCADE)
+    control = models.ForeignKey(
+        to='Control', verbose_name='procédure', related_name='questions',
+        null=True, blank=True, editable=False, on_delete=models.CASCADE)
     order_with_respect_to = 'theme'
+    parent_field = 'theme'
 
     class Meta:
         ordering = ('theme', 'order')
         verbose_name = "Question"
         verbose_name_plural = "Questions"
 
-    @property
-    def control(self):
-        if not self.theme:
-            return None
-        return self.theme.control
-
-    @property
-    def questionnaire(self):
-        if not self.theme:
-            return None
-        return self.theme.questionnaire
+    def save(self, *args, **kwargs):
+        has_moved = self.parent_has_moved
+        super().save(*args, **kwargs)
+        if has_moved:
+            for model in (QuestionFile, ResponseFile):
+                model.objects.filter(question=self).update(
+                    questionnaire=self.questionnaire_id, control=self.control_id)
 
     @property
     def description_rich_text(self):
@@ -362,19 +426,26 @@ class Question(OrderedModel, WithNumberingMixin, DocxMixin):
         if self.control:
             display_text += f' [C{self.control.id}]'
         if self.questionnaire:
-            display_text += f' [Q{self.theme.questionnaire.numbering}]'
+            display_text += f' [Q{self.questionnaire.numbering}]'
         if self.theme:
             display_text += f' [T{self.theme.numbering}]'
         display_text += f' - {self.description}'
         return display_text
 
 
-class QuestionFile(OrderedModel, FileInfoMixin):
+class QuestionFile(TreeFieldsMixin, OrderedModel, FileInfoMixin):
     question = models.ForeignKey(
         to='Question', verbose_name='question', related_name='question_files',
         on_delete=models.CASCADE)
+    questionnaire = models.ForeignKey(
+        to='Questionnaire', verbose_name='questionnaire', related_name='question_files',
+        null=True, blank=True, editable=False, on_delete=models.CASCADE)
+    control = models.ForeignKey(
+        to='Control', verbose_name='procédure', related_name='question_files',
+        null=True, blank=True, editable=False, on_delete=models.CASCADE)
     file = models.FileField(verbose_name="fichier", upload_to=question_file_path)
     order_with_respect_to = 'question'
+    parent_field = 'question'
 
     class Meta:
         ordering = ('question', 'order')
@@ -401,21 +472,36 @@ class QuestionFile(OrderedModel, FileInfoMixin):
 
 
 @cleanup.ignore
-class ResponseFile(TimeStampedModel, FileInfoMixin):
+class ResponseFile(TreeFieldsMixin, TimeStampedModel, FileInfoMixin):
     question = models.ForeignKey(
         to='Question', verbose_name='question', related_name='response_files',
         on_delete=models.CASCADE)
+    questionnaire = models.ForeignKey(
+        to='Questionnaire', verbose_name='questionnaire', related_name='response_files',
+        null=True, blank=True, editable=False, on_delete=models.CASCADE)
+    control = models.ForeignKey(
+        to='Control', verbose_name='procédure', related_name='response_files',
+        null=True, blank=True, editable=False, on_delete=models.CASCADE)
     file = models.FileField(verbose_name="fichier", upload_to=response_file_path, max_length=2000)
+    # Known when the file is saved, for the size of the exports not to read each file.
+    file_size = models.BigIntegerField(
+        verbose_name="taille", null=True, blank=True, editable=False)
     author = models.ForeignKey(
         to=settings.AUTH_USER_MODEL, related_name='response_files', on_delete=models.PROTECT)
     is_deleted = models.BooleanField(
         verbose_name="Supprimé", default=False,
         help_text="Ce fichier est-il dans la corbeille ?")
+    parent_field = 'question'
 
     class Meta:
         verbose_name = 'Réponse: Fichier Déposé'
         verbose_name_plural = 'Réponse: Fichiers Déposés'
 
+    def save(self, *args, **kwargs):
+        if self.file_size is None and self.file:
+            self.file_size = self.file.size
+        super().save(*args, **kwargs)
+
     @property
     def url(self):
         return reverse('send-response-file', args=[self.id])
@@ -441,3 +527,23 @@ class ResponseFile(TimeStampedModel, FileInfoMixin):
             return f"{prefixer.make_deleted_file_prefix()}-{filename}"
         filename = prefixer.strip_file_prefix()
         return f"{prefixer.make_file_prefix()}-{filename}"
+
+
+class ResponseFileMove(TimeStampedModel):
+    """
+    Journal of a response file being moved to or from the trash, see control.trash.
+    It is deleted with the move, and left behind only if the move was interrupted.
+    """
+    response_file = models.ForeignKey(
+        to='ResponseFile', verbose_name='fichier déposé', related_name='moves',
+        on_delete=models.CASCADE)
+    source = models.CharField("chemin d'origine", max_length=2000)
+    target = models.CharField("chemin de destination", max_length=2000)
+    is_deleted = models.BooleanField("vers la corbeille")
+
+    class Meta:
+        verbose_name = 'Déplacement de fichier déposé'
+        verbose_name_plural = 'Déplacements de fichiers déposés'
+
+    def __str__(self):
+        return f'id {self.id} - {self.source} -> {self.target}'
@@ -2,7 +2,6 @@ from rest_framework import permissions
 from rest_framework.exceptions import ParseError
 
 from control.models import Control, Question, QuestionFile, Questionnaire, QuestionnaireFile, Theme, ResponseFile
-from django.db.models import Q
 
 
 def get_control_from_object(obj):
@@ -13,14 +12,10 @@ def get_control_from_object(obj):
         control = obj.control
     elif isinstance(obj, Theme):
         control = obj.questionnaire.control
-    elif isinstance(obj, Question):
-        control = obj.theme.questionnaire.control
-    elif isinstance(obj, QuestionFile):
-        control = obj.question.theme.questionnaire.control
+    elif isinstance(obj, (Question, QuestionFile, ResponseFile)):
+        control = obj.control
     elif isinstance(obj, QuestionnaireFile):
         control = obj.questionnaire.control
-    elif isinstance(obj, ResponseFile):
-        control = obj.question.theme.questionnaire.control
     return control
 
 
@@ -54,10 +49,7 @@ class OnlyDemandeurCanAccess(permissions.BasePermission):
         control = get_control_from_object(obj)
         if control.is_deleted:
             return False
-        for access in control.access.all():
-            if access.userprofile.user.id == request.user.id:
-                return access.access_type == "demandeur"
-        return False
+        return request.user.profile.access_rights.is_demandeur(control)
 
 
 class OnlyRepondantCanAccess(permissions.BasePermission):
@@ -74,10 +66,7 @@ class OnlyRepondantCanAccess(permissions.BasePermission):
         control = get_control_from_object(obj)
         if control.is_deleted:
             return False
-        for access in control.access.all():
-            if access.userprofile.user.id == request.user.id:
-                return access.access_type == "repondant"
-        return False
+        return request.user.profile.access_rights.is_repondant(control)
 
 
 class OnlyDemandeurCanChange(permissions.BasePermission):
@@ -96,10 +85,7 @@ class OnlyDemandeurCanChange(permissions.BasePermission):
         control = get_control_from_object(obj)
         if control.is_deleted:
             return False
-        for access in control.access.all():
-            if access.userprofile.user.id == request.user.id:
-                return access.access_type == "demandeur"
-        return False
+        return request.user.profile.access_rights.is_demandeur(control)
 
 
 class OnlyEditorCanChangeQuestionnaire(permissions.BasePermission):
@@ -128,7 +114,7 @@ class ControlDemandeurAccess(permissions.BasePermission):
         if control.is_deleted:
             return False
 
-        return request.user.profile.access.filter(Q(control=control) & Q(access_type='demandeur')).exists()
+        return request.user.profile.access_rights.is_demandeur(control)
 
 class UserDemandeurAccess(permissions.BasePermission):
 
@@ -141,7 +127,7 @@ class UserDemandeurAccess(permissions.BasePermission):
         if not request.data.get('control'):
             return False
         control_id = request.data.get('control')
-        return request.user.profile.access.filter(Q(control=control_id) & Q(access_type='demandeur')).exists()
+        return request.user.profile.access_rights.is_demandeur(control_id)
 
 class ControlIsNotDeleted(permissions.BasePermission):
     message_format = 'Accessing this resource is not allowed.'
@@ -35,6 +35,11 @@ class ResponseFileTrashSerializer(serializers.ModelSerializer):
         fields = ('id', 'is_deleted')
 
 
+class ResponseFileBulkTrashSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    is_deleted = serializers.BooleanField()
+
+
 class QuestionFileSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -79,17 +84,28 @@ class QuestionnaireSerializer(serializers.ModelSerializer):
     modified_date = DateTimeFieldWihTZ(source='modified', format='%a %d %B %Y', read_only=True)
     modified_time = DateTimeFieldWihTZ(source='modified', format='%X', read_only=True)
     questionnaire_files = QuestionnaireFileSerializer(many=True, read_only=True)
+    answered_question_count = serializers.SerializerMethodField()
+    unanswered_question_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Questionnaire
         fields = (
             'id', 'title', 'sent_date', 'end_date', 'description', 'control', 'themes',
             'is_draft', 'is_replied', 'is_finalized', 'editor', 'title_display',
-            'numbering', 'modified_date', 'modified_time', 'has_replies', 'questionnaire_files')
+            'numbering', 'modified_date', 'modified_time', 'has_replies', 'questionnaire_files',
+            'answered_question_count', 'unanswered_question_count')
 
         extra_kwargs = {'control': {'required': True}}
         # not serialized (yet) : file, order
 
+    # The counts are only available on questionnaires loaded with
+    # `Questionnaire.objects.with_reply_flags()`.
+    def get_answered_question_count(self, obj):
+        return getattr(obj, 'answered_question_count', None)
+
+    def get_unanswered_question_count(self, obj):
+        return getattr(obj, 'unanswered_question_count', None)
+
 
 class ControlSerializer(serializers.ModelSerializer):
     questionnaires = QuestionnaireSerializer(many=True, read_only=True)
@@ -107,7 +123,12 @@ class ControlSerializerWithoutDraft(ControlSerializer):
     questionnaires = serializers.SerializerMethodField()
 
     def get_questionnaires(self, obj):
-        questionnaires = obj.questionnaires.filter(is_draft=False)
+        # Filtered in python, to make use of the questionnaires prefetched by
+        # control.tree_loader.
+        questionnaires = [
+            questionnaire for questionnaire in obj.questionnaires.all()
+            if not questionnaire.is_draft
+        ]
         serializer = QuestionnaireSerializer(instance=questionnaires, many=True)
         return serializer.data
 
@@ -117,12 +138,20 @@ class ControlFilteredSerializer(ControlSerializer):
     """
     questionnaires = serializers.SerializerMethodField()
 
+    def get_repondant_control_ids(self):
+        # Computed once for all the serialized controls.
+        if 'repondant_control_ids' not in self.context:
+            profile = self.context["profile"]
+            self.context['repondant_control_ids'] = \
+                profile.access_rights.control_ids('repondant', include_deleted=True)
+        return self.context['repondant_control_ids']
+
     def get_questionnaires(self, obj):
-        profile = self.context["profile"]
-        profile_controls_repondant = profile.user_controls('repondant')
-        questionnaires = obj.questionnaires
-        if profile_controls_repondant.filter(id=obj.id).exists():
-            questionnaires = obj.questionnaires.filter(is_draft=False)
+        questionnaires = obj.questionnaires.all()
+        if obj.id in self.get_repondant_control_ids():
+            questionnaires = [
+                questionnaire for questionnaire in questionnaires if not questionnaire.is_draft
+            ]
         serializer = QuestionnaireSerializer(instance=questionnaires, many=True)
         return serializer.data
 
@@ -1,7 +1,6 @@
 import os
 
 from django.dispatch import receiver
-from django.conf import settings
 
 from .api_views import questionnaire_api_post_save, questionnaire_api_post_update
 from .models import Questionnaire
@@ -17,7 +16,11 @@ def create_questionnaire_path(instance, **kwargs):
     """
     questionnaire = instance
     relative_path = questionnaire_path(questionnaire)
-    absolute_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    try:
+        absolute_path = questionnaire.generated_file.storage.path(relative_path)
+    except NotImplementedError:
+        # Object storages have no folders.
+        return
     if not os.path.exists(absolute_path):
         os.makedirs(absolute_path)
 
@@ -0,0 +1,50 @@
+import logging
+
+from django.conf import settings
+
+from ecc.celery import app
+from celery.utils.log import get_task_logger
+
+from .clone import clone_questionnaires
+from .docx import update_questionnaire_file
+from .models import Control, Questionnaire
+from .trash import recover_response_file_moves as recover_moves
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+@app.task(queue=settings.CELERY_QUEUE)
+def copy_questionnaires(questionnaire_ids, control_id, editor_id):
+    """
+    Copy questionnaires into a control, for copies that attach too many files to be made
+    during the request.
+    """
+    control = Control.objects.get(id=control_id)
+    questionnaires = Questionnaire.objects.filter(id__in=questionnaire_ids).order_by('order')
+    copies = clone_questionnaires(
+        questionnaires, control, editor_id=editor_id, is_draft=True, is_replied=False,
+        is_finalized=False)
+    logger.info(f'Copie de {len(copies)} questionnaire(s) dans la procédure {control.id}')
+
+
+@app.task(queue=settings.QUESTIONNAIRE_DOCX_QUEUE)
+def generate_questionnaire_document(questionnaire_id):
+    """
+    Generate the document of a questionnaire ahead of its downloads, e.g. when it is
+    published.
+    """
+    questionnaire = Questionnaire.objects.select_related('control').get(id=questionnaire_id)
+    if update_questionnaire_file(questionnaire):
+        logger.info(f'Document du questionnaire {questionnaire.id} généré')
+
+
+@app.task(queue=settings.CELERY_QUEUE)
+def recover_response_file_moves():
+    """
+    Complete or undo the moves to and from the trash interrupted by a crash.
+    """
+    recovered_count = recover_moves()
+    if recovered_count:
+        logger.info(f'{recovered_count} déplacement(s) interrompu(s) repris')
@@ -1,5 +1,4 @@
 from django import template
-from django.db.models import Q
 
 
 register = template.Library()
@@ -9,6 +8,6 @@ register = template.Library()
 def get_user_questionnaires(context, control):
     user = context['request'].user
     questionnaires = control.questionnaires.all()
-    if user.profile.access.filter(Q(control=control) & Q(access_type='repondant')).exists():
+    if user.profile.access_rights.is_repondant(control):
         questionnaires = questionnaires.filter(is_draft=False)
     return questionnaires
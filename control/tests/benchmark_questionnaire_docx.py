@@ -0,0 +1,83 @@
+"""
+Compare the generation times of a questionnaire document, as it was generated before
+the template registry, and as it is generated now. This is not part of the test suite :
+
+    pytest control/tests/benchmark_questionnaire_docx.py -s --no-cov
+"""
+import time
+
+from docx import Document
+from docxtpl import DocxTemplate, RichText
+from pytest import mark
+
+from control import docx
+from control.models import Question, Questionnaire
+from tests import factories
+
+
+pytestmark = mark.django_db
+
+QUESTION_COUNT = 500
+THEME_COUNT = 20
+RENDER_COUNT = 5
+
+
+def make_questionnaire():
+    questionnaire = factories.QuestionnaireFactory(uploaded_file=None)
+    for theme_order in range(THEME_COUNT):
+        theme = factories.ThemeFactory(questionnaire=questionnaire, order=theme_order)
+        Question.objects.bulk_create(
+            Question(
+                theme=theme, questionnaire=questionnaire, control=questionnaire.control,
+                order=order, description=f'Question {order} du thème {theme_order}')
+            for order in range(QUESTION_COUNT // THEME_COUNT))
+    for question in Question.objects.filter(questionnaire=questionnaire)[::10]:
+        factories.QuestionFileFactory(question=question)
+    return questionnaire
+
+
+def render_from_template_file(questionnaire_id, path):
+    """
+    Generation before the template registry : the template file is parsed and the
+    questionnaire tree is queried for each render.
+    """
+    questionnaire = Questionnaire.objects.get(id=questionnaire_id)
+    doc = DocxTemplate(docx.get_template_path())
+    doc.render({
+        'questionnaire': questionnaire,
+        'description': RichText(questionnaire.description)
+    }, autoescape=True)
+    doc.save(path)
+
+
+def render_from_registry(questionnaire_id, path):
+    questionnaire = docx.get_questionnaire_to_render(questionnaire_id)
+    doc = docx.template_registry.get_template(docx.get_template_path())
+    doc.render({
+        'questionnaire': questionnaire,
+        'description': RichText(questionnaire.description)
+    }, autoescape=True)
+    doc.save(path)
+
+
+def measure(render, questionnaire_id, path):
+    durations = []
+    for _ in range(RENDER_COUNT):
+        start = time.perf_counter()
+        render(questionnaire_id, path)
+        durations.append(time.perf_counter() - start)
+    return min(durations), sum(durations) / len(durations)
+
+
+def test_benchmark_questionnaire_docx(tmp_path):
+    questionnaire = make_questionnaire()
+    # The first render of the registry loads the template.
+    render_from_registry(questionnaire.id, tmp_path / 'warm-up.docx')
+    results = {}
+    for render in (render_from_template_file, render_from_registry):
+        path = tmp_path / f'{render.__name__}.docx'
+        results[render.__name__] = measure(render, questionnaire.id, path)
+        assert len(Document(path).paragraphs) > QUESTION_COUNT
+    print(f'\n{QUESTION_COUNT} questions, {RENDER_COUNT} renders :')
+    for name, (best, mean) in results.items():
+        print(f'{name:<28} min {best * 1000:8.1f} ms   moyenne {mean * 1000:8.1f} ms')
@@ -0,0 +1,105 @@
+"""
+Compare the exports of the response file list of a 50 000 files questionnaire : the XLSX
+export as it was written before (model objects, whole table in memory), the streamed
+XLSX export, and the CSV export. This is not part of the test suite :
+
+    pytest control/tests/benchmark_response_file_list.py -s --no-cov
+"""
+import os
+import time
+import tracemalloc
+
+import xlsxwriter
+from pytest import mark
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from control.export_response_files import (
+    generate_response_file_list_in_xlsx, get_files_for_export, iter_response_file_list_csv)
+from control.models import Question, ResponseFile
+from tests import factories
+
+
+pytestmark = mark.django_db
+
+FILE_COUNT = 50000
+QUESTION_COUNT = 100
+
+
+def make_questionnaire():
+    questionnaire = factories.QuestionnaireFactory(is_draft=False)
+    theme = factories.ThemeFactory(questionnaire=questionnaire)
+    Question.objects.bulk_create(
+        Question(theme=theme, questionnaire=questionnaire, control=questionnaire.control,
+                 order=order, description=f'Question {order}')
+        for order in range(QUESTION_COUNT))
+    questions = list(Question.objects.filter(theme=theme))
+    author = factories.UserFactory()
+    ResponseFile.objects.bulk_create(
+        (ResponseFile(
+            question=questions[index % QUESTION_COUNT], questionnaire=questionnaire,
+            control=questionnaire.control, author=author,
+            file=f'{questionnaire.control.reference_code}/Q01/T01/Q01-T01-01-fichier-{index}.pdf')
+         for index in range(FILE_COUNT)),
+        batch_size=5000)
+    return questionnaire
+
+
+def export_with_table(questionnaire):
+    """
+    The XLSX export before it was streamed.
+    """
+    with open(os.devnull, 'wb') as output:
+        with xlsxwriter.Workbook(output, {'remove_timezone': True}) as workbook:
+            worksheet = workbook.add_worksheet()
+            data = [
+                (
+                    file.question.theme.numbering,
+                    file.question.theme.title,
+                    f"{file.theme.numbering}.{file.question.numbering}",
+                    file.question.description,
+                    file.basename,
+                    f"{file.author.first_name} {file.author.last_name}",
+                    timezone.localtime(file.created).strftime('%Y-%m-%d'),
+                    timezone.localtime(file.created).strftime('%H:%M:%S'),
+                )
+                for file in get_files_for_export(questionnaire)
+            ]
+            worksheet.add_table(f'A11:I{len(data) + 11}', {
+                'data': data, 'columns': [{'header': str(i)} for i in range(9)]})
+
+
+def export_streamed_xlsx(questionnaire):
+    os.remove(generate_response_file_list_in_xlsx(questionnaire).name)
+
+
+def export_csv(questionnaire):
+    for _ in iter_response_file_list_csv(questionnaire):
+        pass
+
+
+def measure(export, questionnaire):
+    """
+    Return the duration, the memory peak and the number of queries of the export. The
+    memory is traced in a second run, as tracing slows the export down.
+    """
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        export(questionnaire)
+    duration = time.perf_counter() - start
+    tracemalloc.start()
+    export(questionnaire)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return duration, peak, len(queries)
+
+
+def test_benchmark_response_file_list():
+    questionnaire = make_questionnaire()
+    print(f'\n{FILE_COUNT} fichiers déposés :')
+    for export in (export_with_table, export_streamed_xlsx, export_csv):
+        duration, peak, query_count = measure(export, questionnaire)
+        print(f'{export.__name__:<22} {duration:6.1f} s   pic mémoire '
+              f'{peak / 1048576:7.1f} Mo   {query_count} requête(s)')
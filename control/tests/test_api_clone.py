@@ -0,0 +1,216 @@
+import os
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.shortcuts import reverse
+from pytest import mark
+from rest_framework.test import APIClient
+
+from control import clone
+from control.clone import clone_questionnaires, copy_stored_file
+from control.models import Control, Questionnaire, QuestionnaireFile
+from tests import factories, utils
+
+
+pytestmark = mark.django_db
+client = APIClient()
+
+
+def make_model_control():
+    control = factories.ControlFactory(is_model=True)
+    for _ in range(2):
+        questionnaire = factories.QuestionnaireFactory(control=control, is_draft=False)
+        QuestionnaireFile.objects.create(
+            questionnaire=questionnaire, file=SimpleUploadedFile('pj.txt', b'pj'))
+        theme = factories.ThemeFactory(questionnaire=questionnaire)
+        for _ in range(2):
+            question = factories.QuestionFactory(theme=theme)
+            factories.QuestionFileFactory(question=question)
+            factories.ResponseFileFactory(question=question)
+    return control
+
+
+def clone_control(user, control, payload):
+    utils.login(client, user=user)
+    url = reverse('api:control-clone', args=[control.id])
+    return client.post(url, payload, format='json')
+
+
+def clone_questionnaire(user, questionnaire, payload=None):
+    utils.login(client, user=user)
+    url = reverse('api:questionnaire-clone', args=[questionnaire.id])
+    return client.post(url, payload or {}, format='json')
+
+
+def test_clone_questionnaires_copies_the_tree_and_files():
+    control = make_model_control()
+    original = control.questionnaires.first()
+    target = factories.ControlFactory()
+
+    copy = clone_questionnaires([original], target, is_draft=True)[0]
+
+    assert copy.control == target
+    assert copy.title == original.title
+    assert copy.is_draft
+    assert copy.order == 0
+    assert [t.title for t in copy.themes.all()] == [t.title for t in original.themes.all()]
+    questions = list(copy.themes.get().questions.all())
+    assert len(questions) == 2
+    assert all(question.response_files.count() == 0 for question in questions)
+    question_file = questions[0].question_files.get()
+    original_file = original.themes.get().questions.first().question_files.get()
+    assert question_file.file.name != original_file.file.name
+    assert question_file.file.name.startswith(target.reference_code)
+    assert os.path.samefile(question_file.file.path, original_file.file.path) or \
+        open(question_file.file.path, 'rb').read() == open(original_file.file.path, 'rb').read()
+    questionnaire_file = copy.questionnaire_files.get()
+    assert os.path.exists(questionnaire_file.file.path)
+
+
+def reserve_a_name_saved_meanwhile(monkeypatch, storage, other_file):
+    names = [other_file.name]
+    get_available_name = storage.get_available_name
+    monkeypatch.setattr(
+        storage, 'get_available_name',
+        lambda name, **kwargs: names.pop() if names else get_available_name(name, **kwargs))
+
+
+@mark.parametrize('link_error', [None, PermissionError])
+def test_copied_file_never_overwrites_a_file_saved_meanwhile(monkeypatch, link_error):
+    original = factories.QuestionFileFactory(file=SimpleUploadedFile('a.txt', b'original'))
+    other = factories.QuestionFileFactory(file=SimpleUploadedFile('b.txt', b'other'))
+    reserve_a_name_saved_meanwhile(monkeypatch, original.file.storage, other.file)
+    if link_error:
+        def link(source, target):
+            if os.path.exists(target):
+                raise FileExistsError(target)
+            raise link_error(target)
+        monkeypatch.setattr(clone.os, 'link', link)
+
+    name = copy_stored_file(original.file, original)
+
+    assert name != other.file.name
+    assert open(other.file.path, 'rb').read() == b'other'
+    assert open(original.file.storage.path(name), 'rb').read() == b'original'
+
+
+def test_clone_questionnaires_has_a_constant_number_of_queries(django_assert_max_num_queries):
+    control = make_model_control()
+    target = factories.ControlFactory()
+    questionnaires = list(control.questionnaires.all())
+    with django_assert_max_num_queries(12):
+        clone_questionnaires(questionnaires, target)
+    assert list(target.questionnaires.values_list('order', flat=True)) == [0, 1]
+
+
+def test_inspector_can_clone_control():
+    control = make_model_control()
+    user = utils.make_inspector_user(control)
+    checked = control.questionnaires.first()
+
+    response = clone_control(user, control, {
+        'title': 'Copie', 'reference_code': 'COPIE', 'questionnaires': [checked.id]})
+
+    assert response.status_code == 201
+    clone = Control.objects.get(reference_code='COPIE')
+    assert response.data['id'] == clone.id
+    assert clone.access.filter(userprofile=user.profile, access_type='demandeur').exists()
+    copy = clone.questionnaires.get()
+    assert copy.title == checked.title
+    assert copy.is_draft
+    assert copy.editor == user
+    assert len(response.data['questionnaires']) == 1
+
+
+def test_clone_control_is_deferred_for_large_models(settings):
+    settings.CLONE_SYNC_MAX_FILES = 1
+    control = make_model_control()
+    user = utils.make_inspector_user(control)
+
+    response = clone_control(user, control, {'title': 'Copie', 'reference_code': 'COPIE'})
+
+    assert response.status_code == 202
+    assert Control.objects.filter(reference_code='COPIE').exists()
+
+
+def test_clone_control_copies_drafts_for_demandeurs_only():
+    control = make_model_control()
+    draft = factories.QuestionnaireFactory(control=control, is_draft=True)
+    user = utils.make_inspector_user()
+    utils.add_control_to_user(user, control, access_type='repondant')
+
+    response = clone_control(user, control, {'title': 'Copie', 'reference_code': 'COPIE'})
+
+    assert response.status_code == 201
+    copies = Control.objects.get(reference_code='COPIE').questionnaires.all()
+    assert len(copies) == 2
+    assert draft.title not in [copy.title for copy in copies]
+
+
+def test_clone_control_fails_if_reference_code_exists():
+    control = make_model_control()
+    user = utils.make_inspector_user(control)
+
+    response = clone_control(
+        user, control, {'title': 'Copie', 'reference_code': control.reference_code})
+
+    assert response.status_code == 400
+
+
+def test_audited_cannot_clone_control():
+    control = make_model_control()
+    user = utils.make_audited_user(control)
+
+    response = clone_control(user, control, {'title': 'Copie', 'reference_code': 'COPIE'})
+
+    assert response.status_code == 403
+
+
+def test_inspector_can_clone_questionnaire_into_another_control():
+    control = make_model_control()
+    user = utils.make_inspector_user(control)
+    target = factories.ControlFactory()
+    utils.add_control_to_user(user, target, access_type='demandeur')
+    original = control.questionnaires.first()
+
+    response = clone_questionnaire(user, original, {'control': target.id})
+
+    assert response.status_code == 201
+    copy = Questionnaire.objects.get(id=response.data['id'])
+    assert copy.control == target
+    assert copy.editor == user
+    assert len(response.data['themes'][0]['questions']) == 2
+
+
+def test_cannot_clone_questionnaire_into_control_without_demandeur_access():
+    control = make_model_control()
+    user = utils.make_inspector_user(control)
+    target = factories.ControlFactory()
+    utils.add_control_to_user(user, target, access_type='repondant')
+
+    response = clone_questionnaire(user, control.questionnaires.first(), {'control': target.id})
+
+    assert response.status_code == 404
+    assert not target.questionnaires.exists()
+
+
+def test_cannot_clone_a_draft_questionnaire_without_demandeur_access():
+    control = make_model_control()
+    draft = factories.QuestionnaireFactory(control=control, is_draft=True)
+    user = utils.make_inspector_user()
+    utils.add_control_to_user(user, control, access_type='repondant')
+    target = factories.ControlFactory()
+    utils.add_control_to_user(user, target, access_type='demandeur')
+
+    response = clone_questionnaire(user, draft, {'control': target.id})
+
+    assert response.status_code == 404
+    assert not target.questionnaires.exists()
+
+
+def test_audited_cannot_clone_questionnaire():
+    control = make_model_control()
+    user = utils.make_audited_user(control)
+
+    response = clone_questionnaire(user, control.questionnaires.first())
+
+    assert response.status_code == 403
@@ -462,7 +462,7 @@ def test_questionnaire_update__theme_create():
 
 def test_questionnaire_update__theme_create_if_bad_id():
     added_theme = {
-        'id': 123,  # id is bad. It should be ignored, so that this theme is considered new.
+        'id': 999999,  # id is bad. It should be ignored, so that this theme is considered new.
         'title': 'this is a great theme.'
     }
     run_test_questionnaire_update__theme_create(added_theme)
@@ -1,3 +1,5 @@
+import os
+
 from actstream.models import Action
 from django.shortcuts import reverse
 from django.urls.exceptions import NoReverseMatch
@@ -147,15 +149,44 @@ def test_cannot_retrash_a_trashed_file():
     assert ResponseFile.objects.get(id=response_file.id).is_deleted
 
 
-def test_cannot_untrash_a_file():
-    response_file = factories.ResponseFileFactory(is_deleted=True)
+def test_audited_can_untrash_a_file():
+    response_file = factories.ResponseFileFactory()
+    user = utils.make_audited_user(response_file.question.theme.questionnaire.control)
+    path_before = response_file.file.path
+    trash_response_file(user, response_file.id, { "is_deleted": "true" })
+
+    response = trash_response_file(user, response_file.id, { "is_deleted": "false" })
+
+    assert response.status_code == 200
+    assert response.data['is_deleted'] is False
+    response_file = ResponseFile.objects.get(id=response_file.id)
+    assert not response_file.is_deleted
+    assert response_file.file.path == path_before
+    assert Action.objects.filter(verb='untrashed response-file').exists()
+
+
+def test_cannot_untrash_a_file_not_in_the_trash():
+    response_file = factories.ResponseFileFactory()
     user = utils.make_audited_user(response_file.question.theme.questionnaire.control)
     payload = { "is_deleted": "false" }
 
     response = trash_response_file(user, response_file.id, payload)
 
-    assert 400 <= response.status_code < 500
-    assert ResponseFile.objects.get(id=response_file.id).is_deleted
+    assert response.status_code == 400
+    assert not ResponseFile.objects.get(id=response_file.id).is_deleted
+
+
+def test_trashing_renames_the_file_instead_of_copying_it():
+    response_file = factories.ResponseFileFactory()
+    user = utils.make_audited_user(response_file.question.theme.questionnaire.control)
+    inode_before = os.stat(response_file.file.path).st_ino
+    path_before = response_file.file.path
+
+    trash_response_file(user, response_file.id, { "is_deleted": "true" })
+
+    response_file = ResponseFile.objects.get(id=response_file.id)
+    assert os.stat(response_file.file.path).st_ino == inode_before
+    assert not os.path.exists(path_before)
 
 
 def test_cannot_trash_response_file_if_control_is_deleted():
@@ -189,3 +220,35 @@ def test_inspector_cannot_trash_response_file_if_already_deleted():
 
     assert response.status_code == 403
     assert ResponseFile.objects.get(id=response_file.id).is_deleted
+
+
+def bulk_trash_response_files(user, ids, is_deleted):
+    utils.login(client, user=user)
+    url = reverse('response-file-bulk-trash')
+    return client.post(url, {'ids': ids, 'is_deleted': is_deleted}, format='json')
+
+
+def test_audited_can_trash_and_untrash_several_files():
+    response_file = factories.ResponseFileFactory()
+    other_file = factories.ResponseFileFactory(question=response_file.question)
+    user = utils.make_audited_user(response_file.control)
+
+    response = bulk_trash_response_files(user, [response_file.id, other_file.id], True)
+
+    assert response.status_code == 200
+    assert response.data == {'moved': [response_file.id, other_file.id], 'errors': {}}
+    assert ResponseFile.objects.filter(is_deleted=True).count() == 2
+    response = bulk_trash_response_files(user, [response_file.id], False)
+    assert response.data['moved'] == [response_file.id]
+    assert not ResponseFile.objects.get(id=response_file.id).is_deleted
+
+
+def test_cannot_bulk_trash_files_of_another_control():
+    response_file = factories.ResponseFileFactory()
+    other_file = factories.ResponseFileFactory()
+    user = utils.make_audited_user(response_file.control)
+
+    response = bulk_trash_response_files(user, [response_file.id, other_file.id], True)
+
+    assert response.status_code == 404
+    assert not ResponseFile.objects.filter(is_deleted=True).exists()
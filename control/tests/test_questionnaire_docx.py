@@ -0,0 +1,105 @@
+import os
+import shutil
+
+from docxtpl import DocxTemplate
+from pytest import fixture, mark
+
+from control import docx
+from control.models import Question, Questionnaire
+from tests import factories
+
+
+pytestmark = mark.django_db
+
+
+@fixture
+def template_dir(settings, tmp_path):
+    os.makedirs(tmp_path / 'ecc')
+    shutil.copy(docx.get_template_path(), tmp_path / 'ecc' / 'questionnaire.docx')
+    settings.TEMPLATE_DIR = str(tmp_path)
+    return tmp_path
+
+
+@fixture
+def generations(monkeypatch):
+    calls = []
+    generate = docx.generate_questionnaire_file
+
+    def counting_generate(questionnaire, fingerprint=''):
+        calls.append(questionnaire.id)
+        generate(questionnaire, fingerprint)
+
+    monkeypatch.setattr(docx, 'generate_questionnaire_file', counting_generate)
+    return calls
+
+
+def make_questionnaire():
+    questionnaire = factories.QuestionnaireFactory(uploaded_file=None)
+    factories.QuestionFactory(theme=factories.ThemeFactory(questionnaire=questionnaire))
+    return Questionnaire.objects.get(id=questionnaire.id)
+
+
+def test_document_is_generated_once_until_the_questionnaire_changes(generations):
+    questionnaire = make_questionnaire()
+    modified = questionnaire.modified
+    assert docx.update_questionnaire_file(questionnaire)
+    assert os.path.exists(questionnaire.generated_file.path)
+    questionnaire = Questionnaire.objects.get(id=questionnaire.id)
+    assert questionnaire.generated_file_fingerprint
+    assert questionnaire.modified == modified
+
+    assert not docx.update_questionnaire_file(questionnaire)
+    assert generations == [questionnaire.id]
+
+    Question.objects.filter(questionnaire=questionnaire).update(description='changed')
+    assert docx.update_questionnaire_file(questionnaire)
+    assert generations == [questionnaire.id, questionnaire.id]
+
+
+def test_document_is_generated_again_when_the_template_changes(template_dir, generations):
+    questionnaire = make_questionnaire()
+    assert docx.update_questionnaire_file(questionnaire)
+    template_path = docx.get_template_path()
+    stat = os.stat(template_path)
+    os.utime(template_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert docx.update_questionnaire_file(questionnaire)
+    assert len(generations) == 2
+
+
+def test_uploaded_file_is_not_generated(generations):
+    questionnaire = factories.QuestionnaireFactory()
+    assert not docx.update_questionnaire_file(questionnaire)
+    assert generations == []
+
+
+def test_document_generated_while_waiting_for_the_lock_is_not_generated_again(generations):
+    questionnaire = make_questionnaire()
+    stale_questionnaire = Questionnaire.objects.get(id=questionnaire.id)
+    assert docx.update_questionnaire_file(questionnaire)
+    assert not docx.update_questionnaire_file(stale_questionnaire)
+    assert generations == [questionnaire.id]
+    assert stale_questionnaire.generated_file.name == questionnaire.generated_file.name
+
+
+def test_template_is_loaded_once_until_its_file_changes(template_dir):
+    registry = docx.TemplateRegistry()
+    template_path = docx.get_template_path()
+    first = registry.get_template(template_path)
+    second = registry.get_template(template_path)
+    assert first.loaded_template is second.loaded_template
+    stat = os.stat(template_path)
+    os.utime(template_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert registry.get_template(template_path).loaded_template is not first.loaded_template
+
+
+def test_prepared_template_renders_like_the_template_file():
+    questionnaire = docx.get_questionnaire_to_render(make_questionnaire().id)
+    context = {'questionnaire': questionnaire}
+    expected = DocxTemplate(docx.get_template_path())
+    expected.render(context, autoescape=True)
+    for _ in range(2):
+        prepared = docx.template_registry.get_template(docx.get_template_path())
+        prepared.render(context, autoescape=True)
+        assert prepared.get_xml() == expected.get_xml()
+    loaded_document = prepared.loaded_template.document
+    assert '{%' in loaded_document.element.xml
@@ -0,0 +1,55 @@
+from pytest import mark
+
+from control.models import Questionnaire
+from control.serializers import QuestionnaireSerializer
+from tests import factories
+
+
+pytestmark = mark.django_db
+
+
+def make_questionnaire(answered, unanswered):
+    questionnaire = factories.QuestionnaireFactory()
+    theme = factories.ThemeFactory(questionnaire=questionnaire)
+    for _ in range(answered):
+        question = factories.QuestionFactory(theme=theme)
+        factories.ResponseFileFactory(question=question)
+        factories.ResponseFileFactory(question=question)
+    for _ in range(unanswered):
+        factories.QuestionFactory(theme=theme)
+    return questionnaire
+
+
+def test_has_replies_without_annotation():
+    assert make_questionnaire(answered=1, unanswered=1).has_replies
+    assert not make_questionnaire(answered=0, unanswered=2).has_replies
+
+
+def test_with_reply_flags_annotates_counts():
+    replied = make_questionnaire(answered=2, unanswered=1)
+    empty = make_questionnaire(answered=0, unanswered=0)
+    questionnaires = {q.id: q for q in Questionnaire.objects.with_reply_flags()}
+    assert questionnaires[replied.id].has_replies
+    assert questionnaires[replied.id].answered_question_count == 2
+    assert questionnaires[replied.id].unanswered_question_count == 1
+    assert not questionnaires[empty.id].has_replies
+    assert questionnaires[empty.id].answered_question_count == 0
+    assert questionnaires[empty.id].unanswered_question_count == 0
+
+
+def test_has_replies_uses_annotation(django_assert_num_queries):
+    make_questionnaire(answered=1, unanswered=0)
+    questionnaire = Questionnaire.objects.with_reply_flags().get()
+    with django_assert_num_queries(0):
+        assert questionnaire.has_replies
+
+
+def test_serializer_exposes_counts_when_annotated():
+    questionnaire = make_questionnaire(answered=1, unanswered=2)
+    data = QuestionnaireSerializer(questionnaire).data
+    assert data['answered_question_count'] is None
+    annotated = Questionnaire.objects.with_reply_flags().get(id=questionnaire.id)
+    data = QuestionnaireSerializer(annotated).data
+    assert data['has_replies']
+    assert data['answered_question_count'] == 1
+    assert data['unanswered_question_count'] == 2
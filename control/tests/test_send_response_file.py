@@ -1,6 +1,8 @@
 from pytest import mark
 
+from django.conf import settings
 from django.shortcuts import reverse
+from django_sendfile.utils import _get_sendfile
 
 from tests import factories, utils
 
@@ -49,3 +51,83 @@ def test_download_response_file_fails_if_the_control_is_not_associated_with_the_
     url = reverse('send-response-file', args=[response_file.id])
     response = client.get(url)
     assert response.status_code != 200
+
+
+def test_download_response_file_is_streamed(client):
+    runner = SendResponseFileRunner(client)
+    assert runner.response.streaming
+    assert b''.join(runner.response.streaming_content) == open(
+        settings.BASE_DIR + '/tests/data/test.pdf', 'rb').read()
+
+
+def test_download_response_file_is_handed_off_to_nginx(client, settings):
+    settings.SENDFILE_BACKEND = 'django_sendfile.backends.nginx'
+    _get_sendfile.cache_clear()
+    try:
+        runner = SendResponseFileRunner(client)
+    finally:
+        _get_sendfile.cache_clear()
+    assert runner.response.status_code == 200
+    assert runner.response['X-Accel-Redirect'].startswith(settings.SENDFILE_URL)
+    assert runner.response.content == b''
+
+
+def make_response_file_url(client):
+    response_file = factories.ResponseFileFactory()
+    user = response_file.author
+    user.profile.access.create(
+        userprofile=user.profile,
+        control=response_file.question.theme.questionnaire.control,
+    )
+    user.profile.agreed_to_tos = True
+    user.profile.save()
+    utils.login(client, user=user)
+    return reverse('send-response-file', args=[response_file.id])
+
+
+def test_download_response_file_can_be_cached_by_the_browser(client):
+    runner = SendResponseFileRunner(client)
+    assert runner.response.has_header('ETag')
+    assert runner.response.has_header('Last-Modified')
+    assert 'no-store' not in runner.response['Cache-Control']
+    assert 'private' in runner.response['Cache-Control']
+
+
+def test_download_response_file_is_not_sent_again_if_not_modified(client):
+    url = make_response_file_url(client)
+    etag = client.get(url)['ETag']
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+
+
+def test_download_response_file_can_be_resumed(client):
+    url = make_response_file_url(client)
+    content = b''.join(client.get(url).streaming_content)
+    response = client.get(url, HTTP_RANGE='bytes=100-199')
+    assert response.status_code == 206
+    assert response['Content-Range'] == f'bytes 100-199/{len(content)}'
+    assert response['Content-Length'] == '100'
+    assert b''.join(response.streaming_content) == content[100:200]
+
+
+def test_download_response_file_sends_the_end_of_file_for_open_range(client):
+    url = make_response_file_url(client)
+    content = b''.join(client.get(url).streaming_content)
+    response = client.get(url, HTTP_RANGE='bytes=-10')
+    assert response.status_code == 206
+    assert b''.join(response.streaming_content) == content[-10:]
+
+
+def test_download_response_file_sends_whole_file_if_file_changed(client):
+    url = make_response_file_url(client)
+    content = b''.join(client.get(url).streaming_content)
+    response = client.get(url, HTTP_RANGE='bytes=100-199', HTTP_IF_RANGE='"outdated"')
+    assert response.status_code == 200
+    assert b''.join(response.streaming_content) == content
+
+
+def test_download_response_file_fails_for_unsatisfiable_range(client):
+    url = make_response_file_url(client)
+    response = client.get(url, HTTP_RANGE='bytes=100000000-')
+    assert response.status_code == 416
@@ -1,7 +1,14 @@
-from pytest import mark
+import csv
+import io
+import zipfile
+
+from actstream.models import Action
+from pytest import mark, raises
 
 from django.shortcuts import reverse
 
+from control import views
+from control.export_response_files import COLUMNS, iter_response_file_rows
 from tests import factories, utils
 
 
@@ -178,3 +185,64 @@ def test_send_response_file_list_does_not_contais_files_from_other_questionnaire
 
     assert len(files) == 1
     assert files[0].file.name == response_file_1.file.name
+
+
+def make_published_response_files(count):
+    response_file = factories.ResponseFileFactory(is_deleted=False)
+    for _ in range(count - 1):
+        factories.ResponseFileFactory(question=response_file.question, is_deleted=False)
+    questionnaire = response_file.question.theme.questionnaire
+    questionnaire.is_draft = False
+    questionnaire.save()
+    return questionnaire, response_file
+
+
+def test_send_response_file_list_xlsx_contains_file(client):
+    questionnaire, response_file = make_published_response_files(1)
+    user = utils.make_audited_user(questionnaire.control)
+
+    response = get_response_list(client, user, questionnaire.id)
+
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+    sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+    assert response_file.basename in sheet
+    assert 'Fichiers déposés' in sheet
+
+
+def test_send_response_file_list_csv_contains_file(client):
+    questionnaire, response_file = make_published_response_files(1)
+    user = utils.make_audited_user(questionnaire.control)
+    utils.login(client, user=user)
+
+    response = client.get(reverse('send-response-file-list-csv', args=[questionnaire.id]))
+
+    assert response.status_code == 200
+    lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+    rows = list(csv.reader(lines, delimiter=';'))
+    header_index = rows.index(COLUMNS)
+    question = response_file.question
+    assert rows[header_index + 1][:5] == [
+        '1', question.theme.title, '1.1', question.description, response_file.basename]
+
+
+def test_response_file_list_rows_are_read_with_one_query(django_assert_num_queries):
+    questionnaire, _ = make_published_response_files(3)
+
+    with django_assert_num_queries(1):
+        rows = list(iter_response_file_rows(questionnaire))
+
+    assert len(rows) == 3
+
+
+def test_send_response_file_list_failure_is_logged(client, monkeypatch):
+    questionnaire, _ = make_published_response_files(1)
+    user = utils.make_audited_user(questionnaire.control)
+
+    def failing_write(questionnaire, output):
+        raise ValueError('Export impossible')
+
+    monkeypatch.setattr(views, 'write_response_file_list_in_xlsx', failing_write)
+    with raises(ValueError):
+        get_response_list(client, user, questionnaire.id)
+
+    assert Action.objects.filter(verb='exported responses in xls - fail').exists()
@@ -0,0 +1,90 @@
+import os
+from datetime import timedelta
+
+from pytest import mark, raises
+
+from django.utils import timezone
+
+from control.models import ResponseFile, ResponseFileMove
+from control.trash import (
+    TrashError, get_target_name, journal_move, recover_response_file_moves, set_trashed)
+from tests import factories
+
+
+pytestmark = mark.django_db
+
+
+def make_interrupted_move(response_file, is_deleted=True):
+    move = journal_move(response_file, is_deleted)
+    ResponseFileMove.objects.filter(id=move.id).update(
+        created=timezone.now() - timedelta(hours=1))
+    storage = response_file.file.storage
+    return move, storage.path(move.source), storage.path(move.target)
+
+
+def test_file_is_moved_to_the_trash_and_back():
+    response_file = factories.ResponseFileFactory()
+    name_before = response_file.file.name
+
+    set_trashed(response_file, True)
+
+    response_file = ResponseFile.objects.get(id=response_file.id)
+    assert response_file.is_deleted
+    assert '/CORBEILLE/' in response_file.file.name
+    assert os.path.exists(response_file.file.path)
+    set_trashed(response_file, False)
+    assert ResponseFile.objects.get(id=response_file.id).file.name == name_before
+    assert not ResponseFileMove.objects.exists()
+
+
+def test_file_being_moved_cannot_be_moved_again():
+    response_file = factories.ResponseFileFactory()
+    journal_move(response_file, True)
+
+    with raises(TrashError):
+        set_trashed(response_file, True)
+
+
+def test_move_interrupted_after_the_rename_is_completed():
+    response_file = factories.ResponseFileFactory()
+    move, source_path, target_path = make_interrupted_move(response_file)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    os.replace(source_path, target_path)
+
+    assert recover_response_file_moves() == 1
+
+    response_file = ResponseFile.objects.get(id=response_file.id)
+    assert response_file.is_deleted
+    assert response_file.file.name == move.target
+    assert not ResponseFileMove.objects.exists()
+
+
+def test_move_interrupted_before_the_source_is_removed_is_undone():
+    response_file = factories.ResponseFileFactory()
+    move, source_path, target_path = make_interrupted_move(response_file)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    os.link(source_path, target_path)
+
+    assert recover_response_file_moves() == 1
+
+    response_file = ResponseFile.objects.get(id=response_file.id)
+    assert not response_file.is_deleted
+    assert response_file.file.name == move.source
+    assert os.path.exists(source_path)
+    assert not os.path.exists(target_path)
+
+
+def test_recent_moves_are_not_recovered():
+    response_file = factories.ResponseFileFactory()
+    journal_move(response_file, True)
+
+    assert recover_response_file_moves() == 0
+    assert ResponseFileMove.objects.exists()
+
+
+def test_target_name_does_not_overwrite_an_existing_file():
+    response_file = factories.ResponseFileFactory()
+    set_trashed(factories.ResponseFileFactory(question=response_file.question), True)
+
+    assert get_target_name(response_file, True) != \
+        ResponseFile.objects.get(is_deleted=True).file.name
@@ -0,0 +1,81 @@
+from pytest import mark
+
+from control.checks import check_tree_fields
+from control.clone import clone_questionnaires
+from control.models import Question, QuestionFile, ResponseFile, Theme
+from control.tree_fields import get_unsynced_objects, sync_tree_fields
+from control.tree_upsert import upsert_questionnaire_tree
+from tests import factories
+
+
+pytestmark = mark.django_db
+
+
+def assert_tree_fields(obj, questionnaire):
+    obj.refresh_from_db()
+    assert obj.questionnaire_id == questionnaire.id
+    assert obj.control_id == questionnaire.control_id
+
+
+def test_tree_fields_are_set_on_create():
+    response_file = factories.ResponseFileFactory()
+    question_file = factories.QuestionFileFactory(question=response_file.question)
+    questionnaire = response_file.question.theme.questionnaire
+    for obj in (response_file.question, question_file, response_file):
+        assert_tree_fields(obj, questionnaire)
+
+
+def test_tree_fields_follow_a_moved_theme():
+    response_file = factories.ResponseFileFactory()
+    question_file = factories.QuestionFileFactory(question=response_file.question)
+    theme = Theme.objects.get(id=response_file.question.theme_id)
+    other_questionnaire = factories.QuestionnaireFactory()
+    theme.questionnaire = other_questionnaire
+    theme.save()
+    for obj in (response_file.question, question_file, response_file):
+        assert_tree_fields(obj, other_questionnaire)
+
+
+def test_tree_fields_follow_a_moved_questionnaire():
+    response_file = factories.ResponseFileFactory()
+    questionnaire = response_file.question.theme.questionnaire
+    questionnaire.control = factories.ControlFactory()
+    questionnaire.save()
+    for obj in (response_file.question, response_file):
+        assert_tree_fields(obj, questionnaire)
+
+
+def test_tree_fields_follow_a_moved_question():
+    response_file = factories.ResponseFileFactory()
+    question = Question.objects.get(id=response_file.question_id)
+    question.theme = factories.ThemeFactory()
+    question.save()
+    for obj in (question, response_file):
+        assert_tree_fields(obj, question.theme.questionnaire)
+
+
+def test_tree_fields_are_set_by_bulk_saves():
+    questionnaire = factories.QuestionnaireFactory()
+    upsert_questionnaire_tree(questionnaire, [{'title': 'theme', 'questions': [
+        {'description': 'question'}]}])
+    question = Question.objects.get(theme__questionnaire=questionnaire)
+    assert_tree_fields(question, questionnaire)
+    factories.QuestionFileFactory(question=question)
+    copy = clone_questionnaires([questionnaire], factories.ControlFactory())[0]
+    assert_tree_fields(Question.objects.get(theme__questionnaire=copy), copy)
+    assert_tree_fields(QuestionFile.objects.get(question__theme__questionnaire=copy), copy)
+
+
+def test_unsynced_tree_fields_are_checked_and_repaired():
+    response_file = factories.ResponseFileFactory()
+    question = response_file.question
+    assert check_tree_fields(None, databases=['default']) == []
+    Question.objects.filter(id=question.id).update(control=factories.ControlFactory())
+    ResponseFile.objects.filter(id=response_file.id).update(questionnaire=None)
+    assert [queryset.count() for queryset in get_unsynced_objects()] == [1, 0, 1]
+    assert [error.id for error in check_tree_fields(None, databases=['default'])] == \
+        ['control.E001', 'control.E001']
+    assert sync_tree_fields() == 2
+    assert check_tree_fields(None, databases=['default']) == []
+    for obj in (question, response_file):
+        assert_tree_fields(obj, question.theme.questionnaire)
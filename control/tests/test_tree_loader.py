@@ -0,0 +1,151 @@
+from pytest import mark
+
+from django.db import connection
+from django.shortcuts import reverse
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from control.models import Control, Questionnaire
+from control.serializers import ControlSerializer, QuestionnaireSerializer
+from control.tree_loader import load_control_trees, load_questionnaire_trees
+from tests import factories, utils
+
+
+pytestmark = mark.django_db
+client = APIClient()
+
+
+def make_tree(control, size):
+    """
+    Create `size` questionnaires of `size` themes of `size` questions, each question
+    having a question file and a response file.
+    """
+    for _ in range(size):
+        questionnaire = factories.QuestionnaireFactory(control=control, is_draft=False)
+        for _ in range(size):
+            theme = factories.ThemeFactory(questionnaire=questionnaire)
+            for _ in range(size):
+                question = factories.QuestionFactory(theme=theme)
+                factories.QuestionFileFactory(question=question)
+                factories.ResponseFileFactory(question=question)
+    return control
+
+
+def count_queries(func):
+    # Warm-up call, so that the session and site caches don't bias the count.
+    func()
+    with CaptureQueriesContext(connection) as context:
+        func()
+    return len(context.captured_queries)
+
+
+def serialize_control_trees(control_ids):
+    controls = load_control_trees(Control.objects.filter(id__in=control_ids))
+    return ControlSerializer(instance=controls, many=True).data
+
+
+def test_control_tree_is_loaded_with_a_constant_number_of_queries():
+    small_control = make_tree(factories.ControlFactory(), 1)
+    large_control = make_tree(factories.ControlFactory(), 3)
+
+    small_count = count_queries(lambda: serialize_control_trees([small_control.id]))
+    large_count = count_queries(
+        lambda: serialize_control_trees([small_control.id, large_control.id]))
+
+    assert small_count == large_count
+
+
+def test_questionnaire_tree_is_loaded_with_a_constant_number_of_queries():
+    small_control = make_tree(factories.ControlFactory(), 1)
+    large_control = make_tree(factories.ControlFactory(), 3)
+
+    def serialize(control):
+        questionnaires = load_questionnaire_trees(Questionnaire.objects.filter(control=control))
+        return QuestionnaireSerializer(instance=questionnaires, many=True).data
+
+    assert count_queries(lambda: serialize(small_control)) == \
+        count_queries(lambda: serialize(large_control))
+
+
+def test_loaded_control_tree_is_serialized_as_the_lazy_one():
+    control = make_tree(factories.ControlFactory(), 2)
+
+    lazy_data = ControlSerializer(instance=Control.objects.get(id=control.id)).data
+    loaded_data = serialize_control_trees([control.id])[0]
+
+    # The reply counts are only computed by the loader's annotation.
+    for questionnaire_data in loaded_data['questionnaires']:
+        assert questionnaire_data.pop('answered_question_count') == 4
+        assert questionnaire_data.pop('unanswered_question_count') == 0
+    for questionnaire_data in lazy_data['questionnaires']:
+        del questionnaire_data['answered_question_count']
+        del questionnaire_data['unanswered_question_count']
+    assert loaded_data == lazy_data
+
+
+def test_loaded_control_tree_can_exclude_deleted_files():
+    control = make_tree(factories.ControlFactory(), 1)
+    factories.ResponseFileFactory(
+        question=control.questionnaires.get().themes.get().questions.get(), is_deleted=True)
+
+    loaded_control = load_control_trees(
+        Control.objects.filter(id=control.id), include_deleted_files=False).get()
+
+    question = loaded_control.questionnaires.all()[0].themes.all()[0].questions.all()[0]
+    assert len(question.response_files.all()) == 1
+
+
+def test_control_list_api_has_a_constant_number_of_queries():
+    small_control = make_tree(factories.ControlFactory(), 1)
+    user = utils.make_inspector_user(small_control)
+    utils.login(client, user=user)
+    url = reverse('api:control-list')
+    small_count = count_queries(lambda: client.get(url))
+
+    large_control = make_tree(factories.ControlFactory(), 3)
+    utils.add_control_to_user(user, large_control, access_type='demandeur')
+    large_count = count_queries(lambda: client.get(url))
+
+    assert small_count == large_count
+
+
+def test_control_list_api_hides_drafts_from_repondant():
+    control = make_tree(factories.ControlFactory(), 1)
+    factories.QuestionnaireFactory(control=control, is_draft=True)
+    user = utils.make_audited_user(control)
+    utils.login(client, user=user)
+
+    response = client.get(reverse('api:control-list'))
+
+    questionnaires = response.data[0]['questionnaires']
+    assert len(questionnaires) == 1
+    assert not questionnaires[0]['is_draft']
+
+
+def test_quest_themes_api_has_a_constant_number_of_queries():
+    small_control = make_tree(factories.ControlFactory(), 1)
+    large_control = make_tree(factories.ControlFactory(), 3)
+    user = utils.make_inspector_user(small_control)
+    utils.add_control_to_user(user, large_control, access_type='demandeur')
+    utils.login(client, user=user)
+
+    def get_quest_themes(control):
+        return client.get(reverse('api:control-quest-themes', args=[control.id]))
+
+    assert count_queries(lambda: get_quest_themes(small_control)) == \
+        count_queries(lambda: get_quest_themes(large_control))
+
+
+def test_questionnaire_detail_page_has_a_constant_number_of_queries(client):
+    small_control = make_tree(factories.ControlFactory(), 1)
+    user = utils.make_inspector_user(small_control)
+    utils.login(client, user=user)
+    questionnaire = small_control.questionnaires.first()
+    url = reverse('questionnaire-detail', args=[questionnaire.id])
+    small_count = count_queries(lambda: client.get(url))
+
+    large_control = make_tree(factories.ControlFactory(), 3)
+    utils.add_control_to_user(user, large_control, access_type='demandeur')
+    large_count = count_queries(lambda: client.get(url))
+
+    assert small_count == large_count
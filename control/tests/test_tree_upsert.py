@@ -0,0 +1,126 @@
+from pytest import mark
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from actstream.models import Action
+
+from control.models import Question, Theme
+from control.serializers import QuestionnaireSerializer
+from control.tree_upsert import upsert_questionnaire_tree
+from tests import factories, utils
+
+
+pytestmark = mark.django_db
+client = APIClient()
+
+
+def make_questionnaire(theme_count, question_count):
+    questionnaire = factories.QuestionnaireFactory(is_draft=True)
+    for _ in range(theme_count):
+        theme = factories.ThemeFactory(questionnaire=questionnaire)
+        for _ in range(question_count):
+            factories.QuestionFactory(theme=theme)
+    return questionnaire
+
+
+def make_themes_data(questionnaire):
+    return [
+        {
+            'id': theme.id,
+            'title': theme.title,
+            'questions': [
+                {'id': question.id, 'description': question.description}
+                for question in theme.questions.all()
+            ],
+        }
+        for theme in questionnaire.themes.all()
+    ]
+
+
+def test_upsert_creates_updates_and_deletes():
+    questionnaire = make_questionnaire(2, 2)
+    first_theme, second_theme = questionnaire.themes.all()
+    kept_question, deleted_question = first_theme.questions.all()
+    themes_data = [
+        {'title': 'nouveau thème', 'questions': [{'description': 'nouvelle question'}]},
+        {
+            'id': first_theme.id,
+            'title': 'thème modifié',
+            'questions': [
+                {'description': 'ajoutée'},
+                {'id': kept_question.id, 'description': 'modifiée'},
+            ],
+        },
+    ]
+
+    changes = upsert_questionnaire_tree(questionnaire, themes_data)
+
+    assert set(changes.deleted) == {second_theme, deleted_question}
+    themes = list(questionnaire.themes.all())
+    assert [(theme.title, theme.order) for theme in themes] == [
+        ('nouveau thème', 0), ('thème modifié', 1)]
+    assert themes[1].id == first_theme.id
+    assert [(q.description, q.order) for q in themes[1].questions.all()] == [
+        ('ajoutée', 0), ('modifiée', 1)]
+    assert themes[1].questions.get(order=1).id == kept_question.id
+    assert themes[0].questions.get().description == 'nouvelle question'
+    assert not Question.objects.filter(theme=second_theme.id).exists()
+
+
+def test_upsert_ignores_ids_of_other_questionnaires():
+    questionnaire = make_questionnaire(1, 0)
+    other_theme = factories.ThemeFactory()
+    other_question = factories.QuestionFactory()
+
+    upsert_questionnaire_tree(questionnaire, [{
+        'id': other_theme.id, 'title': 'thème',
+        'questions': [{'id': other_question.id, 'description': 'question'}],
+    }])
+
+    theme = questionnaire.themes.get()
+    assert theme.id != other_theme.id
+    assert theme.questions.get().id != other_question.id
+    assert Theme.objects.filter(id=other_theme.id).exists()
+    assert Question.objects.filter(id=other_question.id).exists()
+
+
+def count_update_queries(questionnaire):
+    user = utils.make_inspector_user(questionnaire.control)
+    payload = QuestionnaireSerializer(instance=questionnaire).data
+    payload['themes'][0]['questions'].append({'description': 'ajoutée'})
+    payload['themes'].append({'title': 'ajouté', 'questions': [{'description': 'ajoutée'}]})
+    utils.login(client, user=user)
+    url = f'/api/questionnaire/{questionnaire.id}/'
+    with CaptureQueriesContext(connection) as context:
+        response = client.put(url, payload, format='json')
+    assert response.status_code == 200
+    return len(context.captured_queries)
+
+
+def test_questionnaire_update_has_a_constant_number_of_queries():
+    # Warm-up call, so that the session and site caches don't bias the count.
+    count_update_queries(make_questionnaire(1, 1))
+    small_count = count_update_queries(make_questionnaire(1, 1))
+    large_count = count_update_queries(make_questionnaire(4, 8))
+    assert large_count == small_count
+
+
+def test_questionnaire_update_logs_actions():
+    questionnaire = make_questionnaire(1, 2)
+    user = utils.make_inspector_user(questionnaire.control)
+    payload = QuestionnaireSerializer(instance=questionnaire).data
+    deleted_question_id = payload['themes'][0]['questions'].pop()['id']
+    utils.login(client, user=user)
+
+    response = client.put(f'/api/questionnaire/{questionnaire.id}/', payload, format='json')
+
+    assert response.status_code == 200
+    assert Action.objects.filter(verb='updated questionnaire').count() == 1
+    assert Action.objects.filter(verb='updated theme').count() == 1
+    assert Action.objects.filter(verb='updated question').count() == 1
+    deleted_action = Action.objects.get(verb='deleted question')
+    assert deleted_action.action_object_object_id == str(deleted_question_id)
+    assert deleted_action.target == questionnaire.control
+    assert deleted_action.actor == user
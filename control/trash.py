@@ -0,0 +1,149 @@
+"""
+Moves of the response files to and from the trash. The files are renamed on disk instead
+of being copied, or moved by the object storage, and their new path is saved in the same
+transaction. Each move is journaled beforehand (ResponseFileMove), so that a move
+interrupted by a crash is completed or undone by recover_response_file_moves.
+"""
+import logging
+import os
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ResponseFile, ResponseFileMove
+
+
+logger = logging.getLogger(__name__)
+
+# The moves journaled for longer than this were interrupted.
+INTERRUPTED_MOVE_DELAY = timedelta(minutes=10)
+
+
+class TrashError(Exception):
+    pass
+
+
+def move_file(source_path, target_path):
+    """
+    Rename source_path to target_path, without overwriting it : FileExistsError is raised
+    if target_path exists.
+    """
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    try:
+        os.link(source_path, target_path)
+    except FileExistsError:
+        raise
+    except OSError:
+        # Without hard links, the file is renamed after checking the target.
+        if os.path.exists(target_path):
+            raise FileExistsError(target_path)
+        os.replace(source_path, target_path)
+    else:
+        os.remove(source_path)
+
+
+def move_stored_file(storage, source_name, target_name):
+    """
+    Rename a file of storage, without overwriting it : FileExistsError is raised if
+    target_name exists. A storage without local path, e.g. an object storage, moves it.
+    """
+    try:
+        source_path, target_path = storage.path(source_name), storage.path(target_name)
+    except NotImplementedError:
+        storage.move(source_name, target_name)
+        return
+    move_file(source_path, target_path)
+
+
+def get_target_name(response_file, is_deleted):
+    """
+    Name of the file of response_file once moved to the trash, or out of it.
+    """
+    field = response_file.file.field
+    basename = response_file.basename
+    # The path of a response file depends on whether it is in the trash.
+    response_file.is_deleted = is_deleted
+    try:
+        name = field.generate_filename(response_file, basename)
+    finally:
+        response_file.is_deleted = not is_deleted
+    return response_file.file.storage.get_available_name(name, max_length=field.max_length)
+
+
+def journal_move(response_file, is_deleted):
+    """
+    Check that the file can be moved, then journal its move.
+    """
+    with transaction.atomic():
+        locked_file = ResponseFile.objects.select_for_update().get(id=response_file.id)
+        if locked_file.moves.exists():
+            raise TrashError("Ce fichier est en cours de déplacement.")
+        if locked_file.is_deleted == is_deleted:
+            if is_deleted:
+                raise TrashError(
+                    "Vous ne pouvez mettre à la corbeille un fichier qui y est déja.")
+            raise TrashError("Ce fichier n'est pas dans la corbeille.")
+        return ResponseFileMove.objects.create(
+            response_file=locked_file, source=locked_file.file.name,
+            target=get_target_name(locked_file, is_deleted), is_deleted=is_deleted)
+
+
+def set_trashed(response_file, is_deleted):
+    """
+    Move response_file to the trash, if is_deleted, or out of it.
+    Raise TrashError if it is already there, or being moved.
+    """
+    move = journal_move(response_file, is_deleted)
+    storage = response_file.file.storage
+    is_moved = False
+    try:
+        with transaction.atomic():
+            response_file.file.name = move.target
+            response_file.is_deleted = is_deleted
+            response_file.save(update_fields=('file', 'is_deleted'))
+            move.delete()
+            move_stored_file(storage, move.source, move.target)
+            is_moved = True
+    except Exception:
+        response_file.file.name = move.source
+        response_file.is_deleted = not is_deleted
+        if is_moved:
+            # The transaction failed after the file was moved.
+            move_stored_file(storage, move.target, move.source)
+        ResponseFileMove.objects.filter(id=move.id).delete()
+        raise
+    return response_file
+
+
+def recover_response_file_moves():
+    """
+    Complete the interrupted moves of which the file was moved, and undo the others.
+    Return the number of recovered moves.
+    """
+    date_cutoff = timezone.now() - INTERRUPTED_MOVE_DELAY
+    moves = ResponseFileMove.objects \
+        .filter(created__lt=date_cutoff) \
+        .select_related('response_file')
+    count = 0
+    for move in moves:
+        response_file = move.response_file
+        storage = response_file.file.storage
+        source_exists, target_exists = storage.exists(move.source), storage.exists(move.target)
+        # The journal is deleted with the update of the path : the file was not updated.
+        with transaction.atomic():
+            if target_exists and not source_exists:
+                # Interrupted after the file was moved.
+                response_file.file.name = move.target
+                response_file.is_deleted = move.is_deleted
+                response_file.save(update_fields=('file', 'is_deleted'))
+                logger.info(f'Déplacement terminé : {move}')
+            elif target_exists and not ResponseFile.objects.filter(file=move.target).exists():
+                # Interrupted between the copy of the target and the removal of the source.
+                storage.delete(move.target)
+                logger.info(f'Déplacement annulé : {move}')
+            elif not source_exists:
+                logger.error(f'Fichier introuvable pour le déplacement : {move}')
+            move.delete()
+        count += 1
+    return count
@@ -0,0 +1,52 @@
+"""
+The questions, question files and response files have `questionnaire` and `control`
+foreign keys copied from their parent (see TreeFieldsMixin). These helpers find and
+repair the rows where the copies differ from the tree, for example after a queryset
+update of the parents.
+"""
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+
+from .models import Question, QuestionFile, ResponseFile, Theme
+
+
+def get_unsynced_objects():
+    """
+    Querysets of the objects whose copied foreign keys differ from their parent's.
+    Objects outside of a control (without theme, questionnaire or control) are ignored.
+    """
+    return [
+        Question.objects
+        .filter(theme__questionnaire__control__isnull=False)
+        .exclude(
+            questionnaire=F('theme__questionnaire'),
+            control=F('theme__questionnaire__control')),
+    ] + [
+        model.objects
+        .filter(question__control__isnull=False)
+        .exclude(questionnaire=F('question__questionnaire'), control=F('question__control'))
+        for model in (QuestionFile, ResponseFile)
+    ]
+
+
+def sync_tree_fields():
+    """
+    Copy again the foreign keys of the unsynced objects from their parent.
+    Return the number of updated rows.
+    """
+    question_queryset, question_file_queryset, response_file_queryset = get_unsynced_objects()
+    themes = Theme.objects.filter(pk=OuterRef('theme_id'))
+    questions = Question.objects.filter(pk=OuterRef('question_id'))
+    count = 0
+    with transaction.atomic():
+        count += Question.objects.filter(pk__in=question_queryset.values('pk')).update(
+            questionnaire=Subquery(themes.values('questionnaire_id')[:1]),
+            control=Subquery(themes.values('questionnaire__control_id')[:1]),
+        )
+        # The files are compared to the questions, which are now up to date.
+        for queryset in (question_file_queryset, response_file_queryset):
+            count += queryset.model.objects.filter(pk__in=queryset.values('pk')).update(
+                questionnaire=Subquery(questions.values('questionnaire_id')[:1]),
+                control=Subquery(questions.values('control_id')[:1]),
+            )
+    return count
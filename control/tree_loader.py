@@ -0,0 +1,77 @@
+from django.db.models import Prefetch, Q
+
+from .models import Question, Questionnaire, QuestionFile, QuestionnaireFile, ResponseFile, Theme
+
+
+def get_response_files_queryset(include_deleted_files=True):
+    # The questionnaire is used by the file name prefix.
+    queryset = ResponseFile.objects.select_related('author', 'questionnaire')
+    if not include_deleted_files:
+        queryset = queryset.filter(is_deleted=False)
+    return queryset
+
+
+def get_questionnaire_tree_prefetches(prefix='', include_deleted_files=True):
+    """
+    Prefetches loading the themes, questions and files of questionnaires, with a constant
+    number of queries whatever the size of the tree.
+    The prefetched children keep a reference to their parent, so the properties walking
+    up the tree (ResponseFile.basename, Question.control...) don't query the database.
+    The prefix is the lookup leading to the questionnaires, e.g. 'questionnaires__'
+    when prefetching from controls.
+    """
+    return [
+        Prefetch(f'{prefix}questionnaire_files', queryset=QuestionnaireFile.objects.all()),
+        Prefetch(f'{prefix}themes', queryset=Theme.objects.all()),
+        Prefetch(f'{prefix}themes__questions', queryset=Question.objects.all()),
+        Prefetch(f'{prefix}themes__questions__question_files', queryset=QuestionFile.objects.all()),
+        Prefetch(
+            f'{prefix}themes__questions__response_files',
+            queryset=get_response_files_queryset(include_deleted_files)),
+    ]
+
+
+def get_visible_questionnaires(profile=None, include_drafts=True):
+    """
+    Questionnaires that can be displayed : if a profile is given, the drafts are only
+    visible to the demandeurs of their control.
+    """
+    queryset = Questionnaire.objects.with_reply_flags().select_related('editor')
+    if not include_drafts:
+        return queryset.filter(is_draft=False)
+    if profile is not None:
+        demandeur_controls = profile.access_rights.control_ids('demandeur', include_deleted=True)
+        return queryset.filter(Q(is_draft=False) | Q(control__in=demandeur_controls))
+    return queryset
+
+
+def load_questionnaire_trees(queryset, include_deleted_files=True):
+    """
+    Prefetch the whole tree of the given questionnaires.
+    """
+    return queryset \
+        .with_reply_flags() \
+        .select_related('control', 'editor') \
+        .prefetch_related(*get_questionnaire_tree_prefetches(
+            include_deleted_files=include_deleted_files))
+
+
+def load_control_trees(queryset, profile=None, include_drafts=True, include_deleted_files=True):
+    """
+    Prefetch the whole tree of the given controls. `control.questionnaires.all()` only
+    returns the questionnaires visible according to `get_visible_questionnaires`.
+    """
+    questionnaires = get_visible_questionnaires(profile, include_drafts)
+    return queryset.prefetch_related(
+        Prefetch('questionnaires', queryset=questionnaires),
+        *get_questionnaire_tree_prefetches(
+            prefix='questionnaires__', include_deleted_files=include_deleted_files),
+    )
+
+
+def load_control_summaries(queryset):
+    """
+    Prefetch the questionnaires of the given controls, without their content.
+    """
+    questionnaires = Questionnaire.objects.select_related('editor')
+    return queryset.prefetch_related(Prefetch('questionnaires', queryset=questionnaires))
@@ -0,0 +1,86 @@
+from django.db import transaction
+
+from .managers import bulk_create_ordered
+from .models import Question, Theme
+
+
+class TreeChanges(object):
+    """
+    Objects saved and deleted by `upsert_questionnaire_tree`, in the order of the request.
+    """
+
+    def __init__(self):
+        self.saved = []
+        self.deleted = []
+
+
+def upsert_questionnaire_tree(questionnaire, themes_data):
+    """
+    Save the themes and questions of the request data into the questionnaire, with a
+    constant number of queries whatever the size of the tree.
+
+    The existing tree is loaded once and compared to the request data :
+    - a theme or question having the id of an existing child is updated, otherwise it is
+      created (bad ids are ignored).
+    - themes of the questionnaire and questions of the updated themes that are not in the
+      request data are deleted.
+    - the order of the themes and questions is their position in the request data.
+    """
+    changes = TreeChanges()
+    themes_in_db = {
+        theme.id: theme for theme in questionnaire.themes.prefetch_related('questions')}
+
+    themes_to_create = []
+    themes_to_update = []
+    # (theme, questions data) pairs, questions being saved once their theme has an id.
+    theme_questions = []
+    for order, theme_data in enumerate(themes_data):
+        theme = themes_in_db.pop(theme_data.get('id'), None)
+        if theme is None:
+            theme = Theme(questionnaire=questionnaire)
+            themes_to_create.append(theme)
+        else:
+            themes_to_update.append(theme)
+        theme.title = theme_data['title']
+        theme.order = order
+        theme_questions.append((theme, theme_data.get('questions', [])))
+        changes.saved.append(theme)
+    # Themes left are not in the request data. Their questions are deleted with them.
+    changes.deleted.extend(themes_in_db.values())
+
+    questions_to_create = []
+    questions_to_update = []
+    questions_to_delete = []
+    saved_questions = []
+    for theme, questions_data in theme_questions:
+        questions_in_db = {}
+        if theme.pk is not None:
+            questions_in_db = {question.id: question for question in theme.questions.all()}
+        for order, question_data in enumerate(questions_data):
+            question = questions_in_db.pop(question_data.get('id'), None)
+            if question is None:
+                question = Question(
+                    theme=theme, questionnaire=questionnaire, control_id=questionnaire.control_id)
+                questions_to_create.append(question)
+            else:
+                questions_to_update.append(question)
+            question.description = question_data['description']
+            question.order = order
+            saved_questions.append(question)
+        questions_to_delete.extend(questions_in_db.values())
+    changes.deleted.extend(questions_to_delete)
+
+    with transaction.atomic():
+        deleted_theme_ids = [theme.id for theme in themes_in_db.values()]
+        if deleted_theme_ids:
+            Theme.objects.filter(id__in=deleted_theme_ids).delete()
+        if questions_to_delete:
+            Question.objects \
+                .filter(id__in=[question.id for question in questions_to_delete]).delete()
+        bulk_create_ordered(Theme, themes_to_create)
+        Theme.objects.bulk_update(themes_to_update, ['title', 'order'])
+        # The new questions get the id of their theme, now that the new themes are saved.
+        bulk_create_ordered(Question, questions_to_create)
+        Question.objects.bulk_update(questions_to_update, ['description', 'order'])
+    changes.saved.extend(saved_questions)
+    return changes
@@ -1,5 +1,5 @@
-import magic
 import os
+from tempfile import TemporaryFile
 
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -12,19 +12,21 @@ from django.views.generic import DetailView, CreateView, TemplateView
 from django.views.generic.detail import SingleObjectMixin
 from django.db.models import Q
 
-from django.http import HttpResponse
-from django.http import FileResponse
-import mimetypes
+from django.http import FileResponse, StreamingHttpResponse
 from actstream import action
 from actstream.models import model_stream
 import json
 
-from .docx import generate_questionnaire_file
-from .export_response_files import generate_response_file_list_in_xlsx
+from uploads.validation import (
+    InvalidExtension, InvalidMimeType, UploadError, check_uploaded_file, get_upload_rejection)
+
+from .docx import update_questionnaire_file
+from .export_response_files import iter_response_file_list_csv, write_response_file_list_in_xlsx
+from .file_response import make_stored_file_response
 from .models import Control, Questionnaire, QuestionFile, QuestionnaireFile, ResponseFile, Question
 from .serializers import ControlDetailUserSerializer, ControlSerializerWithoutDraft
 from .serializers import ControlSerializer, ControlDetailControlSerializer
-
+from .tree_loader import load_control_summaries, load_control_trees
 
 
 class WithListOfControlsMixin(object):
@@ -33,8 +35,7 @@ class WithListOfControlsMixin(object):
         context = super().get_context_data(**kwargs)
         # Questionnaires are grouped by control:
         # we get the list of questionnaire from the list of controls
-        user_access = self.request.user.profile.access.filter(control__is_deleted=False).all()
-        control_list = Control.objects.filter(access__in=user_access).order_by('-id')
+        control_list = self.request.user.profile.access_rights.controls().order_by('-id')
         context['controls'] = control_list
         return context
 
@@ -44,7 +45,7 @@ class ControlDetail(LoginRequiredMixin, WithListOfControlsMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        control_list = context['controls']
+        control_list = load_control_summaries(context['controls'])
         controls_serialized = []
         for control in control_list:
             control_serialized = ControlDetailControlSerializer(instance=control).data
@@ -61,14 +62,14 @@ class Trash(LoginRequiredMixin, WithListOfControlsMixin, DetailView):
     template_name = "ecc/trash.html"
 
     def get_queryset(self):
-        user_controls = Control.objects.filter(access__in=self.request.user.profile.access.all())
+        user_controls = self.request.user.profile.access_rights.control_ids(include_deleted=True)
         queryset = Questionnaire.objects.filter(control__in=user_controls)
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         response_files = ResponseFile.objects \
-            .filter(question__theme__questionnaire=self.get_object()) \
+            .filter(questionnaire=self.get_object()) \
             .filter(is_deleted=True)
 
         response_file_ids = response_files.values_list('id', flat=True)
@@ -78,8 +79,10 @@ class Trash(LoginRequiredMixin, WithListOfControlsMixin, DetailView):
             .filter(target_object_id__in=list(response_file_ids)) \
             .order_by('timestamp')
 
+        # A file restored then trashed again is listed with its last deletion.
+        last_acts = {act.target_object_id: act for act in stream}
         response_file_list = []
-        for act in stream:
+        for act in last_acts.values():
             response_file = response_files.get(id=act.target_object_id)
             response_file.deletion_date = act.timestamp
             response_file.deletion_user = User.objects.get(id=act.actor_object_id)
@@ -102,13 +105,12 @@ class QuestionnaireDetail(LoginRequiredMixin, WithListOfControlsMixin, DetailVie
         return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
-        user_controls = Control.objects.filter(access__in=self.request.user.profile.access.all())
-        controls_questionnaires = Questionnaire.objects.filter(control__in=user_controls)
-        user_questionnaires = []
-        for result in controls_questionnaires:
-            if not (result.is_draft & self.request.user.profile.access.filter(Q(control=result.control) & Q(access_type='repondant')).exists()):
-                user_questionnaires.append(result.id)
-        queryset = Questionnaire.objects.filter(id__in=user_questionnaires)
+        access_rights = self.request.user.profile.access_rights
+        user_controls = access_rights.control_ids(include_deleted=True)
+        repondant_controls = access_rights.control_ids('repondant', include_deleted=True)
+        queryset = Questionnaire.objects \
+            .filter(control__in=user_controls) \
+            .exclude(Q(is_draft=True) & Q(control__in=repondant_controls))
         return queryset
 
     def get_context_data(self, **kwargs):
@@ -116,9 +118,10 @@ class QuestionnaireDetail(LoginRequiredMixin, WithListOfControlsMixin, DetailVie
 
         serializer = ControlSerializerWithoutDraft
         questionnaire = context['object']
-        if self.request.user.profile.access.filter(Q(control=questionnaire.control) & Q(access_type='demandeur')).exists():
+        access_rights = self.request.user.profile.access_rights
+        if access_rights.is_demandeur(questionnaire.control, include_deleted=True):
             serializer = ControlSerializer
-        control_list = context['controls']
+        control_list = load_control_trees(context['controls'])
         controls_serialized = []
         for control in control_list:
             control_serialized = serializer(instance=control).data
@@ -143,9 +146,10 @@ class QuestionnaireEdit(LoginRequiredMixin, WithListOfControlsMixin, DetailView)
 
     def get_queryset(self):
         questionnaire = Questionnaire.objects.filter(id=self.kwargs['pk']).first()
-        if not self.request.user.profile.access.filter(Q(control=questionnaire.control) & Q(access_type='demandeur')).exists():
+        access_rights = self.request.user.profile.access_rights
+        if not access_rights.is_demandeur(questionnaire.control, include_deleted=True):
             return Control.objects.none()
-        user_controls = Control.objects.filter(access__in=self.request.user.profile.access.all())
+        user_controls = self.request.user.profile.access_rights.control_ids(include_deleted=True)
         questionnaires = Questionnaire.objects.filter(
             control__in=user_controls,
             editor=self.request.user
@@ -154,7 +158,7 @@ class QuestionnaireEdit(LoginRequiredMixin, WithListOfControlsMixin, DetailView)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        control_list = context['controls']
+        control_list = load_control_summaries(context['controls'])
         controls_serialized = []
         for control in control_list:
             control_serialized = ControlDetailControlSerializer(instance=control).data
@@ -174,12 +178,11 @@ class QuestionnaireCreate(LoginRequiredMixin, WithListOfControlsMixin, DetailVie
 
     def get_queryset(self):
 
-        user_access = self.request.user.profile.access.filter(access_type='demandeur').all()
-        return Control.objects.filter(access__in=user_access)
+        return self.request.user.profile.access_rights.controls('demandeur', include_deleted=True)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        control_list = context['controls']
+        control_list = load_control_summaries(context['controls'])
         controls_serialized = []
         for control in control_list:
             control_serialized = ControlDetailControlSerializer(instance=control).data
@@ -203,37 +206,43 @@ class UploadResponseFile(LoginRequiredMixin, CreateView):
         }
         action.send(**action_details)
 
-    def add_invalid_extension_log(self, invalid_extension):
+    def add_invalid_extension_log(self, invalid_extension, question):
         action_details = {
             'sender': self.request.user,
             'verb': 'uploaded invalid response-file extension',
-            'target': self.object.question,
+            'target': question,
             'description': f'Detected invalid file extension: "{invalid_extension}"'
             }
         action.send(**action_details)
 
-    def add_invalid_mime_type_log(self, invalid_mime_type):
+    def add_invalid_mime_type_log(self, invalid_mime_type, question):
         action_details = {
             'sender': self.request.user,
             'verb': 'uploaded invalid response-file',
-            'target': self.object.question,
+            'target': question,
             'description': f'Detected invalid response-file mime type: "{invalid_mime_type}"'
             }
         action.send(**action_details)
 
-    def file_extension_is_valid(self, extension):
-        
-        split_extensions = extension.split(".")
-        if len(split_extensions) > 2: 
-            return False
-        normalized_extension = f".{split_extensions[-1].lower()}"
-        return normalized_extension not in settings.UPLOAD_FILE_EXTENSION_BLACKLIST
-
-    def file_mime_type_is_valid(self, mime_type):
-        blacklist = settings.UPLOAD_FILE_MIME_TYPE_BLACKLIST
-        if any(match.lower() in mime_type.lower() for match in blacklist):
-            return False
-        return True
+    def reject_upload(self, error, question):
+        if isinstance(error, InvalidExtension):
+            self.add_invalid_extension_log(error.extension, question)
+        elif isinstance(error, InvalidMimeType):
+            self.add_invalid_mime_type_log(error.mime_type, question)
+        return HttpResponseForbidden(error.message)
+
+    def post(self, request, *args, **kwargs):
+        # A file rejected by the upload handler while it was received is missing from
+        # the form : the rejection is returned instead of the form errors.
+        rejection = get_upload_rejection(request)
+        if rejection is not None:
+            question_id = request.POST.get('question_id', '')
+            question = Question.objects.filter(
+                pk=question_id,
+                questionnaire__in=request.user.profile.questionnaires
+            ).first() if question_id.isdigit() else None
+            return self.reject_upload(rejection, question)
+        return super().post(request, *args, **kwargs)
 
     def form_valid(self, form):
         
@@ -242,28 +251,20 @@ class UploadResponseFile(LoginRequiredMixin, CreateView):
             "Le téléchargement de plusieurs fichiers via un seul champ est interdit."
         )
             
-        if (
-            "x-infection-found" in [header.lower() for header in self.request.headers]
-            or "x-virus-name" in [header.lower() for header in self.request.headers]
-        ):
-            return HttpResponseForbidden(
-                "Ce fichier a été notifié comme contenant un virus, merci de vérifier"
-                " celui-ci avant de le déposer à nouveau."
-            )
         try:
             question_id = form.data['question_id']
         except KeyError:
             return HttpResponseBadRequest("Question ID was missing on file upload")
         question = Question.objects.get(pk=question_id)
-        control = question.theme.questionnaire.control
+        control = question.control
         if control.is_deleted:
             return HttpResponseForbidden("Control is deleted.")
-        if not self.request.user.profile.access.filter(Q(control=control) & Q(access_type='repondant')).exists():
+        if not self.request.user.profile.access_rights.is_repondant(control):
             return HttpResponseForbidden("User is not authorized to access this ressource")
         get_object_or_404(
             Question,
             pk=question_id,
-            theme__questionnaire__in=self.request.user.profile.questionnaires
+            questionnaire__in=self.request.user.profile.questionnaires
         )
         self.object = form.save(commit=False)
         self.object.question_id = question_id
@@ -271,30 +272,16 @@ class UploadResponseFile(LoginRequiredMixin, CreateView):
         file_object = self.object.file
         file_extension = os.path.splitext(file_object.name)[1]
 
-        if not self.file_extension_is_valid(file_extension):
-            self.add_invalid_extension_log(file_extension)
-            return HttpResponseForbidden(
-                f"Cette extension de fichier n'est pas autorisée : {file_extension}"
-            )
-
-        mime_type = magic.from_buffer(file_object.read(2048), mime=True)
-        if not self.file_mime_type_is_valid(mime_type):
-            self.add_invalid_mime_type_log(mime_type)
-            return HttpResponseForbidden(
-                f"Ce type de fichier n'est pas autorisé: {mime_type}"
-            )
+        try:
+            check_uploaded_file(self.request, file_object.file)
+        except UploadError as e:
+            return self.reject_upload(e, question)
 
         if len(file_object.name) > settings.MAX_FILENAME_LENGTH:
             extension_length = len(file_extension)
             max_length = settings.MAX_FILENAME_LENGTH - extension_length
             self.object.file.name = f"{file_object.name[:max_length]}{file_extension}"
 
-        MAX_SIZE_BYTES = 1048576 * settings.UPLOAD_FILE_MAX_SIZE_MB
-        if file_object.file.size > MAX_SIZE_BYTES:
-            return HttpResponseForbidden(
-                f"La taille du fichier dépasse la limite autorisée "
-                f"de {settings.UPLOAD_FILE_MAX_SIZE_MB}Mo."
-            )
         self.object.save()
         self.add_upload_action_log()
         data = {'status': 'success'}
@@ -325,25 +312,19 @@ class SendFileMixin(SingleObjectMixin):
     """
     model = None
     file_type = None
+    # Let the browser keep the file and revalidate it with ETag / Last-Modified.
+    allow_private_cache = True
 
     # used in a View, this function overrides the View's GET request handler.
     def get(self, request, *args, **kwargs):
         # get the object fetched by SingleObjectMixin
         obj = self.get_object()
         self.add_access_log_entry(accessed_object=obj)
-        
-        content_type, encoding = mimetypes.guess_type(obj.file.path)
-        content_type = content_type or 'application/octet-stream'
+        return self.make_file_response(obj)
 
-        with open(obj.file.path, 'rb') as f:
-            file_data = f.read()
-
-        response = HttpResponse(file_data, content_type=content_type)
-        
-        filename = os.path.basename(obj.file.path)
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-        return response
+    def make_file_response(self, obj):
+        filename = os.path.basename(obj.file.name)
+        return make_stored_file_response(self.request, obj.file, filename)
 
     def add_access_log_entry(self, accessed_object):
         verb = f'accessed {self.file_type}'
@@ -363,20 +344,20 @@ class SendQuestionnaireFile(SendFileMixin, LoginRequiredMixin, View):
 
     def get(self, request, *args, **kwargs):
         """
-        Before sending the questionnaire file, we generate it.
-        This means that the file is geneated every time this view is called - tipically
-        when the user downloads the file.
+        Before sending the questionnaire file, we generate it if it changed since it was
+        last generated.
         """
         questionnaire = self.get_object()
         if questionnaire.is_draft:
-            if not questionnaire.control in request.user.profile.user_controls("demandeur"):
+            access_rights = request.user.profile.access_rights
+            if not access_rights.is_demandeur(questionnaire.control, include_deleted=True):
                 raise Http404
-        generate_questionnaire_file(questionnaire)
+        update_questionnaire_file(questionnaire)
         return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
         return Questionnaire.objects.filter(
-            control__in=Control.objects.filter(access__in=self.request.user.profile.access.all()))
+            control__in=self.request.user.profile.access_rights.control_ids(include_deleted=True))
 
 
 class SendQuestionFile(SendFileMixin, LoginRequiredMixin, View):
@@ -387,9 +368,9 @@ class SendQuestionFile(SendFileMixin, LoginRequiredMixin, View):
         # The user should only have access to files that belong to the control
         # he was associated with. That's why we filter-out based on the user's
         # control.
-        user_controls = Control.objects.filter(access__in=self.request.user.profile.access.all())
+        user_controls = self.request.user.profile.access_rights.control_ids(include_deleted=True)
         return self.model.objects.filter(
-            question__theme__questionnaire__control__in=user_controls)
+            control__in=user_controls)
 
 class SendQuestionnairePjFile(SendFileMixin, LoginRequiredMixin, View):
     model = QuestionnaireFile
@@ -399,7 +380,7 @@ class SendQuestionnairePjFile(SendFileMixin, LoginRequiredMixin, View):
         # The user should only have access to files that belong to the control
         # he was associated with. That's why we filter-out based on the user's
         # control.
-        user_controls = Control.objects.filter(access__in=self.request.user.profile.access.all())
+        user_controls = self.request.user.profile.access_rights.control_ids(include_deleted=True)
         return self.model.objects.filter(
             questionnaire__control__in=user_controls)
 
@@ -414,25 +395,27 @@ class SendResponseFileList(SingleObjectMixin, LoginRequiredMixin, View):
     model = Questionnaire
 
     def get_queryset(self):
-        user_controls = Control.objects.filter(access__in=self.request.user.profile.access.all())
+        user_controls = self.request.user.profile.access_rights.control_ids(include_deleted=True)
         queryset = Questionnaire.objects.filter(control__in=user_controls)
         queryset = queryset.filter(is_draft=False)
-        return queryset
+        return queryset.select_related('control')
 
     def get(self, request, *args, **kwargs):
         questionnaire = self.get_object()
+        # The anonymous temporary file is removed when the response closes it.
+        file = TemporaryFile()
         try:
-            file = generate_response_file_list_in_xlsx(questionnaire)
-            self.add_log_entry(verb='exported responses in xls', questionnaire=questionnaire)
-            response = FileResponse(open(file.name, 'rb'), as_attachment=True,
-                                    filename=f'réponses_questionnaire_{questionnaire.numbering}.xlsx')
-            return response
+            write_response_file_list_in_xlsx(questionnaire, file)
         except Exception as e:
+            file.close()
             self.add_log_entry(
                 verb='exported responses in xls - fail', questionnaire=questionnaire, description=str(e)
             )
-        finally:
-            os.remove(file.name)
+            raise
+        self.add_log_entry(verb='exported responses in xls', questionnaire=questionnaire)
+        file.seek(0)
+        return FileResponse(file, as_attachment=True,
+                            filename=f'réponses_questionnaire_{questionnaire.numbering}.xlsx')
 
     def add_log_entry(self, verb, questionnaire, description=""):
         action_details = {
@@ -444,3 +427,18 @@ class SendResponseFileList(SingleObjectMixin, LoginRequiredMixin, View):
         }
 
         action.send(**action_details)
+
+
+class SendResponseFileListCsv(SendResponseFileList):
+    """
+    The list of the response files in CSV, streamed while it is read from the database.
+    """
+
+    def get(self, request, *args, **kwargs):
+        questionnaire = self.get_object()
+        self.add_log_entry(verb='exported responses in csv', questionnaire=questionnaire)
+        response = StreamingHttpResponse(
+            iter_response_file_list_csv(questionnaire), content_type='text/csv; charset=utf-8')
+        filename = f'réponses_questionnaire_{questionnaire.numbering}.csv'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
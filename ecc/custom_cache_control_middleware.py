@@ -1,8 +1,35 @@
+NO_STORE_CACHE_CONTROL = 'no-cache, no-store, must-revalidate, max-age=0'
+PRIVATE_CACHE_CONTROL = 'private, no-cache, must-revalidate, max-age=0'
+
+
+def allows_private_cache(view_func):
+    """
+    Views opt out of "no-store" with an `allow_private_cache = True` attribute,
+    set on the view class or on the view function.
+    """
+    view_class = getattr(view_func, 'view_class', None)
+    if view_class is not None and getattr(view_class, 'allow_private_cache', False):
+        return True
+    return getattr(view_func, 'allow_private_cache', False)
+
+
 class CustomCacheControlMiddleware:
+    """
+    Nothing is stored by the browser, except for the views allowing private cache:
+    their responses may be kept by the browser (never by a shared cache), but they must
+    be revalidated on each use (ETag, Last-Modified).
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
         response = self.get_response(request)
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
+        if getattr(request, 'allow_private_cache', False):
+            response['Cache-Control'] = PRIVATE_CACHE_CONTROL
+        else:
+            response['Cache-Control'] = NO_STORE_CACHE_CONTROL
         return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.allow_private_cache = allows_private_cache(view_func)
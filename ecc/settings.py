@@ -64,6 +64,7 @@ INSTALLED_APPS = [
     'control',
     'demo',
     'editor',
+    'exports',
     'faq',
     'reporting',
     'user_profiles',
@@ -71,6 +72,7 @@ INSTALLED_APPS = [
     'session',
     'soft_deletion',
     'tos',
+    'uploads',
     'logs',
     'parametres',
     'alerte',
@@ -108,6 +110,7 @@ LOGOUT_REDIRECT_URL = "/"
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'logs.middleware.ActionBufferMiddleware',
     'django_permissions_policy.PermissionsPolicyMiddleware',
     'csp.middleware.CSPMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -226,7 +229,20 @@ EMAIL_USE_TLS = env('EMAIL_USE_TLS')
 EMAIL_USE_SSL = env('EMAIL_USE_SSL')
 
 # Time we wait in between emails, to space them out and avoid going over our allowed email quota
-EMAIL_SPACING_TIME_MILLIS = env('EMAIL_SPACING_TIME_MILLIS', default=10000)
+EMAIL_SPACING_TIME_MILLIS = env.int('EMAIL_SPACING_TIME_MILLIS', default=10000)
+# The report emails are spaced by a rate limiter shared by the Celery workers, which lets
+# EMAIL_RATE_LIMIT_BURST emails through at once at most.
+EMAIL_RATE_LIMITER = env('EMAIL_RATE_LIMITER', default='reporting.rate_limit.RedisTokenBucket')
+EMAIL_RATE_LIMIT_BURST = env.int('EMAIL_RATE_LIMIT_BURST', default=1)
+EMAIL_RATE_LIMIT_REDIS_URL = env(
+    'EMAIL_RATE_LIMIT_REDIS_URL', default=env('CELERY_BROKER_URL', default=None))
+# A report which could not be sent is sent again after FILES_REPORT_RETRY_DELAY_SECONDS,
+# then twice that delay..., FILES_REPORT_MAX_RETRIES times at most.
+FILES_REPORT_MAX_RETRIES = env.int('FILES_REPORT_MAX_RETRIES', default=5)
+FILES_REPORT_RETRY_DELAY_SECONDS = env.int('FILES_REPORT_RETRY_DELAY_SECONDS', default=60)
+# The digests of the users who opted in are sent by batches of FILES_REPORT_DIGEST_BATCH_SIZE
+# users, each batch over one SMTP connection.
+FILES_REPORT_DIGEST_BATCH_SIZE = env.int('FILES_REPORT_DIGEST_BATCH_SIZE', default=100)
 
 # The user will get a warning when trying to add an inspector whose email doesn't end with EXPECTED_INSPECTOR_EMAIL_ENDINGS
 EXPECTED_INSPECTOR_EMAIL_ENDINGS=env('EXPECTED_INSPECTOR_EMAIL_ENDINGS', default='')
@@ -269,8 +285,35 @@ UPLOAD_FILE_EXTENSION_BLACKLIST = env('UPLOAD_FILE_EXTENSION_BLACKLIST', default
 
 UPLOAD_FILE_MAX_SIZE_MB = env('UPLOAD_FILE_MAX_SIZE_MB', default=256)
 
+# Uploaded files are checked while they are received, before the default handlers
+# write them to memory or to a temporary file.
+FILE_UPLOAD_HANDLERS = [
+    'uploads.handlers.ValidatingUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Resumable uploads which did not receive any chunk for this number of hours are deleted.
+UPLOAD_SESSION_EXPIRY_HOURS = env.int('UPLOAD_SESSION_EXPIRY_HOURS', default=24)
+
 MAX_FILENAME_LENGTH = env('MAX_FILENAME_LENGTH', default=150)
 
+# ZIP archives of response files larger than this are built in the background by Celery
+# instead of being streamed directly.
+EXPORT_ZIP_STREAMING_MAX_SIZE_MB = env.int('EXPORT_ZIP_STREAMING_MAX_SIZE_MB', default=2048)
+
+# Files built by background exports are deleted after this number of days.
+EXPORT_RETENTION_DAYS = env.int('EXPORT_RETENTION_DAYS', default=7)
+
+# Copies of questionnaires attaching more files than this are made in the background by
+# Celery instead of during the request.
+CLONE_SYNC_MAX_FILES = env.int('CLONE_SYNC_MAX_FILES', default=50)
+
+# Actions logged with these verbs are saved by Celery, after the request.
+ACTION_LOG_DEFERRED_VERBS = env.list(
+    'ACTION_LOG_DEFERRED_VERBS',
+    default=['accessed questionnaire', 'accessed response-file'])
+
 STATIC_URL = '/static/'
 
 # Collect static won't work if you haven't configured this
@@ -293,7 +336,29 @@ MEDIA_URL = '/media/'
 DEFAULT_MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_ROOT = env('MEDIA_ROOT', default=DEFAULT_MEDIA_ROOT)
 
-SENDFILE_BACKEND = env('SENDFILE_BACKEND', default='sendfile.backends.simple')
+# With DEFAULT_FILE_STORAGE = 'uploads.storage.DeduplicatedStorage', each content is stored
+# once in MEDIA_ROOT/BLOBS, and linked under the names of its files.
+DEFAULT_FILE_STORAGE = env(
+    'DEFAULT_FILE_STORAGE', default='django.core.files.storage.FileSystemStorage')
+
+# With DEFAULT_FILE_STORAGE = 'uploads.object_storage.ObjectStorage', the media are stored
+# in an S3-compatible bucket, and downloaded through signed URLs valid AWS_QUERYSTRING_EXPIRE
+# seconds. Copy the existing media with the copy_media_to_storage command.
+AWS_STORAGE_BUCKET_NAME = env('AWS_STORAGE_BUCKET_NAME', default=None)
+AWS_S3_ENDPOINT_URL = env('AWS_S3_ENDPOINT_URL', default=None)
+AWS_S3_REGION_NAME = env('AWS_S3_REGION_NAME', default=None)
+AWS_ACCESS_KEY_ID = env('AWS_ACCESS_KEY_ID', default=None)
+AWS_SECRET_ACCESS_KEY = env('AWS_SECRET_ACCESS_KEY', default=None)
+AWS_QUERYSTRING_EXPIRE = env.int('AWS_QUERYSTRING_EXPIRE', default=300)
+AWS_S3_SIGNATURE_VERSION = env('AWS_S3_SIGNATURE_VERSION', default='s3v4')
+AWS_S3_MULTIPART_CHUNK_SIZE_MB = env.int('AWS_S3_MULTIPART_CHUNK_SIZE_MB', default=16)
+
+# File downloads are handed off to the front web server, see control.views.SendFileMixin.
+# In production, use 'django_sendfile.backends.nginx' (X-Accel-Redirect) with an internal
+# location serving SENDFILE_ROOT at SENDFILE_URL, or 'django_sendfile.backends.xsendfile'.
+SENDFILE_BACKEND = env('SENDFILE_BACKEND', default='django_sendfile.backends.simple')
+SENDFILE_ROOT = os.path.abspath(MEDIA_ROOT)
+SENDFILE_URL = env('SENDFILE_URL', default='/protected')
 
 PIWIK_TRACKER_BASE_URL = env('PIWIK_TRACKER_BASE_URL', default=None)
 PIWIK_SITE_ID = env('PIWIK_SITE_ID', default=None)
@@ -328,6 +393,12 @@ if DEBUG:
 
 CELERY_BROKER_URL = env('CELERY_BROKER_URL')
 CELERY_QUEUE = env('CELERY_QUEUE', default='default')
+# Queue of the Celery tasks generating the questionnaire documents, for them to have
+# dedicated workers.
+QUESTIONNAIRE_DOCX_QUEUE = env('QUESTIONNAIRE_DOCX_QUEUE', default=CELERY_QUEUE)
+# Number of processes generating the questionnaire documents downloaded before they were
+# generated by Celery. With 0, the documents are generated by the web worker itself.
+QUESTIONNAIRE_DOCX_PROCESSES = env.int('QUESTIONNAIRE_DOCX_PROCESSES', default=0)
 HTTP_AUTHORIZATION = env('HTTP_AUTHORIZATION', default=None)
 
 CKEDITOR_CONFIGS = {
@@ -365,6 +436,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 # Jours de relance par défaut avant échéance d'un questionnaire
 JOURS_ECHEANCE = env('JOURS_ECHEANCE', default=7)
+# Relances supplémentaires, en jours avant l'échéance, désactivées par défaut. Un nombre
+# négatif relance les questionnaires en retard, ex. JOURS_ECHEANCE_RELANCES=1,-1 pour la
+# veille et le lendemain de l'échéance.
+JOURS_ECHEANCE_RELANCES = env.list('JOURS_ECHEANCE_RELANCES', cast=int, default=[])
 
 # Indique si la page par défaut est celle de présentation
 PRESENTATION_ACTIVE = env('PRESENTATION_ACTIVE', default=True)
@@ -16,10 +16,13 @@ from control import views as control_views
 from demo import views as demo_views
 from ecc import views as ecc_views
 from editor import api_views as editor_api_views
+from exports import api_views as exports_api_views
+from exports import views as exports_views
 from faq import views as faq_views
 from session import api_views as session_api_views
 from soft_deletion import api_views as deletion_api_views
 from tos import views as tos_views
+from uploads import api_views as uploads_api_views
 from user_profiles import api_views as user_profiles_api_views
 from declaration_conformite import views as declarationConformite_views
 
@@ -37,6 +40,8 @@ router.register(r'theme', control_api_views.ThemeViewSet, basename='theme')
 router.register(r'user', user_profiles_api_views.UserProfileViewSet, basename='user')
 router.register(r'session', session_api_views.SessionTimeoutViewSet, basename='session')
 router.register(r'deletion', deletion_api_views.DeleteViewSet, basename='deletion')
+router.register(r'export', exports_api_views.ExportJobViewSet, basename='export')
+router.register(r'upload', uploads_api_views.UploadSessionViewSet, basename='upload')
 
 
 urlpatterns = [
@@ -64,6 +69,21 @@ urlpatterns = [
     path('fichier-pj-questionnaire/<int:pk>/', control_views.SendQuestionnairePjFile.as_view(), name='send-questionnaire-pj-file'),
     path('fichier-reponse/<int:pk>/', control_views.SendResponseFile.as_view(), name='send-response-file'),
     path('fichier-reponses-deposees/<int:pk>/', control_views.SendResponseFileList.as_view(), name='send-response-file-list'),
+    path('fichier-reponses-deposees/<int:pk>/csv/',
+         control_views.SendResponseFileListCsv.as_view(),
+         name='send-response-file-list-csv'),
+    path('archive-reponses/<int:pk>/',
+         exports_views.SendResponseFilesZip.as_view(),
+         name='send-response-files-zip'),
+    path('archive-reponses/controle-<int:pk>/',
+         exports_views.SendControlResponseFilesZip.as_view(),
+         name='send-control-response-files-zip'),
+    path('dossier-procedure/<int:pk>/',
+         exports_views.SendControlDossier.as_view(),
+         name='send-control-dossier'),
+    path('fichier-export/<int:pk>/',
+         exports_views.SendExportFile.as_view(),
+         name='send-export-file'),
 
     path('upload/', control_views.UploadResponseFile.as_view(), name='response-upload'),
     path('faq/', faq_views.FAQ.as_view(), name='faq'),
@@ -83,6 +103,9 @@ urlpatterns = [
     path('api/fichier-reponse/corbeille/<int:pk>/',
          control_api_views.ResponseFileTrash.as_view(),
          name='response-file-trash'),
+    path('api/fichier-reponse/corbeille/',
+         control_api_views.ResponseFileBulkTrash.as_view(),
+         name='response-file-bulk-trash'),
     path('api/questionnaire/<int:pk>/changer-redacteur/',
          editor_api_views.UpdateEditor.as_view(),
          name='update-editor'),
@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from .models import ExportJob
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'kind', 'user', 'control', 'questionnaire', 'status', 'processed_items',
+        'total_items', 'created')
+    list_filter = ('kind', 'status', 'file_format')
+    raw_id_fields = ('user', 'control', 'controls', 'questionnaire')
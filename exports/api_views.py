@@ -0,0 +1,40 @@
+from rest_framework import mixins, viewsets
+from rest_framework.exceptions import ValidationError
+
+from .models import ExportJob
+from .serializers import ExportJobSerializer
+from .views import start_export_job
+
+
+class ExportJobViewSet(mixins.CreateModelMixin,
+                       mixins.ListModelMixin,
+                       mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """
+    Exports prepared in the background : the export is created, then polled until its
+    status is "done" and its url can be downloaded.
+    Besides the ZIP archives of the response files, the list of the response files of
+    several controls can be exported (kind "response-file-list", with `controls`), e.g.
+    for the controls of a megaprocédure.
+    """
+    serializer_class = ExportJobSerializer
+
+    def get_queryset(self):
+        return ExportJob.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        kind = serializer.validated_data['kind']
+        control = serializer.validated_data['control']
+        controls = serializer.validated_data.get('controls', [])
+        questionnaire = serializer.validated_data.get('questionnaire')
+        access_rights = self.request.user.profile.access_rights
+        if kind not in (ExportJob.RESPONSE_FILES_ZIP, ExportJob.RESPONSE_FILE_LIST):
+            raise ValidationError("Ce type d'export ne peut pas être demandé.")
+        if not all(access_rights.has_access(c) for c in [control] + controls):
+            raise ValidationError("Vous n'avez pas accès à cette procédure.")
+        if questionnaire is not None:
+            if questionnaire.control_id != control.id or questionnaire.is_draft:
+                raise ValidationError("Ce questionnaire ne peut pas être exporté.")
+        serializer.instance = start_export_job(
+            self.request.user, control, questionnaire, kind=kind, controls=controls,
+            file_format=serializer.validated_data.get('file_format', ExportJob.XLSX))
@@ -0,0 +1,6 @@
+from django.apps import AppConfig
+
+
+class ExportsConfig(AppConfig):
+    name = 'exports'
+    verbose_name = "Exports"
@@ -0,0 +1,119 @@
+"""
+The dossier of a control : the documents of its published questionnaires composed into
+a single Word document, after a table of contents, and followed by the list of the annexes.
+"""
+import hashlib
+import json
+import os
+
+from docx import Document
+from docx.enum.text import WD_BREAK
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docxcompose.composer import Composer
+
+from control.docx import get_questionnaire_fingerprint
+from control.models import QuestionFile
+
+
+def is_docx(field_file):
+    return bool(field_file) and field_file.name.lower().endswith('.docx')
+
+
+def get_dossier_fingerprint(control, questionnaires):
+    """
+    Hash of the documents the dossier is made of. It changes with any of them.
+    """
+    content = [
+        [control.reference_code, control.title, control.depositing_organization],
+        [
+            [questionnaire.id, questionnaire.uploaded_file.name or '',
+             get_questionnaire_fingerprint(questionnaire)]
+            for questionnaire in questionnaires
+        ],
+    ]
+    serialized = json.dumps(content, default=str, sort_keys=True)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def add_table_of_contents(document):
+    """
+    Add a table of contents field of the level 1 headings. Word fills it when the
+    document is opened.
+    """
+    run = document.add_paragraph().add_run()
+    begin = OxmlElement('w:fldChar')
+    begin.set(qn('w:fldCharType'), 'begin')
+    instruction = OxmlElement('w:instrText')
+    instruction.set(qn('xml:space'), 'preserve')
+    instruction.text = 'TOC \\o "1-1" \\h \\z \\u'
+    separate = OxmlElement('w:fldChar')
+    separate.set(qn('w:fldCharType'), 'separate')
+    placeholder = OxmlElement('w:t')
+    placeholder.text = 'Mettez à jour la table des matières pour la faire apparaître.'
+    end = OxmlElement('w:fldChar')
+    end.set(qn('w:fldCharType'), 'end')
+    for element in (begin, instruction, separate, placeholder, end):
+        run._r.append(element)
+    update_fields = OxmlElement('w:updateFields')
+    update_fields.set(qn('w:val'), 'true')
+    document.settings.element.append(update_fields)
+
+
+def add_page_break(document):
+    document.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+
+
+def add_annex_list(document, questionnaires):
+    document.add_heading('Annexes', level=1)
+    question_files = QuestionFile.objects \
+        .filter(questionnaire__in=questionnaires) \
+        .select_related('question__theme') \
+        .order_by('questionnaire__order', 'question__theme__order', 'question__order', 'order')
+    files_by_questionnaire = {}
+    for question_file in question_files:
+        files_by_questionnaire.setdefault(question_file.questionnaire_id, []).append(question_file)
+    for questionnaire in questionnaires:
+        question_files = files_by_questionnaire.get(questionnaire.id)
+        if not question_files:
+            continue
+        document.add_heading(questionnaire.title_display, level=2)
+        for question_file in question_files:
+            question = question_file.question
+            document.add_paragraph(
+                f'Question {question.theme.numbering}.{question.numbering} : '
+                f'{question_file.basename}',
+                style='List Bullet')
+    if not files_by_questionnaire:
+        document.add_paragraph("Aucune annexe n'est jointe aux questionnaires.")
+
+
+def write_control_dossier(control, questionnaires, path):
+    """
+    Write the dossier of the control to the path. The questionnaires are given in their
+    order, with their document already generated.
+    """
+    composer = Composer(Document())
+    document = composer.doc
+    document.core_properties.title = f'Dossier de procédure {control.reference_code}'
+    document.add_heading(f'Dossier de procédure {control.reference_code}', level=0)
+    document.add_paragraph(control.title)
+    if control.depositing_organization:
+        document.add_paragraph(control.depositing_organization)
+    add_table_of_contents(document)
+    for questionnaire in questionnaires:
+        add_page_break(document)
+        document.add_heading(questionnaire.title_display, level=1)
+        questionnaire_file = questionnaire.file
+        if is_docx(questionnaire_file):
+            # Read from its storage : the document may not be on the local disk.
+            with questionnaire_file.open('rb') as document_file:
+                composer.append(Document(document_file))
+        else:
+            extension = os.path.splitext(questionnaire_file.name)[1] or 'inconnu'
+            document.add_paragraph(
+                f'Le document de ce questionnaire est au format {extension} : '
+                f'il est à télécharger séparément ({questionnaire.basename}).')
+    add_page_break(document)
+    add_annex_list(document, questionnaires)
+    composer.save(path)
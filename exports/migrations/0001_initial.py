@@ -0,0 +1,43 @@
+# Generated by Django 3.2.17 on 2026-10-18 14:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import exports.models
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('control', '0055_control_is_pinned'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('kind', models.CharField(choices=[('response-files-zip', 'Archive ZIP des fichiers déposés')], max_length=255, verbose_name='type')),
+                ('status', models.CharField(choices=[('queued', 'En attente'), ('running', 'En cours'), ('done', 'Terminé'), ('failed', 'Échec')], default='queued', max_length=255, verbose_name='statut')),
+                ('total_items', models.PositiveIntegerField(default=0, verbose_name='éléments à traiter')),
+                ('processed_items', models.PositiveIntegerField(default=0, verbose_name='éléments traités')),
+                ('file', models.FileField(blank=True, max_length=2000, null=True, upload_to=exports.models.export_file_path, verbose_name='fichier')),
+                ('error', models.TextField(blank=True, verbose_name='erreur')),
+                ('control', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='control.control', verbose_name='procédure')),
+                ('questionnaire', models.ForeignKey(blank=True, help_text="Si vide, l'export porte sur toute la procédure", null=True, on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='control.questionnaire', verbose_name='questionnaire')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='utilisateur')),
+            ],
+            options={
+                'verbose_name': 'Export',
+                'verbose_name_plural': 'Exports',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.17 on 2026-10-18 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Empreinte du contenu exporté, pour réutiliser un export à jour.', max_length=64, verbose_name='empreinte'),
+        ),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='kind',
+            field=models.CharField(choices=[('response-files-zip', 'Archive ZIP des fichiers déposés'), ('control-dossier', 'Dossier de procédure')], max_length=255, verbose_name='type'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.17 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0057_questionnaire_generated_file_fingerprint'),
+        ('exports', '0002_dossier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='controls',
+            field=models.ManyToManyField(blank=True, help_text='Pour une liste des fichiers déposés : les procédures en plus de `control`', related_name='_exports_exportjob_controls_+', to='control.Control', verbose_name='procédures'),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='file_format',
+            field=models.CharField(choices=[('xlsx', 'XLSX'), ('csv', 'CSV')], default='xlsx', max_length=255, verbose_name='format'),
+        ),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='kind',
+            field=models.CharField(choices=[('response-files-zip', 'Archive ZIP des fichiers déposés'), ('control-dossier', 'Dossier de procédure'), ('response-file-list', 'Liste des fichiers déposés de plusieurs procédures')], max_length=255, verbose_name='type'),
+        ),
+    ]
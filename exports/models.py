@@ -0,0 +1,122 @@
+import os
+
+from django.conf import settings
+from django.db import models
+from django.urls import reverse
+
+from model_utils.models import TimeStampedModel
+
+
+def export_file_path(instance, filename):
+    return os.path.join('EXPORTS', str(instance.id), filename)
+
+
+class ExportJob(TimeStampedModel):
+    """
+    An export built in the background by a Celery task, then downloaded by its user.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS = (
+        (QUEUED, 'En attente'),
+        (RUNNING, 'En cours'),
+        (DONE, 'Terminé'),
+        (FAILED, 'Échec'),
+    )
+    RESPONSE_FILES_ZIP = 'response-files-zip'
+    CONTROL_DOSSIER = 'control-dossier'
+    RESPONSE_FILE_LIST = 'response-file-list'
+    KIND = (
+        (RESPONSE_FILES_ZIP, 'Archive ZIP des fichiers déposés'),
+        (CONTROL_DOSSIER, 'Dossier de procédure'),
+        (RESPONSE_FILE_LIST, 'Liste des fichiers déposés de plusieurs procédures'),
+    )
+    XLSX = 'xlsx'
+    CSV = 'csv'
+    FILE_FORMAT = (
+        (XLSX, 'XLSX'),
+        (CSV, 'CSV'),
+    )
+
+    kind = models.CharField("type", max_length=255, choices=KIND)
+    user = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL, verbose_name='utilisateur', related_name='export_jobs',
+        on_delete=models.CASCADE)
+    control = models.ForeignKey(
+        to='control.Control', verbose_name='procédure', related_name='export_jobs',
+        on_delete=models.CASCADE)
+    questionnaire = models.ForeignKey(
+        to='control.Questionnaire', verbose_name='questionnaire', related_name='export_jobs',
+        null=True, blank=True, on_delete=models.CASCADE,
+        help_text="Si vide, l'export porte sur toute la procédure")
+    controls = models.ManyToManyField(
+        to='control.Control', verbose_name='procédures', related_name='+', blank=True,
+        help_text="Pour une liste des fichiers déposés : les procédures en plus de `control`")
+    file_format = models.CharField("format", max_length=255, choices=FILE_FORMAT, default=XLSX)
+    status = models.CharField("statut", max_length=255, choices=STATUS, default=QUEUED)
+    total_items = models.PositiveIntegerField("éléments à traiter", default=0)
+    processed_items = models.PositiveIntegerField("éléments traités", default=0)
+    file = models.FileField(
+        verbose_name="fichier", upload_to=export_file_path, max_length=2000,
+        null=True, blank=True)
+    error = models.TextField("erreur", blank=True)
+    fingerprint = models.CharField(
+        verbose_name="empreinte", max_length=64, blank=True, default="", editable=False,
+        help_text="Empreinte du contenu exporté, pour réutiliser un export à jour.")
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = "Export"
+        verbose_name_plural = "Exports"
+
+    @property
+    def progress(self):
+        """
+        Percentage of the items already processed.
+        """
+        if self.status == self.DONE:
+            return 100
+        if not self.total_items:
+            return 0
+        return min(100, int(100 * self.processed_items / self.total_items))
+
+    @property
+    def url(self):
+        if self.status != self.DONE:
+            return None
+        if self.kind == self.CONTROL_DOSSIER:
+            # Served to every inspector of the control, until the control changes.
+            return reverse('send-control-dossier', args=[self.control_id])
+        return reverse('send-export-file', args=[self.id])
+
+    def get_controls(self):
+        """
+        Controls covered by the export, ordered by id : `control`, and `controls` if any.
+        """
+        Control = self._meta.get_field('control').related_model
+        control_ids = {self.control_id, *self.controls.values_list('id', flat=True)}
+        return Control.objects.filter(id__in=control_ids).order_by('id')
+
+    @property
+    def questionnaires(self):
+        """
+        Questionnaires covered by the export. Drafts are never exported.
+        """
+        if self.questionnaire_id:
+            return self.control.questionnaires.filter(id=self.questionnaire_id, is_draft=False)
+        return self.control.questionnaires.filter(is_draft=False)
+
+    @property
+    def filename(self):
+        if self.kind == self.CONTROL_DOSSIER:
+            return f'{self.control.reference_code}-dossier.docx'
+        if self.kind == self.RESPONSE_FILE_LIST:
+            return f'{self.control.reference_code}-réponses.{self.file_format}'
+        if self.questionnaire_id:
+            return f'{self.control.reference_code}-Q{self.questionnaire.numbering:02}.zip'
+        return f'{self.control.reference_code}.zip'
+
+    def __str__(self):
+        return f'[ID{self.id}] [C{self.control_id}] {self.get_kind_display()} - {self.status}'
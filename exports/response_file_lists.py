@@ -0,0 +1,63 @@
+"""
+Lists of the response files of several controls in one file, e.g. for the controls of a
+megaprocédure : a sheet per control in XLSX, or a single table in CSV. The rows are
+written to disk as they are read from the database.
+"""
+import csv
+import re
+
+import xlsxwriter
+
+from control.export_response_files import CONTROL_COLUMNS
+
+# Excel limits the sheet names to 31 characters, without some special characters.
+SHEET_NAME_MAX_LENGTH = 31
+SHEET_NAME_FORBIDDEN_CHARACTERS = re.compile(r'[\[\]:*?/\\]')
+
+
+def get_sheet_name(control, used_names):
+    name = SHEET_NAME_FORBIDDEN_CHARACTERS.sub('-', control.reference_code or f'{control.id}')
+    name = name[:SHEET_NAME_MAX_LENGTH]
+    suffix = 1
+    while name.lower() in used_names:
+        suffix += 1
+        name = f'{name[:SHEET_NAME_MAX_LENGTH - len(str(suffix)) - 1]}-{suffix}'
+    used_names.add(name.lower())
+    return name
+
+
+def write_response_file_lists_xlsx(rows_by_control, path):
+    """
+    rows_by_control is an iterable of (control, rows) : the rows of each control are
+    written in its sheet.
+    """
+    options = {'remove_timezone': True, 'constant_memory': True}
+    used_names = set()
+    with xlsxwriter.Workbook(path, options) as workbook:
+        bold = workbook.add_format({'bold': True})
+        for control, rows in rows_by_control:
+            worksheet = workbook.add_worksheet(get_sheet_name(control, used_names))
+            worksheet.set_column('A:L', 20)
+            worksheet.write_row(0, 0, ['Organisme interrogé', control.depositing_organization])
+            worksheet.write_row(1, 0, ['Procédure', control.title])
+            worksheet.write_row(2, 0, ['Dossier', f'/{control.reference_code}'])
+            header_row_number = row_number = 4
+            worksheet.write_row(row_number, 0, CONTROL_COLUMNS, bold)
+            for row in rows:
+                row_number += 1
+                worksheet.write_row(row_number, 0, row)
+            worksheet.autofilter(header_row_number, 0, row_number, len(CONTROL_COLUMNS) - 1)
+
+
+def write_response_file_lists_csv(rows_by_control, path):
+    """
+    Same as write_response_file_lists_xlsx, in a single table starting with the control
+    columns. The CSV is formatted for Excel, like the list of a questionnaire.
+    """
+    with open(path, 'w', encoding='utf-8-sig', newline='') as csv_file:
+        writer = csv.writer(csv_file, delimiter=';')
+        writer.writerow(['Dossier', 'Organisme interrogé'] + CONTROL_COLUMNS)
+        for control, rows in rows_by_control:
+            control_values = [control.reference_code, control.depositing_organization]
+            for row in rows:
+                writer.writerow(control_values + list(row))
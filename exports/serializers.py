@@ -0,0 +1,17 @@
+from rest_framework import serializers
+
+from .models import ExportJob
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ExportJob
+        fields = (
+            'id', 'kind', 'control', 'controls', 'questionnaire', 'file_format', 'status',
+            'total_items', 'processed_items', 'progress', 'url', 'error', 'created')
+        read_only_fields = (
+            'status', 'total_items', 'processed_items', 'error', 'created')
+        extra_kwargs = {
+            'kind': {'default': ExportJob.RESPONSE_FILES_ZIP},
+        }
@@ -0,0 +1,162 @@
+import logging
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from ecc.celery import app
+from celery.utils.log import get_task_logger
+
+from control.docx import update_questionnaire_file
+from control.export_response_files import (
+    get_control_files_for_export, iter_control_response_file_rows)
+
+from .dossier import write_control_dossier
+from .models import ExportJob
+from .response_file_lists import write_response_file_lists_csv, write_response_file_lists_xlsx
+from .zip_stream import count_archive_entries, iter_questionnaires_entries, iter_zip
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# The progress is saved every PROGRESS_STEP processed items, or ROWS_PROGRESS_STEP rows.
+PROGRESS_STEP = 20
+ROWS_PROGRESS_STEP = 1000
+
+
+def track_progress(export_job, entries, step=PROGRESS_STEP):
+    for entry in entries:
+        yield entry
+        export_job.processed_items += 1
+        if export_job.processed_items % step == 0:
+            export_job.save(update_fields=('processed_items', 'modified'))
+
+
+class ExportFile(File):
+    """
+    The file written by an export, which a local storage moves instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def write_export_file(export_job, write):
+    """
+    Call write(path) to write the file of the export job to a temporary path, save it in
+    the storage of the export files, then mark the job as done, or as failed if write
+    raised an exception.
+    """
+    # The file is written under a temporary name in the media folder, so that a
+    # half-written file is never served, and a local storage moves it to its place.
+    folder = os.path.join(settings.MEDIA_ROOT, 'EXPORTS')
+    os.makedirs(folder, exist_ok=True)
+    descriptor, partial_path = tempfile.mkstemp(suffix='.part', dir=folder)
+    os.close(descriptor)
+    try:
+        write(partial_path)
+        with open(partial_path, 'rb') as partial_file:
+            export_job.file.save(
+                export_job.filename, ExportFile(partial_file, name=partial_path), save=False)
+    except Exception as e:
+        logger.exception(f'Echec de l\'export {export_job.id}')
+        export_job.status = ExportJob.FAILED
+        export_job.error = str(e)
+        export_job.save()
+        return
+    finally:
+        if os.path.exists(partial_path):
+            # An object storage uploads the file instead of moving it.
+            os.remove(partial_path)
+    export_job.status = ExportJob.DONE
+    export_job.save()
+    logger.info(f'Export {export_job.id} terminé : {export_job.file.name}')
+
+
+@app.task(queue=settings.CELERY_QUEUE)
+def build_response_files_zip(export_job_id):
+    """
+    Write the ZIP archive of the response files to the media folder, for archives that
+    are too large to be streamed in the request.
+    """
+    export_job = ExportJob.objects.select_related('control', 'questionnaire').get(id=export_job_id)
+    logger.info(f'Export : {export_job.id}')
+    questionnaires = list(export_job.questionnaires)
+    export_job.status = ExportJob.RUNNING
+    export_job.total_items = count_archive_entries(questionnaires)
+    export_job.processed_items = 0
+    export_job.save()
+
+    def write_zip(path):
+        entries = track_progress(export_job, iter_questionnaires_entries(questionnaires))
+        with open(path, 'wb') as archive_file:
+            for chunk in iter_zip(entries):
+                archive_file.write(chunk)
+
+    write_export_file(export_job, write_zip)
+
+
+@app.task(queue=settings.QUESTIONNAIRE_DOCX_QUEUE)
+def build_control_dossier(export_job_id):
+    """
+    Generate the documents of the questionnaires that changed, then compose them into
+    the dossier of the control.
+    """
+    export_job = ExportJob.objects.select_related('control').get(id=export_job_id)
+    logger.info(f'Export : {export_job.id}')
+    questionnaires = list(export_job.questionnaires.select_related('control'))
+    export_job.status = ExportJob.RUNNING
+    export_job.total_items = len(questionnaires)
+    export_job.processed_items = 0
+    export_job.save()
+
+    def write_dossier(path):
+        for questionnaire in track_progress(export_job, questionnaires):
+            update_questionnaire_file(questionnaire)
+        write_control_dossier(export_job.control, questionnaires, path)
+
+    write_export_file(export_job, write_dossier)
+
+
+@app.task(queue=settings.CELERY_QUEUE)
+def build_response_file_list(export_job_id):
+    """
+    Write the list of the response files of the controls of the export job, in XLSX or
+    CSV.
+    """
+    export_job = ExportJob.objects.select_related('control').get(id=export_job_id)
+    logger.info(f'Export : {export_job.id}')
+    controls = list(export_job.get_controls())
+    export_job.status = ExportJob.RUNNING
+    export_job.total_items = sum(
+        get_control_files_for_export(control).count() for control in controls)
+    export_job.processed_items = 0
+    export_job.save()
+    rows_by_control = (
+        (control, track_progress(
+            export_job, iter_control_response_file_rows(control), ROWS_PROGRESS_STEP))
+        for control in controls
+    )
+    if export_job.file_format == ExportJob.CSV:
+        write_list = write_response_file_lists_csv
+    else:
+        write_list = write_response_file_lists_xlsx
+    write_export_file(export_job, lambda path: write_list(rows_by_control, path))
+
+
+@app.task(queue=settings.CELERY_QUEUE)
+def delete_expired_exports():
+    """
+    Exports are only kept for EXPORT_RETENTION_DAYS days.
+    """
+    date_cutoff = timezone.now() - timedelta(days=settings.EXPORT_RETENTION_DAYS)
+    expired_exports = ExportJob.objects.filter(created__lt=date_cutoff)
+    for export_job in expired_exports:
+        if export_job.file:
+            export_job.file.delete(save=False)
+    deleted_count, _ = expired_exports.delete()
+    logger.info(f'{deleted_count} export(s) supprimé(s)')
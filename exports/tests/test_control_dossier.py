@@ -0,0 +1,85 @@
+import io
+
+from docx import Document
+from pytest import mark
+
+from django.shortcuts import reverse
+
+from control.models import Question
+from exports.models import ExportJob
+from exports.tasks import build_control_dossier
+from tests import factories, utils
+
+
+pytestmark = mark.django_db
+
+
+def make_control():
+    questionnaire = factories.QuestionnaireFactory(uploaded_file=None, is_draft=False)
+    question = factories.QuestionFactory(
+        theme=factories.ThemeFactory(questionnaire=questionnaire), description='Première question')
+    factories.QuestionFileFactory(question=question)
+    factories.QuestionnaireFactory(control=questionnaire.control, title='Brouillon', is_draft=True)
+    return questionnaire.control
+
+
+def get_dossier(client, user, control):
+    utils.login(client, user=user)
+    return client.get(reverse('send-control-dossier', args=[control.id]))
+
+
+def read_dossier(response):
+    return Document(io.BytesIO(b''.join(response.streaming_content)))
+
+
+def test_dossier_is_built_in_the_background_then_sent(client):
+    control = make_control()
+    user = utils.make_inspector_user(control)
+
+    response = get_dossier(client, user, control)
+
+    assert response.status_code == 202
+    export_job = ExportJob.objects.get(id=response.json()['id'])
+    assert export_job.kind == ExportJob.CONTROL_DOSSIER
+    build_control_dossier(export_job.id)
+    export_job.refresh_from_db()
+    assert export_job.status == ExportJob.DONE
+    assert export_job.processed_items == export_job.total_items == 1
+
+    response = client.get(export_job.url)
+    assert response.status_code == 200
+    texts = [paragraph.text for paragraph in read_dossier(response).paragraphs]
+    questionnaire = control.questionnaires.get(is_draft=False)
+    question_file = questionnaire.question_files.get()
+    assert f'Dossier de procédure {control.reference_code}' in texts
+    # The heading, the title in the questionnaire document, and the heading of its annexes.
+    assert texts.count(questionnaire.title_display) == 3
+    assert 'Première question' in ''.join(texts)
+    assert f'Question 1.1 : {question_file.basename}' in texts
+    assert 'Questionnaire n°2 - Brouillon' not in texts
+
+
+def test_dossier_is_kept_until_a_questionnaire_changes(client):
+    control = make_control()
+    user = utils.make_inspector_user(control)
+    export_job = ExportJob.objects.get(id=get_dossier(client, user, control).json()['id'])
+    assert get_dossier(client, user, control).json()['id'] == export_job.id
+    build_control_dossier(export_job.id)
+
+    other_user = utils.make_inspector_user(control)
+    assert get_dossier(client, other_user, control).status_code == 200
+
+    Question.objects.filter(questionnaire__control=control).update(description='Modifiée')
+    response = get_dossier(client, user, control)
+    assert response.status_code == 202
+    assert response.json()['id'] != export_job.id
+
+
+def test_dossier_cannot_be_sent_to_audited_users(client):
+    control = make_control()
+    user = utils.make_audited_user(control)
+
+    response = get_dossier(client, user, control)
+
+    assert response.status_code == 404
+    assert not ExportJob.objects.exists()
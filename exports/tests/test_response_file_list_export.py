@@ -0,0 +1,88 @@
+import csv
+import io
+import zipfile
+
+from pytest import mark
+
+from django.shortcuts import reverse
+
+from rest_framework.test import APIClient
+
+from exports.models import ExportJob
+from exports.tasks import build_response_file_list
+from tests import factories, utils
+
+
+pytestmark = mark.django_db
+
+
+def make_control_with_response_file():
+    response_file = factories.ResponseFileFactory(
+        question__theme__questionnaire__is_draft=False)
+    return response_file.control, response_file
+
+
+def request_export(user, control, controls, file_format='xlsx'):
+    api_client = APIClient()
+    utils.login(api_client, user=user)
+    return api_client.post(reverse('api:export-list'), {
+        'kind': ExportJob.RESPONSE_FILE_LIST,
+        'control': control.id,
+        'controls': [c.id for c in controls],
+        'file_format': file_format,
+    }, format='json')
+
+
+def build(response):
+    assert response.status_code == 201
+    build_response_file_list(response.data['id'])
+    export_job = ExportJob.objects.get(id=response.data['id'])
+    assert export_job.status == ExportJob.DONE
+    return export_job
+
+
+def test_xlsx_list_has_a_sheet_per_control():
+    control_1, response_file_1 = make_control_with_response_file()
+    control_2, response_file_2 = make_control_with_response_file()
+    factories.ResponseFileFactory(
+        question__theme__questionnaire=factories.QuestionnaireFactory(
+            control=control_2, is_draft=True))
+    user = utils.make_inspector_user(control_1)
+    factories.AccessFactory(userprofile=user.profile, control=control_2, access_type='demandeur')
+
+    export_job = build(request_export(user, control_1, [control_2]))
+
+    assert export_job.processed_items == export_job.total_items == 2
+    assert export_job.progress == 100
+    archive = zipfile.ZipFile(export_job.file.open('rb'))
+    workbook = archive.read('xl/workbook.xml').decode()
+    assert control_1.reference_code in workbook
+    assert control_2.reference_code in workbook
+    assert response_file_2.basename in archive.read('xl/worksheets/sheet2.xml').decode()
+
+
+def test_csv_list_has_a_row_per_response_file():
+    control_1, response_file_1 = make_control_with_response_file()
+    control_2, response_file_2 = make_control_with_response_file()
+    user = utils.make_inspector_user(control_1)
+    factories.AccessFactory(userprofile=user.profile, control=control_2, access_type='demandeur')
+
+    export_job = build(request_export(user, control_1, [control_2], file_format='csv'))
+
+    with export_job.file.open('rb') as export_file:
+        content = export_file.read().decode('utf-8-sig')
+    rows = list(csv.reader(io.StringIO(content, newline=''), delimiter=';'))
+    assert export_job.filename.endswith('.csv')
+    assert [row[0] for row in rows[1:]] == [control_1.reference_code, control_2.reference_code]
+    assert [row[7] for row in rows[1:]] == [response_file_1.basename, response_file_2.basename]
+
+
+def test_list_cannot_be_requested_for_a_control_not_associated_with_the_user():
+    control_1, _ = make_control_with_response_file()
+    control_2, _ = make_control_with_response_file()
+    user = utils.make_inspector_user(control_1)
+
+    response = request_export(user, control_1, [control_2])
+
+    assert response.status_code == 400
+    assert not ExportJob.objects.exists()
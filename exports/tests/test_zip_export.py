@@ -0,0 +1,216 @@
+import io
+import runpy
+import zipfile
+
+from pytest import mark
+
+from django.conf import settings as django_settings
+from django.shortcuts import reverse
+
+from rest_framework.test import APIClient
+
+from control.models import ResponseFile
+from exports.models import ExportJob
+from exports.tasks import build_response_files_zip
+from exports.zip_stream import get_archive_size
+from tests import factories, utils
+
+
+pytestmark = mark.django_db
+
+
+def make_published_response_file(**kwargs):
+    response_file = factories.ResponseFileFactory(**kwargs)
+    questionnaire = response_file.question.theme.questionnaire
+    questionnaire.is_draft = False
+    questionnaire.save()
+    return response_file
+
+
+def get_zip(client, user, url_name, pk):
+    utils.login(client, user=user)
+    return client.get(reverse(url_name, args=[pk]))
+
+
+def read_zip(response):
+    content = b''.join(response.streaming_content)
+    return zipfile.ZipFile(io.BytesIO(content))
+
+
+def test_questionnaire_zip_contains_response_files_with_disk_layout(client):
+    response_file = make_published_response_file()
+    questionnaire = response_file.question.theme.questionnaire
+    user = utils.make_inspector_user(questionnaire.control)
+
+    response = get_zip(client, user, 'send-response-files-zip', questionnaire.id)
+
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/zip'
+    archive = read_zip(response)
+    assert response_file.file.name in archive.namelist()
+    assert archive.read(response_file.file.name) == response_file.file.open('rb').read()
+
+
+def test_questionnaire_zip_contains_the_response_file_list(client):
+    response_file = make_published_response_file()
+    questionnaire = response_file.question.theme.questionnaire
+    user = utils.make_audited_user(questionnaire.control)
+
+    archive = read_zip(get_zip(client, user, 'send-response-files-zip', questionnaire.id))
+
+    reference_code = questionnaire.control.reference_code
+    manifest_name = f'{reference_code}/Q01/réponses_questionnaire_1.xlsx'
+    assert manifest_name in archive.namelist()
+
+
+def test_questionnaire_zip_does_not_compress_already_compressed_files(client):
+    response_file = make_published_response_file()
+    questionnaire = response_file.question.theme.questionnaire
+    user = utils.make_inspector_user(questionnaire.control)
+
+    archive = read_zip(get_zip(client, user, 'send-response-files-zip', questionnaire.id))
+
+    assert archive.getinfo(response_file.file.name).compress_type == zipfile.ZIP_STORED
+
+
+def test_questionnaire_zip_does_not_contain_trashed_files(client):
+    response_file = make_published_response_file(is_deleted=True)
+    questionnaire = response_file.question.theme.questionnaire
+    user = utils.make_inspector_user(questionnaire.control)
+
+    archive = read_zip(get_zip(client, user, 'send-response-files-zip', questionnaire.id))
+
+    assert response_file.file.name not in archive.namelist()
+
+
+def test_questionnaire_zip_fails_if_the_control_is_not_associated_with_the_user(client):
+    response_file = make_published_response_file()
+    questionnaire = response_file.question.theme.questionnaire
+    user = utils.make_inspector_user(factories.ControlFactory())
+
+    response = get_zip(client, user, 'send-response-files-zip', questionnaire.id)
+
+    assert response.status_code == 404
+
+
+def test_control_zip_contains_files_of_published_questionnaires_only(client):
+    response_file = make_published_response_file()
+    control = response_file.question.theme.questionnaire.control
+    draft_response_file = factories.ResponseFileFactory(
+        question__theme__questionnaire=factories.QuestionnaireFactory(
+            control=control, is_draft=True))
+    user = utils.make_inspector_user(control)
+
+    response = get_zip(client, user, 'send-control-response-files-zip', control.id)
+
+    assert response.status_code == 200
+    names = read_zip(response).namelist()
+    assert response_file.file.name in names
+    assert draft_response_file.file.name not in names
+
+
+def test_archive_size_is_read_from_the_saved_file_sizes(monkeypatch):
+    response_file = make_published_response_file()
+    questionnaire = response_file.question.theme.questionnaire
+    file_size = response_file.file.size
+
+    def size(name):
+        raise AssertionError('The size must not be read from the storage')
+    monkeypatch.setattr(response_file.file.storage, 'size', size)
+
+    assert response_file.file_size == file_size
+    assert get_archive_size([questionnaire]) == file_size
+
+
+def test_archive_size_reads_the_files_saved_without_their_size():
+    response_file = make_published_response_file()
+    ResponseFile.objects.filter(id=response_file.id).update(file_size=None)
+
+    assert get_archive_size([response_file.questionnaire]) == response_file.file.size
+
+
+def test_large_zip_is_prepared_in_the_background(client, settings):
+    settings.EXPORT_ZIP_STREAMING_MAX_SIZE_MB = 0
+    response_file = make_published_response_file()
+    control = response_file.question.theme.questionnaire.control
+    user = utils.make_inspector_user(control)
+
+    response = get_zip(client, user, 'send-control-response-files-zip', control.id)
+
+    assert response.status_code == 202
+    export_job = ExportJob.objects.get(id=response.json()['id'])
+    assert export_job.status == ExportJob.QUEUED
+    assert export_job.user == user
+
+
+def test_background_zip_can_be_downloaded_when_done(client):
+    response_file = make_published_response_file()
+    control = response_file.question.theme.questionnaire.control
+    user = utils.make_inspector_user(control)
+    export_job = ExportJob.objects.create(
+        kind=ExportJob.RESPONSE_FILES_ZIP, user=user, control=control)
+
+    build_response_files_zip(export_job.id)
+
+    export_job.refresh_from_db()
+    assert export_job.status == ExportJob.DONE
+    assert export_job.progress == 100
+    assert export_job.processed_items == export_job.total_items == 2
+    utils.login(client, user=user)
+    response = client.get(export_job.url)
+    assert response.status_code == 200
+    assert response_file.file.name in read_zip(response).namelist()
+
+
+def test_background_zip_cannot_be_downloaded_by_another_user(client):
+    response_file = make_published_response_file()
+    control = response_file.question.theme.questionnaire.control
+    user = utils.make_inspector_user(control)
+    export_job = ExportJob.objects.create(
+        kind=ExportJob.RESPONSE_FILES_ZIP, user=user, control=control)
+    build_response_files_zip(export_job.id)
+    export_job.refresh_from_db()
+
+    other_user = utils.make_inspector_user(control)
+    utils.login(client, user=other_user)
+    response = client.get(export_job.url)
+    assert response.status_code == 404
+
+
+def test_export_can_be_requested_and_polled_through_the_api():
+    api_client = APIClient()
+    response_file = make_published_response_file()
+    control = response_file.question.theme.questionnaire.control
+    user = utils.make_inspector_user(control)
+    utils.login(api_client, user=user)
+
+    response = api_client.post(reverse('api:export-list'), {'control': control.id}, format='json')
+
+    assert response.status_code == 201
+    assert response.data['status'] == ExportJob.QUEUED
+    response = api_client.get(reverse('api:export-detail', args=[response.data['id']]))
+    assert response.status_code == 200
+    assert response.data['progress'] == 0
+    assert response.data['url'] is None
+
+
+def test_export_cannot_be_requested_for_a_control_not_associated_with_the_user():
+    api_client = APIClient()
+    control = make_published_response_file().question.theme.questionnaire.control
+    user = utils.make_inspector_user(factories.ControlFactory())
+    utils.login(api_client, user=user)
+
+    response = api_client.post(reverse('api:export-list'), {'control': control.id}, format='json')
+
+    assert response.status_code == 400
+    assert not ExportJob.objects.exists()
+
+
+def test_export_settings_set_in_the_environment_are_numbers(monkeypatch):
+    monkeypatch.setenv('EXPORT_ZIP_STREAMING_MAX_SIZE_MB', '1')
+    monkeypatch.setenv('EXPORT_RETENTION_DAYS', '3')
+
+    values = runpy.run_module(django_settings.SETTINGS_MODULE)
+
+    assert values['EXPORT_ZIP_STREAMING_MAX_SIZE_MB'] == 1
+    assert values['EXPORT_RETENTION_DAYS'] == 3
@@ -0,0 +1,148 @@
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.views.generic.detail import SingleObjectMixin
+
+from actstream import action
+
+from control.models import Control, Questionnaire
+from control.views import SendFileMixin
+
+from .dossier import get_dossier_fingerprint
+from .models import ExportJob
+from .serializers import ExportJobSerializer
+from .tasks import build_control_dossier, build_response_file_list, build_response_files_zip
+from .zip_stream import get_archive_size, iter_questionnaires_entries, iter_zip
+
+
+def start_export_job(user, control, questionnaire=None, kind=ExportJob.RESPONSE_FILES_ZIP,
+                     controls=(), file_format=ExportJob.XLSX):
+    export_job = ExportJob.objects.create(
+        kind=kind,
+        user=user,
+        control=control,
+        questionnaire=questionnaire,
+        file_format=file_format,
+    )
+    export_job.controls.set(controls)
+    task = {
+        ExportJob.RESPONSE_FILES_ZIP: build_response_files_zip,
+        ExportJob.RESPONSE_FILE_LIST: build_response_file_list,
+    }[kind]
+    transaction.on_commit(lambda: task.delay(export_job.id))
+    return export_job
+
+
+class SendResponseFilesZipMixin(SingleObjectMixin):
+    """
+    Send the ZIP archive of the response files, built while it is sent.
+    Archives larger than EXPORT_ZIP_STREAMING_MAX_SIZE_MB are prepared in the background
+    instead : an export job is returned, to be polled until the archive can be downloaded.
+
+    Inheriting classes should implement get_control() and get_questionnaires().
+    """
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        control = self.get_control()
+        questionnaires = self.get_questionnaires()
+        self.add_log_entry(control)
+        max_size = 1048576 * settings.EXPORT_ZIP_STREAMING_MAX_SIZE_MB
+        if get_archive_size(questionnaires) > max_size:
+            questionnaire = self.object if isinstance(self.object, Questionnaire) else None
+            export_job = start_export_job(request.user, control, questionnaire)
+            return JsonResponse(ExportJobSerializer(instance=export_job).data, status=202)
+        response = StreamingHttpResponse(
+            iter_zip(iter_questionnaires_entries(questionnaires)),
+            content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{self.get_filename()}"'
+        return response
+
+    def add_log_entry(self, control):
+        action_details = {
+            'sender': self.request.user,
+            'verb': 'exported response files in zip',
+            'action_object': control,
+            'target': self.object,
+        }
+        action.send(**action_details)
+
+
+class SendResponseFilesZip(SendResponseFilesZipMixin, LoginRequiredMixin, View):
+    model = Questionnaire
+
+    def get_queryset(self):
+        return Questionnaire.objects.filter(
+            control__in=self.request.user.profile.access_rights.control_ids(), is_draft=False)
+
+    def get_control(self):
+        return self.object.control
+
+    def get_questionnaires(self):
+        return [self.object]
+
+    def get_filename(self):
+        return f'{self.object.control.reference_code}-Q{self.object.numbering:02}.zip'
+
+
+class SendControlResponseFilesZip(SendResponseFilesZipMixin, LoginRequiredMixin, View):
+    model = Control
+
+    def get_queryset(self):
+        return self.request.user.profile.access_rights.controls()
+
+    def get_control(self):
+        return self.object
+
+    def get_questionnaires(self):
+        return list(self.object.questionnaires.filter(is_draft=False))
+
+    def get_filename(self):
+        return f'{self.object.reference_code}.zip'
+
+
+class SendControlDossier(SendFileMixin, LoginRequiredMixin, View):
+    """
+    Send the dossier of the control, built by a Celery task and kept until one of the
+    questionnaires changes. While it is built, the export job is returned, to be polled
+    until the dossier can be downloaded.
+    """
+    model = Control
+    file_type = 'control-dossier'
+
+    def get(self, request, *args, **kwargs):
+        control = self.get_object()
+        questionnaires = list(
+            control.questionnaires.filter(is_draft=False).select_related('control'))
+        fingerprint = get_dossier_fingerprint(control, questionnaires)
+        export_jobs = ExportJob.objects \
+            .filter(kind=ExportJob.CONTROL_DOSSIER, control=control, fingerprint=fingerprint)
+        export_job = export_jobs.filter(status=ExportJob.DONE).first()
+        if export_job is not None and export_job.file.storage.exists(export_job.file.name):
+            self.add_access_log_entry(accessed_object=control)
+            return self.make_file_response(export_job)
+        export_job = export_jobs \
+            .filter(user=request.user, status__in=(ExportJob.QUEUED, ExportJob.RUNNING)) \
+            .first()
+        if export_job is None:
+            export_job = ExportJob.objects.create(
+                kind=ExportJob.CONTROL_DOSSIER,
+                user=request.user,
+                control=control,
+                fingerprint=fingerprint,
+            )
+            transaction.on_commit(lambda: build_control_dossier.delay(export_job.id))
+        return JsonResponse(ExportJobSerializer(instance=export_job).data, status=202)
+
+    def get_queryset(self):
+        return self.request.user.profile.access_rights.controls('demandeur')
+
+
+class SendExportFile(SendFileMixin, LoginRequiredMixin, View):
+    model = ExportJob
+    file_type = 'export-file'
+
+    def get_queryset(self):
+        return ExportJob.objects.filter(user=self.request.user, status=ExportJob.DONE)
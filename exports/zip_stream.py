@@ -0,0 +1,153 @@
+import logging
+import os
+import zipfile
+from collections import namedtuple
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Sum
+from django.utils import timezone
+
+from control.export_response_files import get_files_for_export, generate_response_file_list_in_xlsx
+from control.models import ResponseFile
+from control.upload_path import questionnaire_path
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# Formats that are already compressed: deflating them again costs CPU for no gain.
+STORED_EXTENSIONS = (
+    '.7z', '.avi', '.bz2', '.docx', '.gif', '.gz', '.jpeg', '.jpg', '.mov', '.mp3', '.mp4',
+    '.odp', '.ods', '.odt', '.pdf', '.png', '.pptx', '.rar', '.xlsx', '.xz', '.zip',
+)
+
+# An entry of the archive : the file `name` of `storage` is stored under the name `arcname`.
+ZipEntry = namedtuple('ZipEntry', ['arcname', 'storage', 'name'])
+
+
+class ZipStream(object):
+    """
+    Write-only, non-seekable file object that keeps what ZipFile writes until it is
+    consumed with `pop()`.
+    As it cannot seek, ZipFile writes a data descriptor after each entry instead of
+    rewriting the local headers, which makes the archive streamable.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def get_compress_type(filename):
+    if os.path.splitext(filename)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def make_zip_info(entry):
+    """
+    ZipInfo of the entry, from its storage : the file may not be on the local disk.
+    """
+    modified_time = entry.storage.get_modified_time(entry.name)
+    if timezone.is_aware(modified_time):
+        modified_time = timezone.localtime(modified_time)
+    zip_info = zipfile.ZipInfo(entry.arcname, date_time=modified_time.timetuple()[:6])
+    zip_info.file_size = entry.storage.size(entry.name)
+    zip_info.external_attr = 0o644 << 16
+    zip_info.compress_type = get_compress_type(entry.arcname)
+    return zip_info
+
+
+def iter_zip(entries):
+    """
+    Build a ZIP archive from the given entries, and yield it chunk by chunk while it is
+    being built : neither the archive nor the files are ever fully loaded in memory.
+    ZIP64 extensions are used when needed (files or archive larger than 4GB).
+    Missing files are skipped.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, mode='w', allowZip64=True) as archive:
+        for entry in entries:
+            if not entry.storage.exists(entry.name):
+                logger.warning(f'Fichier manquant, ignoré dans l\'archive : {entry.name}')
+                continue
+            zip_info = make_zip_info(entry)
+            # The file size is known in advance : ZipFile switches to ZIP64 by itself.
+            with entry.storage.open(entry.name, 'rb') as source, \
+                    archive.open(zip_info, mode='w') as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    target.write(chunk)
+                    if stream.buffer:
+                        yield stream.pop()
+            yield stream.pop()
+    # The central directory is written when the archive is closed.
+    yield stream.pop()
+
+
+def get_manifest_arcname(questionnaire):
+    return os.path.join(
+        questionnaire_path(questionnaire),
+        f'réponses_questionnaire_{questionnaire.numbering}.xlsx')
+
+
+def iter_questionnaire_entries(questionnaire):
+    """
+    Entries of the archive for a questionnaire : the list of response files (XLSX) and
+    the response files, with the same layout as on disk (REF/Qxx/Txx/...).
+    """
+    manifest = generate_response_file_list_in_xlsx(questionnaire)
+    manifest_folder, manifest_name = os.path.split(manifest.name)
+    try:
+        yield ZipEntry(
+            get_manifest_arcname(questionnaire), FileSystemStorage(manifest_folder),
+            manifest_name)
+    finally:
+        os.remove(manifest.name)
+    for response_file in get_files_for_export(questionnaire):
+        yield ZipEntry(response_file.file.name, response_file.file.storage, response_file.file.name)
+
+
+def iter_questionnaires_entries(questionnaires):
+    for questionnaire in questionnaires:
+        yield from iter_questionnaire_entries(questionnaire)
+
+
+def get_archive_size(questionnaires):
+    """
+    Size of the response files going into the archive, in bytes, from their saved size.
+    Only the files saved before their size was kept are read.
+    """
+    response_files = ResponseFile.objects.filter(
+        questionnaire__in=questionnaires, is_deleted=False)
+    size = response_files.aggregate(size=Sum('file_size'))['size'] or 0
+    for response_file in response_files.filter(file_size__isnull=True).only('file'):
+        try:
+            size += response_file.file.size
+        except Exception:
+            # A missing file, e.g. an OSError on the local storage, or a ClientError
+            # on an object storage.
+            pass
+    return size
+
+
+def count_archive_entries(questionnaires):
+    return sum(
+        get_files_for_export(questionnaire).count() + 1
+        for questionnaire in questionnaires)
@@ -1,5 +1,7 @@
 from actstream import action
 
+from .buffer import build_action, save_actions
+
 
 def add_log_entry(verb, session_user, obj, description='', target=None):
     action_details = {
@@ -10,3 +12,18 @@ def add_log_entry(verb, session_user, obj, description='', target=None):
         'target': target,
     }
     action.send(**action_details)
+
+
+def make_log_entry(verb, session_user, obj, description='', target=None):
+    """
+    Build the same unsaved Action as `add_log_entry`, to be saved with `add_log_entries`.
+    """
+    return build_action(
+        session_user, verb, description=description, action_object=obj, target=target)
+
+
+def add_log_entries(entries):
+    """
+    Save the Actions built by `make_log_entry`, with the other actions of the request.
+    """
+    save_actions(entries)
@@ -6,3 +6,16 @@ from django.apps import AppConfig
 class LogsConfig(AppConfig):
     name = 'logs'
     verbose_name = "Logs"
+
+    def ready(self):
+        # Route actstream's `action` signal through the buffer. Other receivers of the
+        # signal are left untouched.
+        from actstream.actions import action_handler
+        from actstream.signals import action
+        from celery.signals import task_postrun, task_prerun
+        from .buffer import buffered_action_handler, start_buffering, stop_buffering
+
+        action.disconnect(action_handler, dispatch_uid='actstream.models')
+        action.connect(buffered_action_handler, dispatch_uid='actstream.models')
+        task_prerun.connect(start_buffering, dispatch_uid='logs.buffer.start')
+        task_postrun.connect(stop_buffering, dispatch_uid='logs.buffer.stop')
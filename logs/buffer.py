@@ -0,0 +1,148 @@
+"""
+Actions logged during a request or a Celery task are kept in memory, then saved together
+with a single query when the request or the task ends. Actions with a verb in
+ACTION_LOG_DEFERRED_VERBS are handed to a Celery task instead.
+
+Outside of a request or a task, actions are saved immediately.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from actstream import settings as actstream_settings
+from actstream.models import Action
+from actstream.registry import check
+
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+def build_action(actor, verb, description=None, action_object=None, target=None,
+                 timestamp=None, public=True, **data):
+    """
+    Build an unsaved Action, the same way as actstream's action_handler.
+    Content types are resolved through the ContentType cache.
+    """
+    entry = Action(
+        actor_content_type=ContentType.objects.get_for_model(actor),
+        actor_object_id=actor.pk,
+        verb=str(verb),
+        public=bool(public),
+        description=description,
+        timestamp=timestamp or timezone.now(),
+    )
+    for name, related_object in (('target', target), ('action_object', action_object)):
+        if related_object is not None:
+            check(related_object)
+            setattr(entry, f'{name}_object_id', related_object.pk)
+            setattr(
+                entry, f'{name}_content_type',
+                ContentType.objects.get_for_model(related_object))
+    if actstream_settings.USE_JSONFIELD and data:
+        entry.data = data
+    return entry
+
+
+def buffered_action_handler(verb, **kwargs):
+    """
+    Receiver of actstream's `action` signal, replacing its action_handler so that
+    every `action.send` goes through the buffer.
+    """
+    kwargs.pop('signal', None)
+    actor = kwargs.pop('sender')
+    # As in action_handler, the untranslated verb is stored.
+    if hasattr(verb, '_proxy____args'):
+        verb = verb._proxy____args[0]
+    entry = build_action(actor, verb, **kwargs)
+    save_actions([entry])
+    return entry
+
+
+def is_buffering():
+    return getattr(_state, 'entries', None) is not None
+
+
+@contextmanager
+def buffered_actions():
+    """
+    Keep the actions logged in this block in memory, and save them at the end of the
+    outermost block.
+    """
+    if is_buffering():
+        yield
+        return
+    _state.entries = []
+    try:
+        yield
+    finally:
+        entries = _state.entries
+        _state.entries = None
+        flush_actions(entries)
+
+
+def start_buffering(**kwargs):
+    # A task run inside a request or another task, e.g. eagerly, logs to their buffer,
+    # which is saved at their end.
+    started = not is_buffering()
+    if started:
+        _state.entries = []
+    _state.started = getattr(_state, 'started', []) + [started]
+
+
+def stop_buffering(**kwargs):
+    started = getattr(_state, 'started', None)
+    if started:
+        _state.started = started[:-1]
+        if not started[-1]:
+            return
+    entries = getattr(_state, 'entries', None) or []
+    _state.entries = None
+    flush_actions(entries)
+
+
+def save_actions(entries):
+    if is_buffering():
+        _state.entries.extend(entries)
+    else:
+        Action.objects.bulk_create(entries)
+
+
+def serialize_action(entry):
+    data = {
+        field.attname: getattr(entry, field.attname)
+        for field in Action._meta.concrete_fields if not field.primary_key
+    }
+    data['timestamp'] = entry.timestamp.isoformat()
+    return data
+
+
+def flush_actions(entries):
+    deferred_verbs = settings.ACTION_LOG_DEFERRED_VERBS
+    immediate_entries = [entry for entry in entries if entry.verb not in deferred_verbs]
+    deferred_entries = [entry for entry in entries if entry.verb in deferred_verbs]
+    if immediate_entries:
+        Action.objects.bulk_create(immediate_entries)
+    if deferred_entries:
+        transaction.on_commit(lambda: defer_actions(deferred_entries))
+
+
+def defer_actions(entries):
+    """
+    Hand the actions to Celery, or save them now if the broker cannot be reached : the
+    request must not fail, nor wait for the broker, because of its log.
+    """
+    from .tasks import save_serialized_actions
+
+    try:
+        save_serialized_actions.apply_async(
+            ([serialize_action(entry) for entry in entries],), retry=False)
+    except Exception:
+        logger.exception('Envoi des actions à Celery impossible, enregistrement immédiat')
+        Action.objects.bulk_create(entries)
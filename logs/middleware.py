@@ -0,0 +1,15 @@
+from .buffer import buffered_actions
+
+
+class ActionBufferMiddleware:
+    """
+    Save the actions logged during the request with a single query, once the response
+    is built.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with buffered_actions():
+            return self.get_response(request)
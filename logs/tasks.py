@@ -0,0 +1,12 @@
+from django.conf import settings
+
+from actstream.models import Action
+from ecc.celery import app
+
+
+@app.task(queue=settings.CELERY_QUEUE)
+def save_serialized_actions(serialized_actions):
+    """
+    Save the actions with high-volume verbs, handed over by logs.buffer.
+    """
+    Action.objects.bulk_create([Action(**data) for data in serialized_actions])
@@ -0,0 +1,106 @@
+from pytest import mark
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from actstream import action
+from actstream.models import Action
+
+from logs.buffer import (
+    build_action, buffered_actions, serialize_action, start_buffering, stop_buffering)
+from logs.tasks import save_serialized_actions
+from tests import factories
+
+
+pytestmark = mark.django_db
+
+
+def count_action_inserts(context):
+    return len([
+        query for query in context.captured_queries
+        if query['sql'].startswith('INSERT INTO "actstream_action"')
+    ])
+
+
+def test_actions_are_saved_immediately_outside_of_a_buffer():
+    user = factories.UserFactory()
+    action.send(sender=user, verb='logged in')
+    assert Action.objects.filter(verb='logged in').count() == 1
+
+
+def test_buffered_actions_are_saved_with_one_query():
+    user = factories.UserFactory()
+    control = factories.ControlFactory()
+    with CaptureQueriesContext(connection) as context:
+        with buffered_actions():
+            for _ in range(3):
+                action.send(sender=user, verb='updated control', action_object=control)
+            assert not Action.objects.filter(verb='updated control').exists()
+    assert count_action_inserts(context) == 1
+    saved_action = Action.objects.filter(verb='updated control').first()
+    assert Action.objects.filter(verb='updated control').count() == 3
+    assert saved_action.actor == user
+    assert saved_action.action_object == control
+
+
+def test_nested_buffers_are_saved_at_the_end_of_the_outermost():
+    user = factories.UserFactory()
+    with buffered_actions():
+        with buffered_actions():
+            action.send(sender=user, verb='logged in')
+        assert not Action.objects.exists()
+    assert Action.objects.count() == 1
+
+
+def test_task_run_inside_a_buffer_logs_to_it():
+    user = factories.UserFactory()
+    with buffered_actions():
+        action.send(sender=user, verb='updated control')
+        start_buffering()
+        action.send(sender=user, verb='logged in')
+        stop_buffering()
+        assert not Action.objects.exists()
+    assert Action.objects.count() == 2
+
+
+def test_deferred_verbs_are_handed_to_celery(settings, django_capture_on_commit_callbacks):
+    settings.ACTION_LOG_DEFERRED_VERBS = ('accessed questionnaire',)
+    user = factories.UserFactory()
+    questionnaire = factories.QuestionnaireFactory()
+    with django_capture_on_commit_callbacks() as callbacks:
+        with buffered_actions():
+            action.send(sender=user, verb='accessed questionnaire', target=questionnaire)
+            action.send(sender=user, verb='logged in')
+    assert len(callbacks) == 1
+    assert list(Action.objects.values_list('verb', flat=True)) == ['logged in']
+
+
+def test_deferred_actions_are_saved_if_celery_cannot_be_reached(
+        settings, monkeypatch, django_capture_on_commit_callbacks):
+    settings.ACTION_LOG_DEFERRED_VERBS = ['accessed questionnaire']
+    user = factories.UserFactory()
+    questionnaire = factories.QuestionnaireFactory()
+
+    def apply_async(*args, **kwargs):
+        raise ConnectionRefusedError()
+    monkeypatch.setattr(save_serialized_actions, 'apply_async', apply_async)
+    with django_capture_on_commit_callbacks(execute=True):
+        with buffered_actions():
+            action.send(sender=user, verb='accessed questionnaire', target=questionnaire)
+
+    saved_action = Action.objects.get()
+    assert saved_action.verb == 'accessed questionnaire'
+    assert saved_action.target == questionnaire
+
+
+def test_serialized_actions_are_saved_by_the_task():
+    user = factories.UserFactory()
+    questionnaire = factories.QuestionnaireFactory()
+    entry = build_action(user, 'accessed questionnaire', target=questionnaire)
+
+    save_serialized_actions([serialize_action(entry)])
+
+    saved_action = Action.objects.get()
+    assert saved_action.actor == user
+    assert saved_action.target == questionnaire
+    assert saved_action.timestamp == entry.timestamp
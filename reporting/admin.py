@@ -0,0 +1,30 @@
+from django.contrib import admin
+
+from .models import DigestState, FilesReportDelivery, FilesReportRun, ReportingState
+
+
+@admin.register(FilesReportRun)
+class FilesReportRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'created', 'finished_at', 'controls', 'digests', 'sent', 'skipped', 'failed')
+
+
+@admin.register(FilesReportDelivery)
+class FilesReportDeliveryAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'control', 'userprofile', 'status', 'attempts', 'recipients', 'run', 'created')
+    list_filter = ('status',)
+    raw_id_fields = ('run', 'control', 'userprofile')
+    search_fields = ('key',)
+
+
+@admin.register(ReportingState)
+class ReportingStateAdmin(admin.ModelAdmin):
+    list_display = ('control', 'last_sent_at', 'last_file_id')
+    raw_id_fields = ('control',)
+
+
+@admin.register(DigestState)
+class DigestStateAdmin(admin.ModelAdmin):
+    list_display = ('userprofile', 'last_sent_at', 'last_file_id')
+    raw_id_fields = ('userprofile',)
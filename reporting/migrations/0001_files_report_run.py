@@ -0,0 +1,55 @@
+# Generated by Django 3.2.17 on 2026-10-18 16:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('control', '0058_response_file_move'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilesReportRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('controls', models.PositiveIntegerField(default=0, verbose_name='procédures')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='rapports envoyés')),
+                ('skipped', models.PositiveIntegerField(default=0, help_text='Sans nouveau fichier, sans destinataire, ou rapport déjà envoyé', verbose_name='procédures ignorées')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='échecs')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='fin')),
+            ],
+            options={
+                'verbose_name': 'Envoi des rapports de fichiers',
+                'verbose_name_plural': 'Envois des rapports de fichiers',
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.CreateModel(
+            name='FilesReportDelivery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='clé')),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('sending', 'En cours'), ('sent', 'Envoyé'), ('failed', 'Échec')], default='pending', max_length=255, verbose_name='statut')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='tentatives')),
+                ('recipients', models.PositiveIntegerField(default=0, verbose_name='destinataires')),
+                ('control', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files_report_deliveries', to='control.control', verbose_name='procédure')),
+                ('run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deliveries', to='reporting.filesreportrun', verbose_name='envoi')),
+            ],
+            options={
+                'verbose_name': 'Rapport de fichiers',
+                'verbose_name_plural': 'Rapports de fichiers',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
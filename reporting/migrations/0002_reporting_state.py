@@ -0,0 +1,66 @@
+# Generated by Django 3.2.17 on 2026-10-18 16:40
+
+from django.db import migrations, models
+from django.db.models import Max
+import django.db.models.deletion
+
+
+def create_reporting_states(apps, schema_editor):
+    """
+    The watermark of each control is its last report, logged in actstream.
+    """
+    Action = apps.get_model('actstream', 'Action')
+    Control = apps.get_model('control', 'Control')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    ResponseFile = apps.get_model('control', 'ResponseFile')
+    ReportingState = apps.get_model('reporting', 'ReportingState')
+    content_type = ContentType.objects.filter(app_label='control', model='control').first()
+    if content_type is None:
+        return
+    last_reports = Action.objects \
+        .filter(actor_content_type=content_type, verb='files report email sent') \
+        .order_by() \
+        .values_list('actor_object_id') \
+        .annotate(Max('timestamp'))
+    control_ids = set(Control.objects.values_list('id', flat=True))
+    states = []
+    for control_id, last_sent_at in last_reports:
+        if int(control_id) not in control_ids:
+            continue
+        last_file_id = ResponseFile.objects \
+            .filter(control_id=control_id, created__lte=last_sent_at) \
+            .aggregate(Max('id'))['id__max']
+        states.append(ReportingState(
+            control_id=control_id, last_sent_at=last_sent_at, last_file_id=last_file_id or 0))
+    ReportingState.objects.bulk_create(states, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actstream', '0003_add_follow_flag'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('control', '0058_response_file_move'),
+        ('reporting', '0001_files_report_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportingState',
+            fields=[
+                ('control', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reporting_state', serialize=False, to='control.control', verbose_name='procédure')),
+                ('last_sent_at', models.DateTimeField(verbose_name='dernier envoi')),
+                ('last_file_id', models.PositiveIntegerField(default=0, help_text='Identifiant du dernier fichier déposé signalé', verbose_name='dernier fichier')),
+            ],
+            options={
+                'verbose_name': 'État du rapport de fichiers',
+                'verbose_name_plural': 'États des rapports de fichiers',
+            },
+        ),
+        migrations.AddField(
+            model_name='filesreportdelivery',
+            name='last_file_id',
+            field=models.PositiveIntegerField(default=0, verbose_name='dernier fichier'),
+        ),
+        migrations.RunPython(create_reporting_states, migrations.RunPython.noop),
+    ]
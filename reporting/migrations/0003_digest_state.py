@@ -0,0 +1,48 @@
+# Generated by Django 3.2.17 on 2026-10-18 16:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_profiles', '0028_userprofile_files_report_digest'),
+        ('control', '0058_response_file_move'),
+        ('reporting', '0002_reporting_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigestState',
+            fields=[
+                ('last_sent_at', models.DateTimeField(verbose_name='dernier envoi')),
+                ('last_file_id', models.PositiveIntegerField(default=0, help_text='Identifiant du dernier fichier déposé signalé', verbose_name='dernier fichier')),
+                ('userprofile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='digest_state', serialize=False, to='user_profiles.userprofile', verbose_name='utilisateur')),
+            ],
+            options={
+                'verbose_name': 'État du rapport groupé',
+                'verbose_name_plural': 'États des rapports groupés',
+            },
+        ),
+        migrations.AddField(
+            model_name='filesreportdelivery',
+            name='userprofile',
+            field=models.ForeignKey(blank=True, help_text='Pour un rapport groupé', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='files_report_deliveries', to='user_profiles.userprofile', verbose_name='utilisateur'),
+        ),
+        migrations.AddField(
+            model_name='filesreportrun',
+            name='digests',
+            field=models.PositiveIntegerField(default=0, verbose_name='utilisateurs en rapport groupé'),
+        ),
+        migrations.AlterField(
+            model_name='filesreportdelivery',
+            name='control',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='files_report_deliveries', to='control.control', verbose_name='procédure'),
+        ),
+        migrations.AlterField(
+            model_name='filesreportrun',
+            name='skipped',
+            field=models.PositiveIntegerField(default=0, help_text='Sans nouveau fichier, sans destinataire, ou rapport déjà envoyé', verbose_name='rapports ignorés'),
+        ),
+    ]
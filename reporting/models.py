@@ -1,3 +1,155 @@
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 
-# Create your models here.
+from model_utils.models import TimeStampedModel
+
+
+class Watermark(models.Model):
+    """
+    The files with an id above last_file_id were uploaded after the last report.
+    """
+    last_sent_at = models.DateTimeField("dernier envoi")
+    last_file_id = models.PositiveIntegerField(
+        "dernier fichier", default=0, help_text="Identifiant du dernier fichier déposé signalé")
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def advance(cls, pk, last_file_id, last_sent_at):
+        """
+        Move the watermark forward to last_file_id, never backward.
+        """
+        state, created = cls.objects.get_or_create(
+            pk=pk, defaults={'last_file_id': last_file_id, 'last_sent_at': last_sent_at})
+        if not created:
+            cls.objects \
+                .filter(pk=pk, last_file_id__lt=last_file_id) \
+                .update(last_file_id=last_file_id, last_sent_at=last_sent_at)
+
+
+class ReportingState(Watermark):
+    """
+    Watermark of the files report of a control, updated with each report sent.
+    """
+    control = models.OneToOneField(
+        to='control.Control', verbose_name='procédure', related_name='reporting_state',
+        primary_key=True, on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name = "État du rapport de fichiers"
+        verbose_name_plural = "États des rapports de fichiers"
+
+    def __str__(self):
+        return f'[C{self.control_id}] {self.last_file_id} - {self.last_sent_at:%Y-%m-%d %H:%M}'
+
+
+class DigestState(Watermark):
+    """
+    Watermark of the files digest of a user, who receives the new files of all their
+    controls in one email. Updated with each digest sent.
+    """
+    userprofile = models.OneToOneField(
+        to='user_profiles.UserProfile', verbose_name='utilisateur',
+        related_name='digest_state', primary_key=True, on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name = "État du rapport groupé"
+        verbose_name_plural = "États des rapports groupés"
+
+    def __str__(self):
+        return f'[U{self.userprofile_id}] {self.last_file_id} - {self.last_sent_at:%Y-%m-%d %H:%M}'
+
+
+class FilesReportRun(TimeStampedModel):
+    """
+    A run of the files report : the report of each control, and the digests of each
+    batch of users, are sent by their own Celery tasks, which count their outcomes here.
+    """
+    SENT = 'sent'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+
+    controls = models.PositiveIntegerField("procédures", default=0)
+    digests = models.PositiveIntegerField("utilisateurs en rapport groupé", default=0)
+    sent = models.PositiveIntegerField("rapports envoyés", default=0)
+    skipped = models.PositiveIntegerField(
+        "rapports ignorés", default=0,
+        help_text="Sans nouveau fichier, sans destinataire, ou rapport déjà envoyé")
+    failed = models.PositiveIntegerField("échecs", default=0)
+    finished_at = models.DateTimeField("fin", null=True, blank=True)
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = "Envoi des rapports de fichiers"
+        verbose_name_plural = "Envois des rapports de fichiers"
+
+    @classmethod
+    def count_outcome(cls, run_id, outcome, count=1):
+        """
+        Count the outcome of the report of a control, or of digests, then mark the run as
+        finished once all the controls and digests are counted.
+        """
+        now = timezone.now()
+        runs = cls.objects.filter(id=run_id)
+        runs.update(**{outcome: F(outcome) + count}, modified=now)
+        runs.filter(finished_at__isnull=True) \
+            .annotate(reports=F('controls') + F('digests')) \
+            .filter(reports__lte=F('sent') + F('skipped') + F('failed')) \
+            .update(finished_at=now)
+
+    def __str__(self):
+        return f'[ID{self.id}] {self.created:%Y-%m-%d %H:%M} - {self.sent}/{self.controls}'
+
+
+class FilesReportDelivery(TimeStampedModel):
+    """
+    The report of the files uploaded to a control, or the digest of a user, since the
+    previous one. Its key is unique, so that the same report is never sent twice, e.g.
+    when a run is started again.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS = (
+        (PENDING, 'En attente'),
+        (SENDING, 'En cours'),
+        (SENT, 'Envoyé'),
+        (FAILED, 'Échec'),
+    )
+
+    key = models.CharField("clé", max_length=255, unique=True)
+    run = models.ForeignKey(
+        to=FilesReportRun, verbose_name='envoi', related_name='deliveries',
+        null=True, blank=True, on_delete=models.SET_NULL)
+    control = models.ForeignKey(
+        to='control.Control', verbose_name='procédure', related_name='files_report_deliveries',
+        null=True, blank=True, on_delete=models.CASCADE)
+    userprofile = models.ForeignKey(
+        to='user_profiles.UserProfile', verbose_name='utilisateur',
+        related_name='files_report_deliveries', null=True, blank=True,
+        on_delete=models.CASCADE, help_text="Pour un rapport groupé")
+    status = models.CharField("statut", max_length=255, choices=STATUS, default=PENDING)
+    attempts = models.PositiveSmallIntegerField("tentatives", default=0)
+    recipients = models.PositiveIntegerField("destinataires", default=0)
+    last_file_id = models.PositiveIntegerField("dernier fichier", default=0)
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = "Rapport de fichiers"
+        verbose_name_plural = "Rapports de fichiers"
+
+    @staticmethod
+    def make_key(control, reporting_state):
+        previous = reporting_state.last_file_id if reporting_state else 'first'
+        return f'files-report-{control.id}-after-{previous}'
+
+    @staticmethod
+    def make_digest_key(userprofile, digest_state):
+        previous = digest_state.last_file_id if digest_state else 'first'
+        return f'files-digest-{userprofile.pk}-after-{previous}'
+
+    def __str__(self):
+        return f'[ID{self.id}] {self.key} - {self.status}'
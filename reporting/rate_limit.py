@@ -0,0 +1,105 @@
+"""
+Rate limiters of the report emails, as token buckets : the bucket is refilled at the rate
+of the SMTP quota, up to its capacity, and each email takes a token. The bucket in Redis
+is shared by all the Celery workers ; the bucket in memory only by the threads of one
+process, e.g. in the tests.
+"""
+import math
+import threading
+import time
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class TokenBucket(object):
+    """
+    A bucket of `capacity` tokens, refilled with `rate` tokens per second.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens if the bucket has enough of them, and return 0. Otherwise, return the
+        number of seconds until it has : the caller should try again later.
+        """
+        raise NotImplementedError
+
+
+class MemoryTokenBucket(TokenBucket):
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        super().__init__(rate, capacity)
+        self.clock = clock
+        self.tokens = capacity
+        self.timestamp = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+
+# The bucket is refilled and taken from atomically, with the clock of the Redis server.
+# The number of seconds to wait is returned as a string, as Redis truncates Lua numbers.
+ACQUIRE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(bucket[1]) or capacity
+local timestamp = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - timestamp) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'timestamp', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return tostring(wait)
+"""
+
+
+class RedisTokenBucket(TokenBucket):
+
+    def __init__(self, rate, capacity, url=None, key='reporting:email-rate-limit'):
+        super().__init__(rate, capacity)
+        self.key = key
+        self.client = redis.Redis.from_url(url or settings.EMAIL_RATE_LIMIT_REDIS_URL)
+        self.script = self.client.register_script(ACQUIRE_SCRIPT)
+
+    def acquire(self, tokens=1):
+        # A full bucket is not kept.
+        expiry = math.ceil(self.capacity / self.rate) + 1
+        return float(self.script(
+            keys=[self.key], args=[self.rate, self.capacity, tokens, expiry]))
+
+
+_rate_limiters = {}
+
+
+def get_email_rate_limiter():
+    """
+    The rate limiter of EMAIL_RATE_LIMITER, which lets an email through every
+    EMAIL_SPACING_TIME_MILLIS on average, and EMAIL_RATE_LIMIT_BURST at once at most.
+    """
+    rate = 1000 / settings.EMAIL_SPACING_TIME_MILLIS
+    config = (settings.EMAIL_RATE_LIMITER, rate, settings.EMAIL_RATE_LIMIT_BURST)
+    if config not in _rate_limiters:
+        _rate_limiters[config] = import_string(settings.EMAIL_RATE_LIMITER)(
+            rate=rate, capacity=settings.EMAIL_RATE_LIMIT_BURST)
+    return _rate_limiters[config]
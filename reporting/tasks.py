@@ -1,8 +1,10 @@
 import logging
-import time
+from collections import Counter, defaultdict
 from datetime import date, timedelta
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef, Q
 from django.utils import timezone
 
 from actstream import action
@@ -11,7 +13,11 @@ from celery.utils.log import get_task_logger
 
 from control.models import Control, Questionnaire, ResponseFile
 from parametres.models import Parametre
-from utils.email import send_email
+from user_profiles.models import Access, UserProfile
+from utils.email import EmailBatch, send_emails
+
+from .models import DigestState, FilesReportDelivery, FilesReportRun, ReportingState
+from .rate_limit import get_email_rate_limiter
 
 
 logger = get_task_logger(__name__)
@@ -25,141 +31,441 @@ logger.addHandler(console_handler)
 
 ACTION_LOG_REPORT_VERB_SENT = 'files report email sent'
 ACTION_LOG_REPORT_VERB_NOT_SENT = 'files report email not sent'
+ACTION_LOG_DIGEST_VERB_SENT = 'files digest email sent'
+ACTION_LOG_DIGEST_VERB_NOT_SENT = 'files digest email not sent'
 ACTION_LOG_DUE_VERB_SENT = 'due date report email sent'
 ACTION_LOG_DUE_VERB_NOT_SENT = 'due date report email not sent'
 
 
-def get_date_cutoff(control):
+def get_reporting_state(control):
+    try:
+        return control.reporting_state
+    except ReportingState.DoesNotExist:
+        return None
+
+
+def get_date_cutoff(reporting_state):
     """
     L'outil de reporting recherche les fichiers téléversés après une date spécifique :
     - La dernière fois qu'un email a été envoyé
     - ou bien depuis 24h
     """
-    latest_email_sent = control.actor_actions.filter(verb=ACTION_LOG_REPORT_VERB_SENT).first()
-    if latest_email_sent:
-        date_cutoff = latest_email_sent.timestamp
-    else:
-        date_cutoff = timezone.now() - timedelta(hours=24)
-    return date_cutoff
+    if reporting_state is None:
+        return timezone.now() - timedelta(hours=24)
+    return reporting_state.last_sent_at
 
 
-def get_files(control):
-    date_cutoff = get_date_cutoff(control)
-    logger.info("Recherche des fichiers téléversés après le {}".format(
-        date_cutoff.strftime("%Y-%m-%d %H:%M:%S")))
-    files = ResponseFile.objects.filter(
-        question__theme__questionnaire__control=control,
-        created__gt=date_cutoff,
-    )
+def get_files(control, reporting_state, last_file_id=None):
+    """
+    Files uploaded to the control after its last report, up to last_file_id.
+    """
+    files = ResponseFile.objects.filter(control=control)
+    if reporting_state is None:
+        date_cutoff = get_date_cutoff(reporting_state)
+        logger.info("Recherche des fichiers téléversés après le {}".format(
+            date_cutoff.strftime("%Y-%m-%d %H:%M:%S")))
+        files = files.filter(created__gt=date_cutoff)
+    else:
+        logger.info(f'Recherche des fichiers après le fichier {reporting_state.last_file_id}')
+        files = files.filter(id__gt=reporting_state.last_file_id)
+    if last_file_id is not None:
+        files = files.filter(id__lte=last_file_id)
     logger.info(f'Fichiers trouvés : {len(files)}')
     return files
 
 
+def get_last_new_file_ids():
+    """
+    Id of the last file uploaded after the last report of each active control with a
+    recipient, by control id. The controls without new file are left out by the query.
+    """
+    recipients = Access.objects.filter(
+        control=OuterRef('control_id'), userprofile__send_files_report=True,
+        userprofile__files_report_digest=False)
+    new_files = ResponseFile.objects \
+        .filter(
+            Q(control__reporting_state__isnull=True, created__gt=get_date_cutoff(None)) |
+            Q(id__gt=F('control__reporting_state__last_file_id'))) \
+        .filter(control__in=Control.objects.active()) \
+        .filter(Exists(recipients))
+    return dict(
+        new_files.order_by('control_id').values_list('control_id').annotate(Max('id')))
+
+
+def get_new_digest_files(profile_ids=None):
+    """
+    Files uploaded to the active controls of the users who opted in to the digest, after
+    their last digest, annotated with the id of the user. A file of a control is returned
+    once per such user with access to it.
+    The conditions on the access are in one filter, so that they apply to the same access.
+    """
+    conditions = {
+        'control__access__userprofile__send_files_report': True,
+        'control__access__userprofile__files_report_digest': True,
+    }
+    if profile_ids is not None:
+        conditions['control__access__userprofile__in'] = profile_ids
+    return ResponseFile.objects \
+        .filter(
+            Q(control__access__userprofile__digest_state__isnull=True,
+              created__gt=get_date_cutoff(None)) |
+            Q(id__gt=F('control__access__userprofile__digest_state__last_file_id')),
+            control__in=Control.objects.active(),
+            **conditions) \
+        .annotate(recipient_id=F('control__access__userprofile_id'))
+
+
+def get_last_new_digest_file_ids():
+    """
+    Id of the last file uploaded after the last digest of each user who opted in to it,
+    by user id. The users without new file are left out by the query.
+    """
+    return dict(
+        get_new_digest_files().order_by('recipient_id').values_list('recipient_id')
+        .annotate(Max('id')))
+
+
 @app.task(queue=settings.CELERY_QUEUE)
 def send_files_report():
+    """
+    Start a run of the files report : the report of each active control with new files
+    and a recipient is sent by its own task, and the digests of the users who opted in to
+    them by batches of FILES_REPORT_DIGEST_BATCH_SIZE users. The emails are spaced by the
+    shared rate limiter.
+    """
+    last_new_file_ids = get_last_new_file_ids()
+    last_new_digest_file_ids = list(get_last_new_digest_file_ids().items())
+    run = FilesReportRun.objects.create(
+        controls=len(last_new_file_ids), digests=len(last_new_digest_file_ids))
+    if not last_new_file_ids and not last_new_digest_file_ids:
+        run.finished_at = timezone.now()
+        run.save(update_fields=('finished_at', 'modified'))
+    logger.info(
+        f'Envoi {run.id} : {len(last_new_file_ids)} contrôles, '
+        f'{len(last_new_digest_file_ids)} rapports groupés')
+    for control_id, last_file_id in last_new_file_ids.items():
+        send_control_files_report.delay(control_id, last_file_id, run_id=run.id)
+    batch_size = settings.FILES_REPORT_DIGEST_BATCH_SIZE
+    for start in range(0, len(last_new_digest_file_ids), batch_size):
+        send_files_digests.delay(
+            last_new_digest_file_ids[start:start + batch_size], run_id=run.id)
+    return run.id
+
+
+def claim_delivery(delivery, last_file_id):
+    """
+    Mark the delivery, of the files up to last_file_id, as being sent, unless it was sent,
+    or is being sent, meanwhile. Return whether it was claimed.
+    """
+    claimable_status = (FilesReportDelivery.PENDING, FilesReportDelivery.FAILED)
+    claimed = FilesReportDelivery.objects \
+        .filter(id=delivery.id, status__in=claimable_status) \
+        .update(status=FilesReportDelivery.SENDING, attempts=F('attempts') + 1,
+                last_file_id=last_file_id, modified=timezone.now())
+    delivery.last_file_id = last_file_id
+    return bool(claimed)
+
+
+@app.task(bind=True, queue=settings.CELERY_QUEUE)
+def send_control_files_report(self, control_id, last_file_id=None, run_id=None, attempt=0):
+    """
+    Send the report of the files uploaded to the control since the last report, up to
+    last_file_id if given, then move its reporting state forward.
+    The report is sent once the rate limiter lets it through, and sent again later, with
+    an increasing delay, if it could not be sent.
+    """
     html_template = 'reporting/email/files_report.html'
     text_template = 'reporting/email/files_report.txt'
-    for control in Control.objects.all():
-        logger.info(f'Contrôle : {control.id}')
-        if control.depositing_organization:
-            subject = control.depositing_organization
-        else:
-            subject = control.title
-        subject += ' - de nouveaux documents déposés !'
-        files = get_files(control)
-        if not files:
-            logger.info(f'Pas de nouveau document, arrêt.')
-            continue
-        recipient_list = [
-            access.userprofile.user.email
-            for access in control.access.all()
-            if access.userprofile.send_files_report==True
-        ]
-        if not recipient_list:
-            logger.info(f'Pas de destinataire, arrêt.')
-            continue
-        logger.debug(f'Destinataires : {len(recipient_list)}')
-        date_cutoff = get_date_cutoff(control)
-        context = {
-            'control': control,
-            'date_cutoff': date_cutoff.strftime("%A %d %B %Y"),
-            'files': files,
-        }
-        number_of_sent_email = send_email(
-            to=recipient_list,
-            subject=subject,
-            html_template=html_template,
-            text_template=text_template,
-            extra_context=context,
-        )
-        logger.info(f"{number_of_sent_email} emails envoyés.")
-        number_of_recipients = len(recipient_list)
-        if number_of_sent_email != number_of_recipients:
-            logger.warning(
-                f'Il y avait {number_of_recipients} destinataires(s), '
-                f'et {number_of_sent_email} email(s) envoyé(s).')
-        if number_of_sent_email > 0:
-            logger.info(f'Email envoyé pour le contrôle {control.id}')
-            action.send(sender=control, verb=ACTION_LOG_REPORT_VERB_SENT)
-        else:
-            logger.info(f'Aucun email envoyé pour le contrôle {control.id}')
-            action.send(sender=control, verb=ACTION_LOG_REPORT_VERB_NOT_SENT)
+    control = Control.objects.select_related('reporting_state').get(id=control_id)
+    reporting_state = get_reporting_state(control)
+    logger.info(f'Contrôle : {control.id}')
+    if control.depositing_organization:
+        subject = control.depositing_organization
+    else:
+        subject = control.title
+    subject += ' - de nouveaux documents déposés !'
+    files = get_files(control, reporting_state, last_file_id)
+    if not files:
+        logger.info(f'Pas de nouveau document, arrêt.')
+        return count_outcome(run_id, FilesReportRun.SKIPPED)
+    recipient_list = [
+        access.userprofile.user.email
+        for access in control.access.all()
+        if access.userprofile.send_files_report==True
+        and not access.userprofile.files_report_digest
+    ]
+    if not recipient_list:
+        logger.info(f'Pas de destinataire, arrêt.')
+        return count_outcome(run_id, FilesReportRun.SKIPPED)
+    logger.debug(f'Destinataires : {len(recipient_list)}')
+    date_cutoff = get_date_cutoff(reporting_state)
+    delivery, created = FilesReportDelivery.objects.get_or_create(
+        key=FilesReportDelivery.make_key(control, reporting_state),
+        defaults={'control': control, 'run_id': run_id, 'recipients': len(recipient_list)})
+    if delivery.status in (FilesReportDelivery.SENDING, FilesReportDelivery.SENT):
+        # The sending may have been interrupted : the report is not sent again.
+        logger.info(f'Rapport déjà envoyé : {delivery}')
+        ReportingState.advance(control.id, delivery.last_file_id, delivery.modified)
+        return count_outcome(run_id, FilesReportRun.SKIPPED)
+
+    wait = get_email_rate_limiter().acquire()
+    if wait:
+        logger.debug(f'Attente de {wait:.1f}s avant reporting pour le contrôle {control.id}')
+        raise self.retry(countdown=wait, max_retries=None)
+    if not claim_delivery(delivery, max(file.id for file in files)):
+        logger.info(f'Rapport déjà envoyé : {delivery}')
+        return count_outcome(run_id, FilesReportRun.SKIPPED)
+
+    context = {
+        'control': control,
+        'date_cutoff': date_cutoff.strftime("%A %d %B %Y"),
+        'files': files,
+    }
+    [number_of_sent_email] = send_emails(
+        [{'to': recipient_list, 'subject': subject, 'extra_context': context}],
+        html_template=html_template,
+        text_template=text_template,
+    )
+    logger.info(f"{number_of_sent_email} emails envoyés.")
+    number_of_recipients = len(recipient_list)
+    if number_of_sent_email != number_of_recipients:
+        logger.warning(
+            f'Il y avait {number_of_recipients} destinataires(s), '
+            f'et {number_of_sent_email} email(s) envoyé(s).')
+    if number_of_sent_email > 0:
+        logger.info(f'Email envoyé pour le contrôle {control.id}')
+        with transaction.atomic():
+            delivery.status = FilesReportDelivery.SENT
+            delivery.save(update_fields=('status', 'modified'))
+            ReportingState.advance(control.id, delivery.last_file_id, delivery.modified)
+        action.send(sender=control, verb=ACTION_LOG_REPORT_VERB_SENT)
+        return count_outcome(run_id, FilesReportRun.SENT)
 
-        EMAIL_SPACING_TIME_SECONDS = settings.EMAIL_SPACING_TIME_MILLIS / 1000
+    delivery.status = FilesReportDelivery.FAILED
+    delivery.save(update_fields=('status', 'modified'))
+    if attempt < settings.FILES_REPORT_MAX_RETRIES:
+        countdown = settings.FILES_REPORT_RETRY_DELAY_SECONDS * 2 ** attempt
         logger.info(
-            f'Attente de {EMAIL_SPACING_TIME_SECONDS}s après reporting pour le contrôle {control.id}')
-        time.sleep(EMAIL_SPACING_TIME_SECONDS)
+            f'Aucun email envoyé pour le contrôle {control.id}, nouvel essai dans {countdown}s')
+        raise self.retry(
+            args=(control_id, last_file_id), kwargs={'run_id': run_id, 'attempt': attempt + 1},
+            countdown=countdown, max_retries=None)
+    logger.info(f'Aucun email envoyé pour le contrôle {control.id}')
+    action.send(sender=control, verb=ACTION_LOG_REPORT_VERB_NOT_SENT)
+    return count_outcome(run_id, FilesReportRun.FAILED)
+
+
+def count_outcome(run_id, outcome, count=1):
+    if run_id is not None and count:
+        FilesReportRun.count_outcome(run_id, outcome, count)
+    return outcome
+
+
+def get_digest_state(userprofile):
+    try:
+        return userprofile.digest_state
+    except DigestState.DoesNotExist:
+        return None
+
+
+def group_digest_files(profile_ids, last_file_ids):
+    """
+    New files of each user, up to their last_file_id, grouped by control : the files of
+    the whole batch are fetched by one query.
+    """
+    files = get_new_digest_files(profile_ids) \
+        .filter(id__lte=max(last_file_ids.values())) \
+        .select_related('control', 'questionnaire', 'question__theme', 'author') \
+        .order_by('control_id', 'id')
+    controls_by_profile = {profile_id: {} for profile_id in profile_ids}
+    for file in files:
+        if file.id <= last_file_ids[file.recipient_id]:
+            controls = controls_by_profile[file.recipient_id]
+            controls.setdefault(file.control, []).append(file)
+    return controls_by_profile
+
+
+@app.task(bind=True, queue=settings.CELERY_QUEUE)
+def send_files_digests(self, digests, run_id=None, attempt=0):
+    """
+    Send to each user of the batch the digest of the files uploaded to all their controls
+    since their last digest, up to the given last file id, then move their digest state
+    forward. digests is a list of (user id, last file id).
+    The emails are sent over one SMTP connection, once the rate limiter lets each of them
+    through : when it does not, the rest of the batch is sent later. The digests which
+    could not be sent are sent again later, with an increasing delay.
+    """
+    html_template = 'reporting/email/files_digest.html'
+    text_template = 'reporting/email/files_digest.txt'
+    last_file_ids = {profile_id: last_file_id for profile_id, last_file_id in digests}
+    profile_ids = list(last_file_ids)
+    logger.info(f'Rapports groupés : {len(profile_ids)} utilisateurs')
+    profiles = UserProfile.objects \
+        .select_related('user', 'digest_state') \
+        .in_bulk(profile_ids)
+    controls_by_profile = group_digest_files(profile_ids, last_file_ids)
+    outcomes = Counter()
+    failed = []
+    try:
+        with EmailBatch(text_template, html_template) as batch:
+            for index, profile_id in enumerate(profile_ids):
+                profile = profiles.get(profile_id)
+                controls = controls_by_profile[profile_id]
+                if profile is None or not controls:
+                    logger.info(f'Pas de nouveau document pour {profile_id}, arrêt.')
+                    outcomes[FilesReportRun.SKIPPED] += 1
+                    continue
+                digest_state = get_digest_state(profile)
+                delivery, created = FilesReportDelivery.objects.get_or_create(
+                    key=FilesReportDelivery.make_digest_key(profile, digest_state),
+                    defaults={'userprofile': profile, 'run_id': run_id, 'recipients': 1})
+                if delivery.status in (FilesReportDelivery.SENDING, FilesReportDelivery.SENT):
+                    # The sending may have been interrupted : the digest is not sent again.
+                    logger.info(f'Rapport déjà envoyé : {delivery}')
+                    DigestState.advance(profile.pk, delivery.last_file_id, delivery.modified)
+                    outcomes[FilesReportRun.SKIPPED] += 1
+                    continue
+
+                wait = get_email_rate_limiter().acquire()
+                if wait:
+                    logger.debug(
+                        f'Attente de {wait:.1f}s avant les rapports groupés restants')
+                    raise self.retry(
+                        args=(digests[index:],), kwargs={'run_id': run_id, 'attempt': attempt},
+                        countdown=wait, max_retries=None)
+                last_file_id = max(file.id for files in controls.values() for file in files)
+                if not claim_delivery(delivery, last_file_id):
+                    logger.info(f'Rapport déjà envoyé : {delivery}')
+                    outcomes[FilesReportRun.SKIPPED] += 1
+                    continue
+
+                context = {
+                    'controls': list(controls.items()),
+                    'date_cutoff': get_date_cutoff(digest_state).strftime("%A %d %B %Y"),
+                }
+                number_of_sent_email = batch.send(
+                    to=[profile.user.email],
+                    subject='De nouveaux documents déposés dans vos espaces !',
+                    extra_context=context,
+                )
+                if number_of_sent_email > 0:
+                    logger.info(f'Rapport groupé envoyé à {profile_id}')
+                    with transaction.atomic():
+                        delivery.status = FilesReportDelivery.SENT
+                        delivery.save(update_fields=('status', 'modified'))
+                        DigestState.advance(profile.pk, last_file_id, delivery.modified)
+                    action.send(sender=profile.user, verb=ACTION_LOG_DIGEST_VERB_SENT)
+                    outcomes[FilesReportRun.SENT] += 1
+                    continue
+
+                delivery.status = FilesReportDelivery.FAILED
+                delivery.save(update_fields=('status', 'modified'))
+                if attempt < settings.FILES_REPORT_MAX_RETRIES:
+                    failed.append((profile_id, last_file_ids[profile_id]))
+                else:
+                    logger.info(f'Aucun rapport groupé envoyé à {profile_id}')
+                    action.send(sender=profile.user, verb=ACTION_LOG_DIGEST_VERB_NOT_SENT)
+                    outcomes[FilesReportRun.FAILED] += 1
+    finally:
+        # The outcomes are counted once per batch, or per part of a batch.
+        for outcome, count in outcomes.items():
+            count_outcome(run_id, outcome, count)
+        if failed:
+            countdown = settings.FILES_REPORT_RETRY_DELAY_SECONDS * 2 ** attempt
+            logger.info(
+                f'{len(failed)} rapports groupés non envoyés, nouvel essai dans {countdown}s')
+            send_files_digests.apply_async(
+                args=(failed,), kwargs={'run_id': run_id, 'attempt': attempt + 1},
+                countdown=countdown)
+    return dict(outcomes)
+
+
+def get_jours_echeance():
+    """
+    Nombre de jours avant l'échéance de la relance principale : le paramètre
+    JOURS_ECHEANCE, ou bien le réglage du même nom.
+    """
+    jours_echeance = Parametre.objects \
+        .filter(code="JOURS_ECHEANCE").filter(deleted_at__isnull=True).first()
+    try:
+        return int(jours_echeance.name)
+    except:
+        return int(settings.JOURS_ECHEANCE)
+
+
+def get_due_date_recipients(questionnaires):
+    """
+    Emails of the users with access to the control of each questionnaire, by control id,
+    fetched by one query.
+    """
+    recipients = defaultdict(list)
+    accesses = Access.objects \
+        .filter(control__in={questionnaire.control_id for questionnaire in questionnaires}) \
+        .order_by('id') \
+        .values_list('control_id', 'userprofile__user__email')
+    for control_id, email in accesses:
+        recipients[control_id].append(email)
+    return recipients
 
 
 @app.task(queue=settings.CELERY_QUEUE)
 def send_notifs_dates_echeances():
+    """
+    Remind the users of the questionnaires whose answer is due in JOURS_ECHEANCE days, or
+    in one of the JOURS_ECHEANCE_RELANCES days, which are negative once it is overdue. All
+    the reminders of the day are found by one query on the index of end_date.
+    """
     html_template = "reporting/email/notif_date_echeance.html"
     text_template = "reporting/email/notif_date_echeance.txt"
-    jours_echeance = Parametre.objects.filter(code="JOURS_ECHEANCE").filter(deleted_at__isnull=True).first()
-    try:
-        jours_echeance = int(jours_echeance.name)
-    except:
-        jours_echeance = settings.JOURS_ECHEANCE
-    logger.info(f"Jours : {jours_echeance}")
-    for questionnaire in Questionnaire.objects.filter(end_date__isnull=False).all():
-        date_relance = questionnaire.end_date - timedelta(days=jours_echeance)
-        if date_relance == date.today():
-            logger.info(f"Questionnaire : {questionnaire.id}")
-            if questionnaire.control.depositing_organization:
-                subject = questionnaire.control.depositing_organization
-            else:
-                subject = questionnaire.control.title
-            subject += f" - Questionnaire : {questionnaire.title}"
+    jours_echeance = get_jours_echeance()
+    offsets = {jours_echeance, *settings.JOURS_ECHEANCE_RELANCES}
+    logger.info(f"Jours : {sorted(offsets, reverse=True)}")
+    today = date.today()
+    offsets_by_due_date = {today + timedelta(days=offset): offset for offset in offsets}
+    questionnaires = list(
+        Questionnaire.objects.due_on(offsets_by_due_date)
+        .select_related('control')
+        .order_by('end_date', 'id'))
+    recipients = get_due_date_recipients(questionnaires)
+    reminded_questionnaires = []
+    messages = []
+    for questionnaire in questionnaires:
+        jours_restants = offsets_by_due_date[questionnaire.end_date]
+        logger.info(f"Questionnaire : {questionnaire.id} ({jours_restants} jours)")
+        if questionnaire.control.depositing_organization:
+            subject = questionnaire.control.depositing_organization
+        else:
+            subject = questionnaire.control.title
+        subject += f" - Questionnaire : {questionnaire.title}"
+        if jours_restants < 0:
+            subject += " - la date de réponse est dépassée."
+        else:
             subject += " - la date de réponse arrive bientôt à échéance."
-            recipient_list = [
-                access.userprofile.user.email
-                for access in questionnaire.control.access.all()
-            ]
-            if not recipient_list:
-                logger.info(f"Pas de destinataire, arrêt.")
-                continue
-            logger.debug(f"Destinataires : {len(recipient_list)}")
-            context = {
-                "questionnaire": questionnaire,
-                "jours_echeance": jours_echeance,
-            }
-            number_of_sent_email = send_email(
-                to=recipient_list,
-                subject=subject,
-                html_template=html_template,
-                text_template=text_template,
-                extra_context=context,
+        recipient_list = recipients[questionnaire.control_id]
+        if not recipient_list:
+            logger.info(f"Pas de destinataire, arrêt.")
+            continue
+        logger.debug(f"Destinataires : {len(recipient_list)}")
+        context = {
+            "questionnaire": questionnaire,
+            "jours_echeance": jours_restants,
+        }
+        reminded_questionnaires.append(questionnaire)
+        messages.append({"to": recipient_list, "subject": subject, "extra_context": context})
+    # The reminders of the day are sent over one SMTP connection.
+    results = send_emails(messages, html_template=html_template, text_template=text_template)
+    for questionnaire, message, number_of_sent_email in zip(
+            reminded_questionnaires, messages, results):
+        logger.info(f"{number_of_sent_email} emails envoyés.")
+        number_of_recipients = len(message["to"])
+        if number_of_sent_email != number_of_recipients:
+            logger.warning(
+                f"Il y avait {number_of_recipients} destinataires(s), "
+                f"et {number_of_sent_email} email(s) envoyé(s)."
             )
-            logger.info(f"{number_of_sent_email} emails envoyés.")
-            number_of_recipients = len(recipient_list)
-            if number_of_sent_email != number_of_recipients:
-                logger.warning(
-                    f"Il y avait {number_of_recipients} destinataires(s), "
-                    f"et {number_of_sent_email} email(s) envoyé(s)."
-                )
-            if number_of_sent_email > 0:
-                logger.info(f"Email envoyé pour le questionnaire {questionnaire.id}")
-                action.send(sender=questionnaire, verb=ACTION_LOG_DUE_VERB_SENT)
-            else:
-                logger.info(f"Aucun email envoyé pour le questionnaire {questionnaire.id}")
-                action.send(sender=questionnaire, verb=ACTION_LOG_DUE_VERB_NOT_SENT)
+        if number_of_sent_email > 0:
+            logger.info(f"Email envoyé pour le questionnaire {questionnaire.id}")
+            action.send(sender=questionnaire, verb=ACTION_LOG_DUE_VERB_SENT)
+        else:
+            logger.info(f"Aucun email envoyé pour le questionnaire {questionnaire.id}")
+            action.send(sender=questionnaire, verb=ACTION_LOG_DUE_VERB_NOT_SENT)
@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+
+from pytest import mark
+
+from django.core import mail
+from django.utils import timezone
+
+from actstream.models import Action
+from reporting import tasks
+from reporting.tasks import send_notifs_dates_echeances
+from tests import factories
+from user_profiles.models import Access, UserProfile
+
+
+pytestmark = mark.django_db
+
+
+def make_questionnaire_due_in(days, **kwargs):
+    kwargs.setdefault('is_draft', False)
+    questionnaire = factories.QuestionnaireFactory(
+        end_date=date.today() + timedelta(days=days), **kwargs)
+    factories.AccessFactory(
+        userprofile=factories.UserProfileFactory(profile_type=UserProfile.AUDITED),
+        control=questionnaire.control,
+        access_type=Access.REPONDANT,
+    )
+    return questionnaire
+
+
+def test_reminders_are_sent_for_each_offset(settings):
+    settings.JOURS_ECHEANCE = 7
+    settings.JOURS_ECHEANCE_RELANCES = [1, -1]
+    due_in_a_week = make_questionnaire_due_in(7)
+    due_tomorrow = make_questionnaire_due_in(1)
+    overdue = make_questionnaire_due_in(-1)
+    make_questionnaire_due_in(3)
+    count_emails_before = len(mail.outbox)
+
+    send_notifs_dates_echeances()
+
+    emails = mail.outbox[count_emails_before:]
+    assert len(emails) == 3
+    assert [email.subject.endswith('dépassée.') for email in emails] == [True, False, False]
+    assert '1 jour.' in emails[1].body and '7 jours.' in emails[2].body
+    reminded = Action.objects.filter(verb=tasks.ACTION_LOG_DUE_VERB_SENT)
+    assert {action.actor for action in reminded} == {due_in_a_week, due_tomorrow, overdue}
+
+
+def test_reminders_skip_drafts_finalized_questionnaires_and_deleted_controls(settings):
+    settings.JOURS_ECHEANCE = 7
+    settings.JOURS_ECHEANCE_RELANCES = []
+    make_questionnaire_due_in(7, is_draft=True)
+    make_questionnaire_due_in(7, is_finalized=True)
+    deleted = make_questionnaire_due_in(7)
+    deleted.control.deleted_at = timezone.now()
+    deleted.control.save()
+    count_emails_before = len(mail.outbox)
+
+    send_notifs_dates_echeances()
+
+    assert len(mail.outbox) == count_emails_before
+
+
+def test_reminder_is_sent_to_all_the_users_of_the_control(settings):
+    settings.JOURS_ECHEANCE = 7
+    questionnaire = make_questionnaire_due_in(7)
+    factories.AccessFactory(
+        userprofile=factories.UserProfileFactory(profile_type=UserProfile.INSPECTOR),
+        control=questionnaire.control,
+        access_type=Access.DEMANDEUR,
+    )
+    count_emails_before = len(mail.outbox)
+
+    send_notifs_dates_echeances()
+
+    assert len(mail.outbox[count_emails_before].to) == 2
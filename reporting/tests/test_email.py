@@ -1,9 +1,17 @@
-from pytest import mark
+from celery.exceptions import Retry
+from pytest import fixture, mark, raises
 
 from django.contrib.auth import get_user_model
 from django.core import mail
 
-from reporting.tasks import send_files_report
+from actstream.models import Action
+from ecc.celery import app
+from reporting import rate_limit, tasks
+from reporting.models import DigestState, FilesReportDelivery, FilesReportRun, ReportingState
+from reporting.rate_limit import get_email_rate_limiter
+from reporting.tasks import (
+    get_last_new_digest_file_ids, get_last_new_file_ids, send_control_files_report,
+    send_files_digests, send_files_report)
 from tests import factories
 from user_profiles.models import Access, UserProfile
 
@@ -13,6 +21,30 @@ pytestmark = mark.django_db
 User = get_user_model()
 
 
+@fixture(autouse=True)
+def eager_tasks(settings, monkeypatch):
+    """
+    Run the tasks of the controls when they are queued, with a rate limiter in memory.
+    """
+    settings.EMAIL_RATE_LIMITER = 'reporting.rate_limit.MemoryTokenBucket'
+    settings.EMAIL_RATE_LIMIT_BURST = 10
+    monkeypatch.setattr(rate_limit, '_rate_limiters', {})
+    monkeypatch.setattr(app.conf, 'task_always_eager', True)
+
+
+def make_control_with_new_file(send_files_report=True):
+    response_file = factories.ResponseFileFactory()
+    inspector = factories.UserProfileFactory(profile_type=UserProfile.INSPECTOR)
+    factories.AccessFactory(
+        userprofile=inspector,
+        control=response_file.question.theme.questionnaire.control,
+        access_type=Access.DEMANDEUR,
+    )
+    inspector.send_files_report = send_files_report
+    inspector.save()
+    return response_file.control
+
+
 def test_email_is_sent_if_there_is_a_response_file():
     response_file = factories.ResponseFileFactory()
     inspector = factories.UserProfileFactory(profile_type=UserProfile.INSPECTOR)
@@ -43,3 +75,155 @@ def test_email_is_not_sent_if_sending_flag_is_disabled():
     send_files_report()
     count_emails_after = len(mail.outbox)
     assert count_emails_after == count_emails_before
+
+
+def test_run_counts_the_outcome_of_each_control(settings, monkeypatch):
+    settings.FILES_REPORT_MAX_RETRIES = 0
+    make_control_with_new_file()
+    make_control_with_new_file()
+    results = [1, 0]
+    monkeypatch.setattr(tasks, 'send_emails', lambda messages, **kwargs: [results.pop(0)])
+
+    send_files_report()
+
+    run = FilesReportRun.objects.get()
+    assert (run.controls, run.sent, run.skipped, run.failed) == (2, 1, 0, 1)
+    assert run.finished_at is not None
+
+
+def test_only_the_controls_with_new_files_are_reported():
+    control = make_control_with_new_file()
+    control_without_file = make_control_with_new_file()
+    control_without_file.response_files.all().delete()
+    make_control_with_new_file(send_files_report=False)
+
+    assert list(get_last_new_file_ids()) == [control.id]
+
+
+def test_report_moves_the_watermark_of_the_control():
+    control = make_control_with_new_file()
+    count_emails_before = len(mail.outbox)
+
+    send_files_report()
+    send_files_report()
+
+    state = ReportingState.objects.get(control=control)
+    assert state.last_file_id == control.response_files.get().id
+    assert len(mail.outbox) == count_emails_before + 1
+    assert FilesReportRun.objects.filter(controls=0).count() == 1
+
+    new_file = factories.ResponseFileFactory(question=control.response_files.get().question)
+    assert get_last_new_file_ids() == {control.id: new_file.id}
+
+
+def test_interrupted_report_is_not_sent_again():
+    control = make_control_with_new_file()
+    last_file_id = control.response_files.get().id
+    FilesReportDelivery.objects.create(
+        key=FilesReportDelivery.make_key(control, None), control=control,
+        status=FilesReportDelivery.SENDING, last_file_id=last_file_id)
+    count_emails_before = len(mail.outbox)
+
+    send_files_report()
+
+    assert len(mail.outbox) == count_emails_before
+    assert ReportingState.objects.get(control=control).last_file_id == last_file_id
+    assert FilesReportRun.objects.get().skipped == 1
+
+
+def test_report_is_sent_again_when_it_fails(monkeypatch):
+    make_control_with_new_file()
+    results = [0, 1]
+    monkeypatch.setattr(tasks, 'send_emails', lambda messages, **kwargs: [results.pop(0)])
+
+    send_files_report()
+
+    delivery = FilesReportDelivery.objects.get()
+    assert (delivery.status, delivery.attempts) == (FilesReportDelivery.SENT, 2)
+    assert FilesReportRun.objects.get().sent == 1
+
+
+def test_report_is_given_up_after_the_last_retry(settings, monkeypatch):
+    settings.FILES_REPORT_MAX_RETRIES = 2
+    control = make_control_with_new_file()
+    monkeypatch.setattr(tasks, 'send_emails', lambda messages, **kwargs: [0])
+
+    send_files_report()
+
+    delivery = FilesReportDelivery.objects.get()
+    assert (delivery.status, delivery.attempts) == (FilesReportDelivery.FAILED, 3)
+    assert FilesReportRun.objects.get().failed == 1
+    assert Action.objects.filter(verb=tasks.ACTION_LOG_REPORT_VERB_NOT_SENT).get().actor == control
+
+
+def test_report_waits_for_the_rate_limiter(settings):
+    settings.EMAIL_RATE_LIMIT_BURST = 1
+    control = make_control_with_new_file()
+    get_email_rate_limiter().acquire()
+    count_emails_before = len(mail.outbox)
+
+    with raises(Retry):
+        send_control_files_report(control.id)
+
+    assert len(mail.outbox) == count_emails_before
+    assert FilesReportDelivery.objects.get().status == FilesReportDelivery.PENDING
+
+
+def make_digest_user(*controls):
+    inspector = factories.UserProfileFactory(
+        profile_type=UserProfile.INSPECTOR, send_files_report=True, files_report_digest=True)
+    for control in controls:
+        factories.AccessFactory(
+            userprofile=inspector, control=control, access_type=Access.DEMANDEUR)
+    return inspector
+
+
+def test_digest_groups_the_new_files_of_all_the_controls_of_the_user():
+    control = make_control_with_new_file()
+    other_control = make_control_with_new_file()
+    inspector = make_digest_user(control, other_control)
+    count_emails_before = len(mail.outbox)
+
+    send_files_report()
+
+    digests = [email for email in mail.outbox if email.to == [inspector.user.email]]
+    assert len(digests) == 1
+    assert control.title in digests[0].body and other_control.title in digests[0].body
+    # The other recipients still receive the report of each control.
+    assert len(mail.outbox) == count_emails_before + 3
+    run = FilesReportRun.objects.get()
+    assert (run.controls, run.digests, run.sent) == (2, 1, 3)
+    assert run.finished_at is not None
+
+
+def test_digest_moves_the_watermark_of_the_user():
+    control = make_control_with_new_file(send_files_report=False)
+    inspector = make_digest_user(control)
+    last_file_id = control.response_files.get().id
+    assert get_last_new_digest_file_ids() == {inspector.pk: last_file_id}
+
+    send_files_report()
+    send_files_report()
+
+    assert DigestState.objects.get(userprofile=inspector).last_file_id == last_file_id
+    assert FilesReportDelivery.objects.get().status == FilesReportDelivery.SENT
+    assert get_last_new_file_ids() == {}
+    assert get_last_new_digest_file_ids() == {}
+
+
+def test_digests_wait_for_the_rate_limiter(settings):
+    settings.EMAIL_RATE_LIMIT_BURST = 1
+    control = make_control_with_new_file(send_files_report=False)
+    first = make_digest_user(control)
+    second = make_digest_user(control)
+    last_file_id = control.response_files.get().id
+    count_emails_before = len(mail.outbox)
+
+    with raises(Retry):
+        send_files_digests([(first.pk, last_file_id), (second.pk, last_file_id)])
+
+    assert len(mail.outbox) == count_emails_before + 1
+    delivery = FilesReportDelivery.objects.get(status=FilesReportDelivery.SENT)
+    assert delivery.userprofile == first
+    assert FilesReportDelivery.objects.get(userprofile=second).status == \
+        FilesReportDelivery.PENDING
@@ -0,0 +1,32 @@
+from reporting.rate_limit import MemoryTokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_lets_a_burst_through_then_spaces_the_tokens():
+    clock = FakeClock()
+    bucket = MemoryTokenBucket(rate=0.5, capacity=2, clock=clock)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 2
+
+    clock.now = 1
+    assert bucket.acquire() == 1
+    clock.now = 2
+    assert bucket.acquire() == 0
+
+
+def test_bucket_is_not_refilled_beyond_its_capacity():
+    clock = FakeClock()
+    bucket = MemoryTokenBucket(rate=1, capacity=2, clock=clock)
+
+    clock.now = 3600
+
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 1]
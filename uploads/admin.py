@@ -0,0 +1,10 @@
+from django.contrib import admin
+
+from .models import UploadSession
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'user', 'filename', 'offset', 'size', 'created', 'modified')
+    list_filter = ('kind',)
+    raw_id_fields = ('user', 'question', 'questionnaire')
@@ -0,0 +1,128 @@
+import io
+
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+
+from control.serializers import (
+    QuestionFileSerializer, QuestionnaireFileSerializer, ResponseFileSerializer)
+
+from .models import UploadSession
+from .resumable import check_new_upload, delete_upload_session, finalize_upload, write_chunk
+from .serializers import UploadSessionSerializer
+from .validation import UploadError, VirusDetected, check_headers
+
+
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+
+FILE_SERIALIZERS = {
+    UploadSession.RESPONSE_FILE: ResponseFileSerializer,
+    UploadSession.QUESTION_FILE: QuestionFileSerializer,
+    UploadSession.QUESTIONNAIRE_FILE: QuestionnaireFileSerializer,
+}
+
+
+def make_error_response(error):
+    return Response({'error': error.message}, status=error.status)
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable uploads of response files, question files and questionnaire files :
+    - POST creates the session, with the kind, parent, filename and size of the file.
+    - PATCH sends a chunk, as an application/offset+octet-stream body, with an
+      Upload-Offset header and an optional "Upload-Checksum: sha256 <base64>" header.
+    - HEAD or GET returns the offset to resume from, in the Upload-Offset header.
+    - POST finalize/ creates the file object, once all the chunks are received.
+    - DELETE abandons the upload.
+    """
+    serializer_class = UploadSessionSerializer
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def check_virus_headers(self):
+        try:
+            check_headers(self.request.headers)
+        except VirusDetected as e:
+            raise PermissionDenied(e.message)
+
+    def check_parent_permissions(self, kind, question, questionnaire):
+        access_rights = self.request.user.profile.access_rights
+        if kind == UploadSession.RESPONSE_FILE:
+            control = question.control
+            if control is None or control.is_deleted or not access_rights.is_repondant(control):
+                raise PermissionDenied("User is not authorized to access this ressource")
+            questionnaires = self.request.user.profile.questionnaires
+            if not questionnaires.filter(id=question.questionnaire_id).exists():
+                raise PermissionDenied("User is not authorized to access this ressource")
+            return
+        questionnaire = questionnaire or question.questionnaire
+        control = questionnaire.control
+        if control is None or control.is_deleted or not access_rights.is_demandeur(control):
+            raise PermissionDenied("User is not authorized to access this ressource")
+        if not questionnaire.is_draft:
+            raise PermissionDenied("Le questionnaire n'est plus un brouillon.")
+
+    def with_upload_headers(self, response, upload_session):
+        response['Upload-Offset'] = upload_session.offset
+        response['Upload-Length'] = upload_session.size
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def create(self, request, *args, **kwargs):
+        self.check_virus_headers()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        self.check_parent_permissions(data['kind'], data['question'], data['questionnaire'])
+        try:
+            check_new_upload(data['filename'], data['size'])
+        except UploadError as e:
+            return make_error_response(e)
+        upload_session = serializer.save(user=request.user)
+        response = Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.with_upload_headers(response, upload_session)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        return self.with_upload_headers(response, self.get_object())
+
+    def partial_update(self, request, *args, **kwargs):
+        upload_session = self.get_object()
+        self.check_virus_headers()
+        if request.content_type != CHUNK_CONTENT_TYPE:
+            return Response(
+                {'error': f"Les morceaux doivent être envoyés en {CHUNK_CONTENT_TYPE}."},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            raise ValidationError("En-tête Upload-Offset manquant ou invalide.")
+        # The body is read as a stream, so that the chunks are not limited by
+        # DATA_UPLOAD_MAX_MEMORY_SIZE, and the size is enforced while reading.
+        stream = request.stream or io.BytesIO()
+        try:
+            upload_session = write_chunk(
+                upload_session, offset, stream, request.headers.get('Upload-Checksum'))
+        except UploadError as e:
+            return self.with_upload_headers(make_error_response(e), self.get_object())
+        response = Response(status=status.HTTP_204_NO_CONTENT)
+        return self.with_upload_headers(response, upload_session)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, *args, **kwargs):
+        upload_session = self.get_object()
+        try:
+            file_object = finalize_upload(upload_session)
+        except UploadError as e:
+            return make_error_response(e)
+        serializer_class = FILE_SERIALIZERS[upload_session.kind]
+        return Response(serializer_class(instance=file_object).data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        delete_upload_session(instance)
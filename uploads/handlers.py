@@ -0,0 +1,59 @@
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import QueryDict
+from django.http.request import HttpHeaders
+from django.utils.datastructures import MultiValueDict
+
+from .validation import (
+    REJECTION_ATTRIBUTE, FileTooLarge, UploadError, check_content, check_filename,
+    check_headers, check_size, get_max_size)
+
+
+# Room left in the Content-Length for the other fields and the multipart boundaries.
+MULTIPART_OVERHEAD = 1048576
+
+
+class ValidatingUploadHandler(FileUploadHandler):
+    """
+    Reject the uploaded files while the request body is received, before they are written
+    to disk by the next handlers of FILE_UPLOAD_HANDLERS : on the Content-Length and the
+    virus headers before the body is read, on the extension before the file is received,
+    on the mime type of its first chunk, and as soon as it exceeds UPLOAD_FILE_MAX_SIZE_MB.
+
+    The rest of the body is then not read, and the file is missing from request.FILES.
+    The error is stored on the request, for the view to return it : see
+    uploads.validation.get_upload_rejection.
+    """
+
+    def reject(self, error):
+        setattr(self.request, REJECTION_ATTRIBUTE, error)
+        raise StopUpload(connection_reset=True)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        try:
+            check_headers(HttpHeaders(META))
+            if content_length > get_max_size() + MULTIPART_OVERHEAD:
+                raise FileTooLarge()
+        except UploadError as e:
+            setattr(self.request, REJECTION_ATTRIBUTE, e)
+            # Returning the data stops the parsing, without reading the body.
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        try:
+            check_filename(self.file_name)
+        except UploadError as e:
+            self.reject(e)
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            if start == 0:
+                check_content(raw_data)
+            check_size(start + len(raw_data))
+        except UploadError as e:
+            self.reject(e)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
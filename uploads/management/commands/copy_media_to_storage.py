@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, get_storage_class
+from django.core.management.base import BaseCommand, CommandError
+
+from uploads.object_storage import copy_media
+
+
+class Command(BaseCommand):
+    help = (
+        "Copie les fichiers de MEDIA_ROOT vers le stockage configuré (DEFAULT_FILE_STORAGE), "
+        "par exemple un stockage objet. Les fichiers déjà copiés sont ignorés : la commande "
+        "peut être relancée jusqu'à la bascule.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--storage', default=settings.DEFAULT_FILE_STORAGE,
+            help="Classe du stockage cible (par défaut DEFAULT_FILE_STORAGE).")
+        parser.add_argument(
+            '--workers', type=int, default=8, help="Nombre de copies en parallèle.")
+
+    def handle(self, *args, **options):
+        source_storage = FileSystemStorage(location=settings.MEDIA_ROOT)
+        target_storage = get_storage_class(options['storage'])()
+        report = copy_media(source_storage, target_storage, workers=options['workers'])
+        self.stdout.write(
+            f"{report['copied']} fichiers copiés, {report['skipped']} déjà présents, "
+            f"{report['failed']} en échec.")
+        if report['failed']:
+            raise CommandError("Des fichiers n'ont pas pu être copiés, voir les logs.")
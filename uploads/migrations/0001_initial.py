@@ -0,0 +1,41 @@
+# Generated by Django 3.2.17 on 2026-10-18 15:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('control', '0057_questionnaire_generated_file_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('kind', models.CharField(choices=[('response-file', 'Fichier déposé'), ('question-file', 'Annexe à une question'), ('questionnaire-file', 'Pièce jointe à un questionnaire')], max_length=255, verbose_name='type')),
+                ('filename', models.CharField(max_length=255, verbose_name='nom du fichier')),
+                ('size', models.BigIntegerField(verbose_name='taille')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='octets reçus')),
+                ('checksum', models.CharField(blank=True, help_text='Si renseignée, le fichier reçu doit avoir cette empreinte.', max_length=64, verbose_name='empreinte SHA-256')),
+                ('question', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='control.question', verbose_name='question')),
+                ('questionnaire', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='control.questionnaire', verbose_name='questionnaire')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='utilisateur')),
+            ],
+            options={
+                'verbose_name': 'Dépôt en cours',
+                'verbose_name_plural': 'Dépôts en cours',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
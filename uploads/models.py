@@ -0,0 +1,80 @@
+import os
+
+from django.conf import settings
+from django.db import models
+
+from model_utils.models import TimeStampedModel
+
+
+class UploadSession(TimeStampedModel):
+    """
+    A file uploaded in several chunks, which can be resumed after a network failure.
+    The chunks are appended to a partial file, or saved one by one in an object storage,
+    which becomes the file of a new response file, question file or questionnaire file
+    when the upload is finalized.
+    """
+    RESPONSE_FILE = 'response-file'
+    QUESTION_FILE = 'question-file'
+    QUESTIONNAIRE_FILE = 'questionnaire-file'
+    KIND = (
+        (RESPONSE_FILE, 'Fichier déposé'),
+        (QUESTION_FILE, 'Annexe à une question'),
+        (QUESTIONNAIRE_FILE, 'Pièce jointe à un questionnaire'),
+    )
+
+    kind = models.CharField("type", max_length=255, choices=KIND)
+    user = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL, verbose_name='utilisateur', related_name='upload_sessions',
+        on_delete=models.CASCADE)
+    question = models.ForeignKey(
+        to='control.Question', verbose_name='question', related_name='upload_sessions',
+        null=True, blank=True, on_delete=models.CASCADE)
+    questionnaire = models.ForeignKey(
+        to='control.Questionnaire', verbose_name='questionnaire', related_name='upload_sessions',
+        null=True, blank=True, on_delete=models.CASCADE)
+    filename = models.CharField("nom du fichier", max_length=255)
+    size = models.BigIntegerField("taille")
+    offset = models.BigIntegerField("octets reçus", default=0)
+    checksum = models.CharField(
+        "empreinte SHA-256", max_length=64, blank=True,
+        help_text="Si renseignée, le fichier reçu doit avoir cette empreinte.")
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = "Dépôt en cours"
+        verbose_name_plural = "Dépôts en cours"
+
+    @property
+    def partial_path(self):
+        """
+        Absolute path of the partial file. It is in the media folder, for the finalized
+        file to be moved to its place without being copied.
+        """
+        return os.path.join(settings.MEDIA_ROOT, 'UPLOADS', f'{self.id}.part')
+
+    @property
+    def chunks_folder(self):
+        """
+        Folder of the chunks in a storage without local paths, e.g. an object storage : each
+        chunk is saved there under its offset, as the chunks may be received by different
+        servers.
+        """
+        return f'UPLOADS/{self.id}'
+
+    def get_chunk_name(self, offset):
+        # The offset is padded, for the names to be sorted in the order of the chunks.
+        return f'{self.chunks_folder}/{offset:020}'
+
+    @property
+    def control(self):
+        if self.question_id:
+            return self.question.control
+        return self.questionnaire.control
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+    def __str__(self):
+        return f'[ID{self.id}] {self.get_kind_display()} - {self.filename} ' \
+               f'({self.offset}/{self.size})'
@@ -0,0 +1,123 @@
+"""
+Storage of the media in an S3-compatible object storage (Scality, Ceph, MinIO...), enabled
+with DEFAULT_FILE_STORAGE = 'uploads.object_storage.ObjectStorage'. The web servers then
+share the media without a shared filesystem, and the files are downloaded from the object
+storage itself, through short-lived signed URLs.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from boto3.s3.transfer import TransferConfig
+from django.conf import settings
+from django.core.files import File
+from storages.backends.s3boto3 import S3Boto3Storage
+
+
+logger = logging.getLogger(__name__)
+
+MEGABYTE = 1024 * 1024
+
+# Folders of MEDIA_ROOT which are not media : the content stored once by
+# uploads.storage.DeduplicatedStorage, and the partial files of the resumable uploads.
+LOCAL_FOLDERS = ('BLOBS', 'UPLOADS')
+
+
+class NonClosingFile(File):
+    """
+    boto3 closes the files it uploads, which are still read once saved, e.g. the uploaded
+    file of a request : the file given to boto3 is not closed.
+    """
+
+    def close(self):
+        pass
+
+
+class ObjectStorage(S3Boto3Storage):
+    """
+    The bucket and its endpoint are configured by the AWS_* settings of django-storages.
+    The files are never overwritten, as on the local storage, and the large files are
+    sent in parts of AWS_S3_MULTIPART_CHUNK_SIZE_MB.
+    """
+    file_overwrite = False
+    default_acl = None
+
+    def __init__(self, **settings_overrides):
+        super().__init__(**settings_overrides)
+        chunk_size = settings.AWS_S3_MULTIPART_CHUNK_SIZE_MB * MEGABYTE
+        self._transfer_config = TransferConfig(
+            multipart_threshold=chunk_size, multipart_chunksize=chunk_size,
+            use_threads=self.use_threads)
+
+    def _save(self, name, content):
+        return super()._save(name, NonClosingFile(content, name=name))
+
+    def get_download_url(self, name, filename):
+        """
+        Signed URL downloading the file as an attachment named filename. It expires after
+        AWS_QUERYSTRING_EXPIRE seconds.
+        """
+        content_disposition = f"attachment; filename*=utf-8''{quote(filename)}"
+        return self.url(name, parameters={'ResponseContentDisposition': content_disposition})
+
+    def move(self, source_name, target_name):
+        """
+        Rename a file : the object is copied by the object storage, in parts if it is
+        large, then deleted. Raise FileExistsError if target_name exists.
+        """
+        if self.exists(target_name):
+            raise FileExistsError(target_name)
+        copy_source = {'Bucket': self.bucket_name, 'Key': self._normalize_name(source_name)}
+        self.bucket.meta.client.copy(
+            copy_source, self.bucket_name, self._normalize_name(target_name),
+            Config=self._transfer_config)
+        self.delete(source_name)
+
+
+def iter_media_names(source_storage, folder=''):
+    directories, files = source_storage.listdir(folder)
+    for filename in files:
+        yield os.path.join(folder, filename).replace('\\', '/')
+    for directory in directories:
+        if folder or directory not in LOCAL_FOLDERS:
+            yield from iter_media_names(source_storage, os.path.join(folder, directory))
+
+
+def copy_media_file(source_storage, target_storage, name):
+    """
+    Copy the file to target_storage under the same name. Return whether it was copied : a
+    file already copied, with the same size, is skipped.
+    """
+    if target_storage.exists(name) and \
+            target_storage.size(name) == source_storage.size(name):
+        return False
+    with source_storage.open(name, 'rb') as source_file:
+        target_storage._save(name, source_file)
+    return True
+
+
+def copy_media(source_storage, target_storage, workers=8):
+    """
+    Copy all the media of source_storage to target_storage, in parallel. The copy can be
+    run again until the switch to target_storage, to only copy the new files.
+    Return the number of files copied, skipped, and failed.
+    """
+    report = {'copied': 0, 'skipped': 0, 'failed': 0}
+
+    def copy(name):
+        try:
+            return copy_media_file(source_storage, target_storage, name)
+        except Exception:
+            logger.exception(f'Copie impossible du fichier {name}')
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for is_copied in executor.map(copy, iter_media_names(source_storage)):
+            if is_copied is None:
+                report['failed'] += 1
+            elif is_copied:
+                report['copied'] += 1
+            else:
+                report['skipped'] += 1
+    return report
@@ -0,0 +1,370 @@
+"""
+Resumable uploads, in the manner of the tus protocol : an upload session is created with
+the size of the file, its chunks are sent with their offset, then the upload is finalized.
+A failed chunk is sent again from the last offset received, instead of the whole file.
+"""
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from actstream import action
+
+from control.models import QuestionFile, QuestionnaireFile, ResponseFile
+
+from .models import UploadSession
+from .validation import (
+    MIME_TYPE_SAMPLE_SIZE, UploadError, check_content, check_filename, check_size)
+
+
+# The chunks are read from the request and written to disk by blocks of this size.
+BLOCK_SIZE = 65536
+
+# Suffix of the files receiving the chunks, next to the partial files.
+CHUNK_SUFFIX = '.chunk'
+
+# Status of a chunk, or file, that does not match its checksum (tus checksum extension).
+CHECKSUM_MISMATCH_STATUS = 460
+
+MODELS = {
+    UploadSession.RESPONSE_FILE: ResponseFile,
+    UploadSession.QUESTION_FILE: QuestionFile,
+    UploadSession.QUESTIONNAIRE_FILE: QuestionnaireFile,
+}
+
+
+def check_new_upload(filename, size):
+    """
+    Refuse the uploads that would be refused once complete, before any chunk is sent.
+    """
+    check_filename(filename)
+    check_size(size)
+
+
+def parse_checksum(header):
+    """
+    Return the digest of an "Upload-Checksum: sha256 <base64 digest>" header.
+    """
+    try:
+        algorithm, encoded_digest = header.split(' ', 1)
+        digest = base64.b64decode(encoded_digest, validate=True)
+    except ValueError:
+        raise UploadError("En-tête Upload-Checksum invalide.")
+    if algorithm != 'sha256':
+        raise UploadError(f"Algorithme d'empreinte non supporté : {algorithm}")
+    return digest
+
+
+def check_offset(upload_session, offset):
+    if offset != upload_session.offset:
+        raise UploadError(f"Le dépôt doit reprendre à l'octet {upload_session.offset}.", 409)
+
+
+def receive_chunk(upload_session, offset, stream, chunk_file, checksum=None):
+    """
+    Write the chunk read from stream to chunk_file, and return its size.
+    """
+    digest = hashlib.sha256()
+    written = 0
+    for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+        written += len(block)
+        if offset + written > upload_session.size:
+            raise UploadError("Le fichier reçu dépasse la taille annoncée.", 413)
+        digest.update(block)
+        chunk_file.write(block)
+    if checksum is not None and digest.digest() != checksum:
+        raise UploadError(
+            "Le morceau reçu ne correspond pas à son empreinte.", CHECKSUM_MISMATCH_STATUS)
+    return written
+
+
+def get_storage(upload_session):
+    return MODELS[upload_session.kind]._meta.get_field('file').storage
+
+
+def has_local_paths(storage):
+    try:
+        storage.path('')
+    except NotImplementedError:
+        return False
+    return True
+
+
+def get_chunk_names(storage, upload_session):
+    try:
+        return sorted(storage.listdir(upload_session.chunks_folder)[1])
+    except FileNotFoundError:
+        return []
+
+
+def save_chunk(storage, upload_session, offset, chunk_path):
+    """
+    Save the chunk received in chunk_path in the storage, under its offset.
+    """
+    name = upload_session.get_chunk_name(offset)
+    # A chunk saved by a request whose transaction failed afterwards is replaced.
+    storage.delete(name)
+    with open(chunk_path, 'rb') as chunk_file:
+        storage.save(name, File(chunk_file))
+
+
+def join_chunks(storage, upload_session):
+    """
+    Write the chunks saved in the storage to the partial file, in the order of their
+    offsets.
+    """
+    position = 0
+    os.makedirs(os.path.dirname(upload_session.partial_path), exist_ok=True)
+    with open(upload_session.partial_path, 'wb') as partial_file:
+        for chunk_name in get_chunk_names(storage, upload_session):
+            if position == upload_session.size or int(chunk_name) != position:
+                break
+            with storage.open(f'{upload_session.chunks_folder}/{chunk_name}', 'rb') as chunk:
+                shutil.copyfileobj(chunk, partial_file, BLOCK_SIZE)
+            position = partial_file.tell()
+    if position != upload_session.size:
+        raise UploadError(
+            f"Le fichier est incomplet : {position} octets retrouvés "
+            f"sur {upload_session.size}.", 409)
+
+
+def delete_chunks(storage, upload_session):
+    for chunk_name in get_chunk_names(storage, upload_session):
+        storage.delete(f'{upload_session.chunks_folder}/{chunk_name}')
+
+
+def get_partial_size(upload_session):
+    try:
+        return os.path.getsize(upload_session.partial_path)
+    except FileNotFoundError:
+        return 0
+
+
+def copy_chunk(upload_session, offset, written, chunk_path):
+    """
+    Copy the chunk received in chunk_path at the offset of the partial file.
+    """
+    mode = 'r+b' if os.path.exists(upload_session.partial_path) else 'wb'
+    with open(chunk_path, 'rb') as chunk_file, \
+            open(upload_session.partial_path, mode) as partial_file:
+        # The bytes written by a failed copy are overwritten by the next chunk, as the
+        # offset is rolled back with the transaction.
+        partial_file.seek(offset)
+        shutil.copyfileobj(chunk_file, partial_file, BLOCK_SIZE)
+        partial_file.truncate(offset + written)
+
+
+def write_chunk(upload_session, offset, stream, checksum_header=None):
+    """
+    Write the chunk read from stream at the offset of the partial file. The size of the
+    file is enforced while the chunk is read, and the chunk is dropped if it does not
+    match its checksum.
+    The chunk is received into its own file, without any database lock, as the client
+    may be slow. It is then copied into the partial file, while the offset of the session
+    is moved forward if it did not change meanwhile : of concurrent chunks sent at the
+    same offset, only one is kept. If the partial file is missing or shorter than the
+    offset, the session goes back to the offset 0.
+    In a storage without local paths, e.g. an object storage, the chunk is saved there
+    instead : the chunks of a session may then be received by different servers.
+    Return the updated session.
+    """
+    checksum = parse_checksum(checksum_header) if checksum_header else None
+    upload_session = UploadSession.objects.get(pk=upload_session.pk)
+    check_offset(upload_session, offset)
+    folder = os.path.dirname(upload_session.partial_path)
+    os.makedirs(folder, exist_ok=True)
+    chunk_descriptor, chunk_path = tempfile.mkstemp(
+        suffix=CHUNK_SUFFIX, prefix=f'{upload_session.pk}-', dir=folder)
+    storage = get_storage(upload_session)
+    is_lost = False
+    try:
+        with os.fdopen(chunk_descriptor, 'wb') as chunk_file:
+            written = receive_chunk(upload_session, offset, stream, chunk_file, checksum)
+        with transaction.atomic():
+            # The update locks the session until the chunk is copied.
+            updated = UploadSession.objects \
+                .filter(pk=upload_session.pk, offset=offset) \
+                .update(offset=offset + written, modified=timezone.now())
+            if not updated:
+                upload_session.refresh_from_db(fields=('offset',))
+                check_offset(upload_session, offset)
+            if not has_local_paths(storage):
+                save_chunk(storage, upload_session, offset, chunk_path)
+            elif get_partial_size(upload_session) < offset:
+                # The previous chunks were received on another server, or their partial
+                # file was deleted : the upload starts again from the beginning.
+                UploadSession.objects.filter(pk=upload_session.pk) \
+                    .update(offset=0, modified=timezone.now())
+                is_lost = True
+            else:
+                copy_chunk(upload_session, offset, written, chunk_path)
+    finally:
+        os.remove(chunk_path)
+    if is_lost:
+        raise UploadError(
+            "Les morceaux déjà reçus sont introuvables : le dépôt doit reprendre à l'octet 0.",
+            409)
+    upload_session.offset = offset + written
+    return upload_session
+
+
+class PartialFile(File):
+    """
+    The partial file of a complete upload, which a local storage moves instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def get_file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_file_object(upload_session):
+    model = MODELS[upload_session.kind]
+    if upload_session.kind == UploadSession.RESPONSE_FILE:
+        file_object = model(question=upload_session.question, author=upload_session.user)
+    elif upload_session.kind == UploadSession.QUESTION_FILE:
+        file_object = model(question=upload_session.question)
+    else:
+        file_object = model(questionnaire=upload_session.questionnaire)
+    if hasattr(file_object, 'set_tree_fields'):
+        # The tree fields are used to build the path of the file, before it is saved.
+        file_object.set_tree_fields()
+    return file_object
+
+
+def get_filename(upload_session):
+    filename = upload_session.filename
+    if len(filename) > settings.MAX_FILENAME_LENGTH:
+        file_name, file_extension = os.path.splitext(filename)
+        max_length = settings.MAX_FILENAME_LENGTH - len(file_extension)
+        filename = f"{file_name[:max_length]}{file_extension}"
+    return filename
+
+
+def finalize_upload(upload_session):
+    """
+    Check the complete file, then move it to the path of a new response file, question
+    file or questionnaire file, which is saved and returned. The session is deleted.
+    In a storage without local paths, the partial file is first joined from the chunks.
+    """
+    with transaction.atomic():
+        upload_session = UploadSession.objects \
+            .select_for_update(of=('self',)) \
+            .select_related('question', 'questionnaire') \
+            .get(pk=upload_session.pk)
+        if not upload_session.is_complete:
+            raise UploadError(
+                f"Le fichier est incomplet : {upload_session.offset} octets reçus "
+                f"sur {upload_session.size}.", 409)
+        partial_path = upload_session.partial_path
+        storage = get_storage(upload_session)
+        if not has_local_paths(storage):
+            join_chunks(storage, upload_session)
+        if upload_session.size == 0:
+            os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+            open(partial_path, 'ab').close()
+        if upload_session.checksum and \
+                get_file_checksum(partial_path) != upload_session.checksum:
+            raise UploadError(
+                "Le fichier reçu ne correspond pas à son empreinte.", CHECKSUM_MISMATCH_STATUS)
+        with open(partial_path, 'rb') as partial_file:
+            check_content(partial_file.read(MIME_TYPE_SAMPLE_SIZE))
+
+        file_object = make_file_object(upload_session)
+        file_field = file_object._meta.get_field('file')
+        name = file_field.generate_filename(file_object, get_filename(upload_session))
+        with open(partial_path, 'rb') as partial_file:
+            file_object.file.name = file_field.storage.save(
+                name, PartialFile(partial_file, name=partial_path),
+                max_length=file_field.max_length)
+        try:
+            file_object.save()
+        except Exception:
+            # The partial file is restored, for the upload to be finalized again.
+            if not os.path.exists(partial_path):
+                os.link(file_object.file.path, partial_path)
+            file_object.file.delete(save=False)
+            raise
+        if not has_local_paths(storage):
+            delete_chunks(storage, upload_session)
+        upload_session.delete()
+        if os.path.exists(partial_path):
+            # An object storage uploads the partial file instead of moving it.
+            os.remove(partial_path)
+    if upload_session.kind == UploadSession.RESPONSE_FILE:
+        action.send(
+            sender=upload_session.user, verb='uploaded response-file',
+            action_object=file_object, target=file_object.question)
+    return file_object
+
+
+def delete_upload_session(upload_session):
+    if os.path.exists(upload_session.partial_path):
+        os.remove(upload_session.partial_path)
+    storage = get_storage(upload_session)
+    if not has_local_paths(storage):
+        delete_chunks(storage, upload_session)
+    upload_session.delete()
+
+
+def delete_orphan_chunks(storage, session_ids, date_cutoff):
+    """
+    Delete the chunks saved in the storage for sessions which do not exist anymore.
+    """
+    try:
+        folders = storage.listdir('UPLOADS')[0]
+    except FileNotFoundError:
+        return
+    for folder in folders:
+        if folder.isdigit() and int(folder) in session_ids:
+            continue
+        for name in storage.listdir(f'UPLOADS/{folder}')[1]:
+            chunk_name = f'UPLOADS/{folder}/{name}'
+            # The chunks of a session created meanwhile are more recent.
+            if storage.get_modified_time(chunk_name) < date_cutoff:
+                storage.delete(chunk_name)
+
+
+def delete_abandoned_upload_sessions():
+    """
+    Delete the sessions which did not receive any chunk for UPLOAD_SESSION_EXPIRY_HOURS,
+    with their partial files, and the partial files left without session, e.g. after the
+    deletion of their question, or the chunks left by an interrupted request, on the disk
+    or in an object storage. Return the number of deleted sessions.
+    """
+    date_cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_EXPIRY_HOURS)
+    count = 0
+    for upload_session in UploadSession.objects.filter(modified__lt=date_cutoff):
+        delete_upload_session(upload_session)
+        count += 1
+    session_ids = set(UploadSession.objects.values_list('id', flat=True))
+    if not has_local_paths(default_storage):
+        delete_orphan_chunks(default_storage, session_ids, date_cutoff)
+    partial_folder = os.path.join(settings.MEDIA_ROOT, 'UPLOADS')
+    if os.path.isdir(partial_folder):
+        for entry in os.scandir(partial_folder):
+            if entry.name.endswith('.part'):
+                session_id = entry.name[:-len('.part')]
+                if session_id.isdigit() and int(session_id) in session_ids:
+                    continue
+            elif not entry.name.endswith(CHUNK_SUFFIX):
+                continue
+            # The chunks of the sessions still used are received in less time.
+            if entry.stat().st_mtime < date_cutoff.timestamp():
+                os.remove(entry.path)
+    return count
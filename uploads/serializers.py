@@ -0,0 +1,25 @@
+from rest_framework import serializers
+
+from .models import UploadSession
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = UploadSession
+        fields = (
+            'id', 'kind', 'question', 'questionnaire', 'filename', 'size', 'offset', 'checksum',
+            'created', 'modified')
+        read_only_fields = ('offset', 'created', 'modified')
+
+    def validate(self, data):
+        kind = data['kind']
+        if kind == UploadSession.QUESTIONNAIRE_FILE:
+            if data.get('questionnaire') is None:
+                raise serializers.ValidationError({'questionnaire': "Ce champ est obligatoire."})
+            data['question'] = None
+        else:
+            if data.get('question') is None:
+                raise serializers.ValidationError({'question': "Ce champ est obligatoire."})
+            data['questionnaire'] = None
+        return data
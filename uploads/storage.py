@@ -0,0 +1,154 @@
+"""
+Storage of the uploaded files, where each content is stored once : the same annexes and
+documents are uploaded, or copied, in many controls.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+
+# The chunks of the files are hashed and written by blocks of this size.
+BLOCK_SIZE = 65536
+
+
+class DeduplicatedStorage(FileSystemStorage):
+    """
+    Each content is stored once, in BLOBS/<2 first characters of its SHA-256>/<SHA-256>,
+    and the files keep their usual names (see control.upload_path) as hard links to it.
+
+    The link count of a blob is thus the number of files sharing its content, plus one :
+    deleting a file, e.g. by django_cleanup, only deletes the blob once it is the last
+    reference. The blobs left without reference are deleted by delete_unreferenced_blobs.
+    If the files cannot be linked, e.g. on another filesystem, they are copied.
+    """
+    blob_folder = 'BLOBS'
+
+    def blob_path(self, digest):
+        return self.path(os.path.join(self.blob_folder, digest[:2], digest))
+
+    def write_temporary_file(self, content):
+        """
+        Write the content next to the blobs while it is hashed. A file already written to
+        disk, e.g. a large upload, is hashed then moved instead.
+        Return the path of the temporary file and the digest of the content.
+        """
+        temporary_folder = self.path(os.path.join(self.blob_folder, 'tmp'))
+        os.makedirs(temporary_folder, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=temporary_folder)
+        digest = hashlib.sha256()
+        if hasattr(content, 'temporary_file_path'):
+            os.close(file_descriptor)
+            with open(content.temporary_file_path(), 'rb') as source_file:
+                for block in iter(lambda: source_file.read(BLOCK_SIZE), b''):
+                    digest.update(block)
+            try:
+                os.replace(content.temporary_file_path(), temporary_path)
+                return temporary_path, digest.hexdigest()
+            except OSError:
+                # On another filesystem, the file is copied.
+                file_descriptor = os.open(temporary_path, os.O_WRONLY | os.O_TRUNC)
+                digest = hashlib.sha256()
+        with os.fdopen(file_descriptor, 'wb') as temporary_file:
+            for chunk in content.chunks(chunk_size=BLOCK_SIZE):
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                digest.update(chunk)
+                temporary_file.write(chunk)
+        return temporary_path, digest.hexdigest()
+
+    def store_blob(self, temporary_path, digest):
+        """
+        Make the temporary file the blob of digest, unless the content is already stored.
+        Return the path of the blob.
+        """
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            os.link(temporary_path, blob_path)
+        except FileExistsError:
+            return blob_path
+        if self.file_permissions_mode is not None:
+            os.chmod(blob_path, self.file_permissions_mode)
+        return blob_path
+
+    def link_file(self, source_path, name):
+        """
+        Link the file at source_path under an available name, derived from name.
+        Return the name.
+        """
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        while True:
+            try:
+                os.link(source_path, full_path)
+            except FileExistsError:
+                # A file was saved under this name meanwhile.
+                name = self.get_available_name(name)
+                full_path = self.path(name)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                shutil.copyfile(source_path, full_path)
+                break
+            else:
+                break
+        return name
+
+    def _save(self, name, content):
+        temporary_path, digest = self.write_temporary_file(content)
+        try:
+            blob_path = self.store_blob(temporary_path, digest)
+            try:
+                name = self.link_file(blob_path, name)
+            except FileNotFoundError:
+                # The blob was deleted as unreferenced meanwhile : the file is linked to
+                # its temporary copy, which becomes the blob.
+                name = self.link_file(temporary_path, name)
+                self.store_blob(temporary_path, digest)
+        finally:
+            os.remove(temporary_path)
+        return name.replace('\\', '/')
+
+    def iter_blobs(self):
+        blob_root = self.path(self.blob_folder)
+        if not os.path.isdir(blob_root):
+            return
+        for folder in os.scandir(blob_root):
+            if not folder.is_dir() or folder.name == 'tmp':
+                continue
+            for entry in os.scandir(folder.path):
+                yield entry
+
+    def get_report(self):
+        """
+        Return the number of blobs, of files referencing them, the bytes stored and the
+        bytes saved by storing each content once.
+        """
+        report = {'blobs': 0, 'files': 0, 'stored_bytes': 0, 'saved_bytes': 0}
+        for entry in self.iter_blobs():
+            stat = entry.stat()
+            references = stat.st_nlink - 1
+            report['blobs'] += 1
+            report['files'] += references
+            report['stored_bytes'] += stat.st_size
+            report['saved_bytes'] += stat.st_size * max(references - 1, 0)
+        return report
+
+    def delete_unreferenced_blobs(self):
+        """
+        Delete the blobs of which all the files were deleted. Return the number of bytes
+        freed.
+        """
+        freed_bytes = 0
+        for entry in self.iter_blobs():
+            stat = entry.stat()
+            if stat.st_nlink == 1:
+                os.remove(entry.path)
+                freed_bytes += stat.st_size
+        return freed_bytes
@@ -0,0 +1,35 @@
+import logging
+
+from django.conf import settings
+
+from ecc.celery import app
+from celery.utils.log import get_task_logger
+
+from .resumable import delete_abandoned_upload_sessions as delete_sessions
+from .storage import DeduplicatedStorage
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+@app.task(queue=settings.CELERY_QUEUE)
+def delete_abandoned_upload_sessions():
+    """
+    Uploads are abandoned after UPLOAD_SESSION_EXPIRY_HOURS hours without any chunk.
+    """
+    deleted_count = delete_sessions()
+    logger.info(f'{deleted_count} dépôt(s) abandonné(s) supprimé(s)')
+
+
+@app.task(queue=settings.CELERY_QUEUE)
+def delete_unreferenced_blobs():
+    """
+    The blobs of uploads.storage are left on disk when their last file is deleted.
+    """
+    storage = DeduplicatedStorage()
+    freed_bytes = storage.delete_unreferenced_blobs()
+    report = storage.get_report()
+    logger.info(
+        f'{freed_bytes} octet(s) libéré(s). {report["files"]} fichier(s) stocké(s) '
+        f'en {report["blobs"]} contenu(s), {report["saved_bytes"]} octet(s) économisé(s)')
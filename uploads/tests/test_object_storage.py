@@ -0,0 +1,171 @@
+import io
+import os
+import zipfile
+from datetime import timedelta
+
+import boto3
+from moto import mock_s3
+from pytest import fixture, mark
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.shortcuts import reverse
+from django.utils import timezone
+
+from control.docx import generate_questionnaire_file
+from control.models import ResponseFile
+from control.trash import set_trashed
+from exports.models import ExportJob
+from exports.tasks import build_control_dossier, build_response_files_zip
+from tests import factories, utils
+from uploads.models import UploadSession
+from uploads.object_storage import ObjectStorage, copy_media
+from uploads.resumable import delete_abandoned_upload_sessions, finalize_upload, write_chunk
+
+
+BUCKET = 'collectepro-media'
+
+
+@fixture
+def object_storage(settings):
+    settings.AWS_STORAGE_BUCKET_NAME = BUCKET
+    settings.AWS_S3_REGION_NAME = 'us-east-1'
+    settings.AWS_ACCESS_KEY_ID = 'test'
+    settings.AWS_SECRET_ACCESS_KEY = 'test'
+    with mock_s3():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        settings.DEFAULT_FILE_STORAGE = 'uploads.object_storage.ObjectStorage'
+        yield default_storage
+
+
+@mark.django_db
+def test_response_file_is_downloaded_through_a_signed_url(client, object_storage):
+    response_file = factories.ResponseFileFactory()
+    utils.login(client, user=utils.make_audited_user(response_file.control))
+
+    response = client.get(reverse('send-response-file', args=[response_file.id]))
+
+    assert object_storage.exists(response_file.file.name)
+    assert response.status_code == 302
+    assert response['Location'].startswith(f'https://{BUCKET}.s3.amazonaws.com/')
+    assert 'X-Amz-Expires=300' in response['Location']
+    assert 'response-content-disposition=attachment' in response['Location']
+
+
+@mark.django_db
+def test_response_file_is_moved_to_the_trash_in_the_bucket(object_storage):
+    response_file = factories.ResponseFileFactory()
+    name_before = response_file.file.name
+
+    set_trashed(response_file, True)
+
+    response_file = ResponseFile.objects.get(id=response_file.id)
+    assert '/CORBEILLE/' in response_file.file.name
+    assert object_storage.exists(response_file.file.name)
+    assert not object_storage.exists(name_before)
+
+
+@mark.django_db
+def test_questionnaire_document_is_generated_in_the_bucket(
+        object_storage, django_capture_on_commit_callbacks):
+    questionnaire = factories.QuestionnaireFactory()
+
+    generate_questionnaire_file(questionnaire)
+    previous_name = questionnaire.generated_file.name
+    with django_capture_on_commit_callbacks(execute=True):
+        generate_questionnaire_file(questionnaire)
+
+    assert questionnaire.generated_file.name.endswith('.docx')
+    assert questionnaire.generated_file.name != previous_name
+    assert object_storage.exists(questionnaire.generated_file.name)
+    assert not object_storage.exists(previous_name)
+
+
+@mark.django_db
+def test_zip_export_is_built_from_and_saved_in_the_bucket(object_storage):
+    response_file = factories.ResponseFileFactory(question__theme__questionnaire__is_draft=False)
+    export_job = ExportJob.objects.create(
+        kind=ExportJob.RESPONSE_FILES_ZIP, user=factories.UserFactory(),
+        control=response_file.control)
+
+    build_response_files_zip(export_job.id)
+
+    export_job.refresh_from_db()
+    assert export_job.status == ExportJob.DONE
+    assert object_storage.exists(export_job.file.name)
+    archive = zipfile.ZipFile(io.BytesIO(export_job.file.open('rb').read()))
+    assert archive.read(response_file.file.name) == response_file.file.open('rb').read()
+
+
+@mark.django_db
+def test_control_dossier_is_built_from_and_saved_in_the_bucket(object_storage):
+    questionnaire = factories.QuestionnaireFactory(is_draft=False)
+    generate_questionnaire_file(questionnaire)
+    export_job = ExportJob.objects.create(
+        kind=ExportJob.CONTROL_DOSSIER, user=factories.UserFactory(),
+        control=questionnaire.control)
+
+    build_control_dossier(export_job.id)
+
+    export_job.refresh_from_db()
+    assert export_job.status == ExportJob.DONE
+    assert object_storage.exists(export_job.file.name)
+
+
+@mark.django_db
+def test_resumable_upload_chunks_can_be_received_by_different_servers(object_storage):
+    content = b'%PDF-1.4\n' + b'x' * 1000
+    question = factories.QuestionFactory()
+    upload_session = UploadSession.objects.create(
+        kind=UploadSession.RESPONSE_FILE, user=factories.UserFactory(), question=question,
+        filename='réponse.pdf', size=len(content))
+
+    for offset in (0, 600):
+        upload_session = write_chunk(
+            upload_session, offset, io.BytesIO(content[offset:offset + 600]))
+        # Nothing is kept on the disk of the server which received the chunk.
+        assert not os.path.exists(upload_session.partial_path)
+    response_file = finalize_upload(upload_session)
+
+    assert object_storage.exists(response_file.file.name)
+    assert response_file.file.open('rb').read() == content
+    assert object_storage.listdir(upload_session.chunks_folder) == ([], [])
+    assert not os.path.exists(upload_session.partial_path)
+
+
+@mark.django_db
+def test_chunks_left_without_session_are_deleted_from_the_bucket(settings, object_storage):
+    settings.UPLOAD_SESSION_EXPIRY_HOURS = 0
+    object_storage.save('UPLOADS/123456/00000000000000000000', ContentFile(b'chunk'))
+    upload_session = UploadSession.objects.create(
+        kind=UploadSession.RESPONSE_FILE, user=factories.UserFactory(),
+        question=factories.QuestionFactory(), filename='réponse.pdf', size=10)
+    upload_session = write_chunk(upload_session, 0, io.BytesIO(b'chunk'))
+    UploadSession.objects.filter(id=upload_session.id).update(
+        modified=timezone.now() + timedelta(hours=1))
+
+    delete_abandoned_upload_sessions()
+
+    assert not object_storage.exists('UPLOADS/123456/00000000000000000000')
+    assert object_storage.exists(upload_session.get_chunk_name(0))
+
+
+def test_large_file_is_uploaded_in_parts(settings, object_storage):
+    settings.AWS_S3_MULTIPART_CHUNK_SIZE_MB = 5
+    storage = ObjectStorage()
+
+    name = storage.save('CONTROLE-1/Q01/archive.zip', ContentFile(b'x' * 11 * 1024 * 1024))
+
+    assert storage.bucket.Object(name).e_tag.strip('"').endswith('-3')
+
+
+def test_media_are_copied_to_the_bucket_once(tmp_path, object_storage):
+    local_storage = FileSystemStorage(location=str(tmp_path))
+    local_storage.save('CONTROLE-1/Q01/T01/réponse.pdf', ContentFile(b'%PDF-1.4'))
+    local_storage.save('CONTROLE-1/Q01/Questionnaire-1.docx', ContentFile(b'docx'))
+    local_storage.save('BLOBS/ab/abcdef', ContentFile(b'%PDF-1.4'))
+
+    assert copy_media(local_storage, object_storage) == {'copied': 2, 'skipped': 0, 'failed': 0}
+    assert copy_media(local_storage, object_storage) == {'copied': 0, 'skipped': 2, 'failed': 0}
+    assert object_storage.exists('CONTROLE-1/Q01/T01/réponse.pdf')
+    assert not object_storage.exists('BLOBS/ab/abcdef')
@@ -0,0 +1,215 @@
+import base64
+import hashlib
+import io
+import os
+from datetime import timedelta
+
+from pytest import mark, raises
+
+from django.shortcuts import reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from control.models import QuestionFile, ResponseFile
+from tests import factories, utils
+from uploads.models import UploadSession
+from uploads.resumable import UploadError, delete_abandoned_upload_sessions, write_chunk
+
+
+pytestmark = mark.django_db
+
+CONTENT = b'%PDF-1.4\n' + b'x' * 1000
+
+
+def make_client(user):
+    api_client = APIClient()
+    utils.login(api_client, user=user)
+    return api_client
+
+
+def make_published_question():
+    question = factories.QuestionFactory()
+    question.questionnaire.is_draft = False
+    question.questionnaire.save()
+    return question
+
+
+def create_session(api_client, kind, parent, filename='réponse.pdf', size=len(CONTENT), **data):
+    parent_field = 'questionnaire' if kind == UploadSession.QUESTIONNAIRE_FILE else 'question'
+    data.update({'kind': kind, parent_field: parent.id, 'filename': filename, 'size': size})
+    return api_client.post(reverse('api:upload-list'), data, format='json')
+
+
+def send_chunk(api_client, upload_id, offset, chunk, checksum=None):
+    headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+    if checksum is not None:
+        headers['HTTP_UPLOAD_CHECKSUM'] = f'sha256 {base64.b64encode(checksum).decode()}'
+    return api_client.patch(
+        reverse('api:upload-detail', args=[upload_id]), chunk,
+        content_type='application/offset+octet-stream', **headers)
+
+
+def finalize(api_client, upload_id):
+    return api_client.post(reverse('api:upload-finalize', args=[upload_id]))
+
+
+def test_response_file_is_uploaded_in_chunks_and_resumed():
+    question = make_published_question()
+    user = utils.make_audited_user(question.control)
+    api_client = make_client(user)
+    response = create_session(
+        api_client, UploadSession.RESPONSE_FILE, question,
+        checksum=hashlib.sha256(CONTENT).hexdigest())
+    assert response.status_code == 201
+    upload_id = response.data['id']
+
+    first, second = CONTENT[:600], CONTENT[600:]
+    response = send_chunk(api_client, upload_id, 0, first, hashlib.sha256(first).digest())
+    assert response.status_code == 204
+    assert response['Upload-Offset'] == '600'
+    # A chunk sent again after a lost response is refused, with the offset to resume from.
+    response = send_chunk(api_client, upload_id, 0, first)
+    assert response.status_code == 409
+    response = api_client.head(reverse('api:upload-detail', args=[upload_id]))
+    assert response['Upload-Offset'] == '600'
+    assert finalize(api_client, upload_id).status_code == 409
+    assert send_chunk(api_client, upload_id, 600, second).status_code == 204
+
+    response = finalize(api_client, upload_id)
+
+    assert response.status_code == 201
+    response_file = ResponseFile.objects.get(id=response.data['id'])
+    assert response_file.author == user
+    assert response_file.questionnaire_id == question.questionnaire_id
+    assert response_file.file.name.startswith(os.path.join(
+        question.control.reference_code, 'Q01', 'T01'))
+    assert response_file.file.read() == CONTENT
+    assert not UploadSession.objects.exists()
+
+
+def test_chunk_larger_than_the_file_or_not_matching_its_checksum_is_dropped():
+    question = make_published_question()
+    api_client = make_client(utils.make_audited_user(question.control))
+    upload_id = create_session(api_client, UploadSession.RESPONSE_FILE, question).data['id']
+
+    response = send_chunk(api_client, upload_id, 0, CONTENT + b'x')
+    assert response.status_code == 413
+    response = send_chunk(api_client, upload_id, 0, CONTENT, hashlib.sha256(b'other').digest())
+    assert response.status_code == 460
+    assert response['Upload-Offset'] == '0'
+    assert send_chunk(api_client, upload_id, 0, CONTENT).status_code == 204
+
+
+def test_upload_is_refused_before_any_chunk():
+    question = make_published_question()
+    api_client = make_client(utils.make_audited_user(question.control))
+
+    response = create_session(api_client, UploadSession.RESPONSE_FILE, question, 'virus.exe')
+    assert response.status_code == 403
+    response = create_session(api_client, UploadSession.RESPONSE_FILE, question, size=2 ** 40)
+    assert response.status_code == 413
+    response = create_session(api_client, UploadSession.QUESTION_FILE, question)
+    assert response.status_code == 403
+    assert not UploadSession.objects.exists()
+
+
+def test_question_file_is_uploaded_by_an_inspector():
+    question = factories.QuestionFactory()
+    api_client = make_client(utils.make_inspector_user(question.control))
+    upload_id = create_session(api_client, UploadSession.QUESTION_FILE, question).data['id']
+    send_chunk(api_client, upload_id, 0, CONTENT)
+
+    response = finalize(api_client, upload_id)
+
+    assert response.status_code == 201
+    question_file = QuestionFile.objects.get(id=response.data['id'])
+    assert 'ANNEXES-AUX-QUESTIONS' in question_file.file.name
+
+
+def test_abandoned_upload_sessions_are_deleted():
+    question = make_published_question()
+    api_client = make_client(utils.make_audited_user(question.control))
+    upload_id = create_session(api_client, UploadSession.RESPONSE_FILE, question).data['id']
+    send_chunk(api_client, upload_id, 0, CONTENT[:10])
+    upload_session = UploadSession.objects.get(id=upload_id)
+    assert os.path.exists(upload_session.partial_path)
+
+    assert delete_abandoned_upload_sessions() == 0
+    UploadSession.objects.filter(id=upload_id).update(
+        modified=timezone.now() - timedelta(days=2))
+    assert delete_abandoned_upload_sessions() == 1
+
+    assert not UploadSession.objects.exists()
+    assert not os.path.exists(upload_session.partial_path)
+
+
+class ConcurrentStream(io.BytesIO):
+    """
+    A chunk during which another chunk is received at the same offset.
+    """
+
+    def __init__(self, content, other_chunk):
+        super().__init__(content)
+        self.other_chunk = other_chunk
+
+    def read(self, *args):
+        if self.other_chunk is not None:
+            upload_session, offset, content = self.other_chunk
+            self.other_chunk = None
+            write_chunk(upload_session, offset, io.BytesIO(content))
+        return super().read(*args)
+
+
+def test_only_one_of_concurrent_chunks_at_the_same_offset_is_kept():
+    question = make_published_question()
+    api_client = make_client(utils.make_audited_user(question.control))
+    upload_id = create_session(api_client, UploadSession.RESPONSE_FILE, question).data['id']
+    upload_session = UploadSession.objects.get(id=upload_id)
+    stream = ConcurrentStream(b'x' * 10, other_chunk=(upload_session, 0, CONTENT[:10]))
+
+    with raises(UploadError) as error:
+        write_chunk(upload_session, 0, stream)
+
+    assert error.value.status == 409
+    assert UploadSession.objects.get(id=upload_id).offset == 10
+    assert open(upload_session.partial_path, 'rb').read() == CONTENT[:10]
+    folder = os.path.dirname(upload_session.partial_path)
+    assert not [name for name in os.listdir(folder) if name.endswith('.chunk')]
+
+
+def test_chunks_left_by_interrupted_requests_are_deleted():
+    question = make_published_question()
+    api_client = make_client(utils.make_audited_user(question.control))
+    upload_id = create_session(api_client, UploadSession.RESPONSE_FILE, question).data['id']
+    send_chunk(api_client, upload_id, 0, CONTENT[:10])
+    folder = os.path.dirname(UploadSession.objects.get(id=upload_id).partial_path)
+    chunk_path = os.path.join(folder, f'{upload_id}-interrupted.chunk')
+    open(chunk_path, 'wb').close()
+
+    delete_abandoned_upload_sessions()
+    assert os.path.exists(chunk_path)
+    two_days_ago = (timezone.now() - timedelta(days=2)).timestamp()
+    os.utime(chunk_path, (two_days_ago, two_days_ago))
+    delete_abandoned_upload_sessions()
+
+    assert not os.path.exists(chunk_path)
+    assert UploadSession.objects.filter(id=upload_id).exists()
+
+
+def test_upload_starts_again_if_the_partial_file_is_lost():
+    question = make_published_question()
+    api_client = make_client(utils.make_audited_user(question.control))
+    upload_id = create_session(api_client, UploadSession.RESPONSE_FILE, question).data['id']
+    assert send_chunk(api_client, upload_id, 0, CONTENT[:600]).status_code == 204
+    # E.g. the next chunk is received by another server.
+    os.remove(UploadSession.objects.get(id=upload_id).partial_path)
+
+    response = send_chunk(api_client, upload_id, 600, CONTENT[600:])
+
+    assert response.status_code == 409
+    assert response['Upload-Offset'] == '0'
+    assert send_chunk(api_client, upload_id, 0, CONTENT).status_code == 204
+    response = finalize(api_client, upload_id)
+    assert response.status_code == 201
+    assert ResponseFile.objects.get(id=response.data['id']).file.read() == CONTENT
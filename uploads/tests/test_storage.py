@@ -0,0 +1,87 @@
+import os
+
+from pytest import fixture, mark
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.shortcuts import reverse
+
+from control.models import ResponseFile
+from tests import factories, utils
+from uploads.storage import DeduplicatedStorage
+
+
+CONTENT = b'%PDF-1.4\n' + b'annexe' * 1000
+
+
+@fixture
+def storage(tmp_path):
+    return DeduplicatedStorage(location=str(tmp_path))
+
+
+def test_same_content_is_stored_once(storage):
+    first_name = storage.save('CONTROLE-1/Q01/annexe.pdf', ContentFile(CONTENT))
+    second_name = storage.save('CONTROLE-2/Q01/annexe.pdf', ContentFile(CONTENT))
+    other_name = storage.save('CONTROLE-2/Q01/autre.pdf', ContentFile(b'autre'))
+
+    assert os.path.samefile(storage.path(first_name), storage.path(second_name))
+    assert not os.path.samefile(storage.path(first_name), storage.path(other_name))
+    with storage.open(second_name) as second_file:
+        assert second_file.read() == CONTENT
+    assert storage.get_report() == {
+        'blobs': 2, 'files': 3, 'stored_bytes': len(CONTENT) + 5, 'saved_bytes': len(CONTENT)}
+
+
+def test_file_with_an_existing_name_is_linked_under_another_name(storage):
+    first_name = storage.save('Q01/T01/réponse.pdf', ContentFile(CONTENT))
+    second_name = storage.save('Q01/T01/réponse.pdf', ContentFile(CONTENT))
+
+    assert first_name != second_name
+    assert storage.get_report()['files'] == 2
+
+
+def test_uploaded_temporary_file_is_moved(storage):
+    uploaded_file = TemporaryUploadedFile('réponse.pdf', 'application/pdf', len(CONTENT), None)
+    uploaded_file.write(CONTENT)
+    uploaded_file.seek(0)
+
+    name = storage.save('Q01/T01/réponse.pdf', uploaded_file)
+    uploaded_file.close()
+
+    with storage.open(name) as stored_file:
+        assert stored_file.read() == CONTENT
+    assert not os.listdir(storage.path('BLOBS/tmp'))
+
+
+def test_blob_is_deleted_with_its_last_file(storage):
+    first_name = storage.save('CONTROLE-1/réponse.pdf', ContentFile(CONTENT))
+    second_name = storage.save('CONTROLE-2/réponse.pdf', ContentFile(CONTENT))
+
+    storage.delete(first_name)
+    assert storage.delete_unreferenced_blobs() == 0
+    with storage.open(second_name) as second_file:
+        assert second_file.read() == CONTENT
+
+    storage.delete(second_name)
+    assert storage.delete_unreferenced_blobs() == len(CONTENT)
+    assert storage.get_report()['blobs'] == 0
+
+
+@mark.django_db
+def test_response_file_uploaded_twice_shares_its_content(client, settings):
+    settings.DEFAULT_FILE_STORAGE = 'uploads.storage.DeduplicatedStorage'
+    question = factories.QuestionFactory()
+    question.questionnaire.is_draft = False
+    question.questionnaire.save()
+    utils.login(client, user=utils.make_audited_user(question.control))
+    for _ in range(2):
+        post_data = {'file': factories.dummy_file.open(), 'question_id': [question.id]}
+        response = client.post(reverse('response-upload'), post_data, format='multipart')
+        assert response.status_code == 200
+
+    first_file, second_file = ResponseFile.objects.all()
+
+    assert isinstance(default_storage, DeduplicatedStorage)
+    assert first_file.file.name != second_file.file.name
+    assert os.path.samefile(first_file.file.path, second_file.file.path)
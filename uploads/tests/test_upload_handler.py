@@ -0,0 +1,128 @@
+import io
+
+from pytest import mark
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParser
+from django.shortcuts import reverse
+from django.test import RequestFactory, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+from actstream.models import Action
+from rest_framework.test import APIClient
+
+from control.models import QuestionnaireFile, ResponseFile
+from tests import factories, utils
+from uploads.handlers import ValidatingUploadHandler
+from uploads.validation import FileTooLarge, InvalidExtension, InvalidMimeType, VirusDetected
+
+
+pytestmark = mark.django_db
+
+CHUNK_SIZE = 65536
+
+
+def parse_upload(filename, content, **meta):
+    """
+    Parse a multipart body with the validating and temporary file handlers. Return the
+    request, the parsed files and the number of bytes read from the body.
+    """
+    body = encode_multipart(BOUNDARY, {
+        'question_id': '1',
+        'file': SimpleUploadedFile(filename, content),
+    })
+    stream = io.BytesIO(body)
+    request = RequestFactory().post('/')
+    handlers = [ValidatingUploadHandler(request), TemporaryFileUploadHandler(request)]
+    meta = {'CONTENT_TYPE': MULTIPART_CONTENT, 'CONTENT_LENGTH': len(body), **meta}
+    files = MultiPartParser(meta, stream, handlers).parse()[1]
+    return request, files, stream.tell()
+
+
+def test_file_is_received_when_valid():
+    request, files, read_size = parse_upload('réponse.pdf', factories.dummy_file.open().read())
+
+    assert files['file'].size == factories.dummy_file.size
+    assert getattr(request, 'upload_rejection', None) is None
+
+
+def test_forbidden_extension_is_rejected_before_the_file_is_received():
+    request, files, read_size = parse_upload('test.exe', b'%PDF-1.4\n' * 200000)
+
+    assert 'file' not in files
+    assert isinstance(request.upload_rejection, InvalidExtension)
+    assert read_size <= 2 * CHUNK_SIZE
+
+
+def test_forbidden_mime_type_is_rejected_on_the_first_chunk():
+    content = factories.dummy_exe_file.open().read()
+
+    request, files, read_size = parse_upload('rapport.pdf', content)
+
+    assert 'file' not in files
+    assert isinstance(request.upload_rejection, InvalidMimeType)
+    assert read_size <= 2 * CHUNK_SIZE
+
+
+@override_settings(UPLOAD_FILE_MAX_SIZE_MB=1)
+def test_too_large_file_is_rejected_once_the_limit_is_exceeded():
+    request, files, read_size = parse_upload('réponse.pdf', b'%PDF-1.4\n' + b'x' * 1500000)
+
+    assert 'file' not in files
+    assert isinstance(request.upload_rejection, FileTooLarge)
+    assert read_size <= 1048576 + 2 * CHUNK_SIZE
+
+
+@override_settings(UPLOAD_FILE_MAX_SIZE_MB=1)
+def test_too_large_body_is_rejected_before_it_is_read():
+    request, files, read_size = parse_upload(
+        'réponse.pdf', b'%PDF-1.4\n', CONTENT_LENGTH=3 * 1048576)
+
+    assert 'file' not in files
+    assert isinstance(request.upload_rejection, FileTooLarge)
+    assert read_size == 0
+
+
+def test_file_reported_by_the_antivirus_is_rejected_before_it_is_read():
+    request, files, read_size = parse_upload(
+        'réponse.pdf', b'%PDF-1.4\n', HTTP_X_VIRUS_NAME='Eicar-Test-Signature')
+
+    assert isinstance(request.upload_rejection, VirusDetected)
+    assert read_size == 0
+
+
+def test_response_file_rejected_while_received_is_logged(client):
+    question = factories.QuestionFactory()
+    question.questionnaire.is_draft = False
+    question.questionnaire.save()
+    user = utils.make_audited_user(question.control)
+    utils.login(client, user=user)
+    post_data = {
+        'question_id': [question.id],
+        'file': factories.dummy_exe_file.open(),
+    }
+
+    response = client.post(reverse('response-upload'), post_data, format='multipart')
+
+    assert response.status_code == 403
+    assert not ResponseFile.objects.exists()
+    log = Action.objects.get(verb='uploaded invalid response-file extension')
+    assert log.target == question
+
+
+@override_settings(UPLOAD_FILE_MAX_SIZE_MB=0.01)
+def test_too_large_questionnaire_file_is_refused():
+    questionnaire = factories.QuestionnaireFactory(is_draft=True)
+    api_client = APIClient()
+    utils.login(api_client, user=utils.make_inspector_user(questionnaire.control))
+    post_data = {
+        'questionnaire': questionnaire.id,
+        'file': factories.dummy_file.open(),
+    }
+
+    response = api_client.post(reverse('api:piecejointe-list'), post_data, format='multipart')
+
+    assert response.status_code == 400
+    assert 'La taille du fichier dépasse la limite autorisée' in str(response.content, 'utf-8')
+    assert not QuestionnaireFile.objects.exists()
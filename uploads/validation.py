@@ -0,0 +1,126 @@
+"""
+Checks of the uploaded files, shared by the upload views, the resumable uploads and the
+upload handler, which applies them while the request body is received.
+"""
+import os
+
+import magic
+from django.conf import settings
+
+
+# Number of bytes used to detect the mime type of a file.
+MIME_TYPE_SAMPLE_SIZE = 2048
+
+VIRUS_HEADERS = ('x-infection-found', 'x-virus-name')
+
+# The upload handler stores the rejection of a file on the request under this attribute.
+REJECTION_ATTRIBUTE = 'upload_rejection'
+
+
+class UploadError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class VirusDetected(UploadError):
+
+    def __init__(self):
+        super().__init__(
+            "Ce fichier a été notifié comme contenant un virus, merci de vérifier"
+            " celui-ci avant de le déposer à nouveau.", 403)
+
+
+class InvalidExtension(UploadError):
+
+    def __init__(self, extension):
+        super().__init__(f"Cette extension de fichier n'est pas autorisée : {extension}", 403)
+        self.extension = extension
+
+
+class InvalidMimeType(UploadError):
+
+    def __init__(self, mime_type):
+        super().__init__(f"Ce type de fichier n'est pas autorisé : {mime_type}", 403)
+        self.mime_type = mime_type
+
+
+class FileTooLarge(UploadError):
+
+    def __init__(self):
+        super().__init__(
+            f"La taille du fichier dépasse la limite autorisée "
+            f"de {settings.UPLOAD_FILE_MAX_SIZE_MB}Mo.", 413)
+
+
+def get_max_size():
+    return 1048576 * settings.UPLOAD_FILE_MAX_SIZE_MB
+
+
+def file_extension_is_valid(extension):
+    split_extensions = extension.split(".")
+    if len(split_extensions) > 2:
+        return False
+    normalized_extension = f".{split_extensions[-1].lower()}"
+    return normalized_extension not in settings.UPLOAD_FILE_EXTENSION_BLACKLIST
+
+
+def file_mime_type_is_valid(mime_type):
+    blacklist = settings.UPLOAD_FILE_MIME_TYPE_BLACKLIST
+    return not any(match.lower() in mime_type.lower() for match in blacklist)
+
+
+def check_headers(headers):
+    """
+    headers are the request headers, where the antivirus of the proxy reports infections.
+    """
+    if any(header.lower() in VIRUS_HEADERS for header in headers):
+        raise VirusDetected()
+
+
+def check_filename(filename):
+    extension = os.path.splitext(filename)[1]
+    if not file_extension_is_valid(extension):
+        raise InvalidExtension(extension)
+
+
+def check_size(size):
+    if size > get_max_size():
+        raise FileTooLarge()
+
+
+def check_content(sample):
+    """
+    sample is the beginning of the file, from which its mime type is detected.
+    """
+    mime_type = magic.from_buffer(sample[:MIME_TYPE_SAMPLE_SIZE], mime=True)
+    if not file_mime_type_is_valid(mime_type):
+        raise InvalidMimeType(mime_type)
+
+
+def get_upload_rejection(request):
+    """
+    Return the error of the file rejected by the upload handler, which is then missing
+    from request.FILES, or None.
+    """
+    request.FILES  # The body is parsed, if it was not already.
+    return getattr(request, REJECTION_ATTRIBUTE, None)
+
+
+def check_uploaded_file(request, uploaded_file):
+    """
+    Raise the rejection of the upload handler, if any, or the error of uploaded_file.
+    The file is checked again, in case it was not received by the upload handler.
+    """
+    rejection = get_upload_rejection(request)
+    if rejection is not None:
+        raise rejection
+    check_headers(request.headers)
+    check_filename(uploaded_file.name)
+    check_size(uploaded_file.size)
+    position = uploaded_file.tell()
+    uploaded_file.seek(0)
+    check_content(uploaded_file.read(MIME_TYPE_SAMPLE_SIZE))
+    uploaded_file.seek(position)
@@ -0,0 +1,79 @@
+from django.apps import apps
+
+
+class AccessRights(object):
+    """
+    Access rights of a user profile on the controls, as {control_id: access types} maps.
+    The maps are loaded with a single query the first time they are needed, and then
+    shared by the permissions, querysets and serializers of the request.
+    Soft-deleted controls are left out, unless `include_deleted` is given : some pages
+    still show them, and let the permissions refuse the access.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self._maps = None
+
+    def get_maps(self):
+        """
+        Return the (active controls, deleted controls) maps.
+        """
+        if self._maps is None:
+            active, deleted = {}, {}
+            rows = self.profile.access.values_list(
+                'control_id', 'access_type', 'control__is_deleted')
+            for control_id, access_type, is_deleted in rows:
+                access_types = deleted if is_deleted else active
+                access_types.setdefault(control_id, set()).add(access_type)
+            self._maps = (active, deleted)
+        return self._maps
+
+    def reset(self):
+        """
+        Forget the loaded maps, for them to be loaded again when the accesses have changed.
+        """
+        self._maps = None
+
+    def get_access_types(self, control_id, include_deleted=False):
+        active, deleted = self.get_maps()
+        access_types = active.get(control_id, set())
+        if include_deleted:
+            access_types = access_types | deleted.get(control_id, set())
+        return access_types
+
+    def has_access(self, control, access_type=None, include_deleted=False):
+        """
+        `control` is a Control or its id. Without `access_type`, any access is enough.
+        """
+        control_id = getattr(control, 'pk', control)
+        try:
+            control_id = int(control_id)
+        except (TypeError, ValueError):
+            return False
+        access_types = self.get_access_types(control_id, include_deleted)
+        if access_type is None:
+            return bool(access_types)
+        return access_type in access_types
+
+    def is_demandeur(self, control, include_deleted=False):
+        return self.has_access(control, 'demandeur', include_deleted)
+
+    def is_repondant(self, control, include_deleted=False):
+        return self.has_access(control, 'repondant', include_deleted)
+
+    def control_ids(self, access_type=None, include_deleted=False):
+        active, deleted = self.get_maps()
+        maps = (active, deleted) if include_deleted else (active,)
+        return {
+            control_id
+            for access_types_by_control in maps
+            for control_id, access_types in access_types_by_control.items()
+            if access_type is None or access_type in access_types
+        }
+
+    def controls(self, access_type=None, include_deleted=False):
+        """
+        Queryset of the controls the user has access to, filtered on the loaded ids.
+        """
+        Control = apps.get_model('control.Control')
+        return Control.objects.filter(id__in=self.control_ids(access_type, include_deleted))
@@ -14,7 +14,7 @@ class AccessAdmin(admin.ModelAdmin):
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'profile_type', 'send_files_report')
+    list_display = ('user', 'profile_type', 'send_files_report', 'files_report_digest')
     filter = 'profile_type'
     raw_id_fields = ('user',)
     search_fields = ('user__username', 'user__email')
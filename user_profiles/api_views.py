@@ -25,13 +25,12 @@ class UserProfileViewSet(
     permission_classes = (UserDemandeurAccess,)
 
     def get_queryset(self):
-        if len(self.request.user.profile.user_controls("demandeur")) > 0:
+        access_rights = self.request.user.profile.access_rights
+        if access_rights.control_ids('demandeur', include_deleted=True):
             return UserProfile.objects.distinct()
         else:
             return UserProfile.objects.filter(
-                Q(access__control__is_deleted=False) &
-                Q(access__control__in=self.request.user.profile.user_controls("all"))
-            ).distinct()
+                access__control__in=access_rights.control_ids()).distinct()
 
     @decorators.action(detail=True, methods=['post'], url_path='remove-control')
     def remove_control(self, request, pk):
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.17 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_profiles', '0027_remove_userprofile_controls'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='files_report_digest',
+            field=models.BooleanField(default=False, help_text="Recevoir un seul email pour les fichiers déposés dans tous ses espaces de dépôt, au lieu d'un email par espace ?", verbose_name='Rapport de Fichiers groupé'),
+        ),
+    ]
@@ -2,9 +2,11 @@ from django.conf import settings
 from django.db import models
 from django.apps import apps
 from django.db.models import Q
+from django.utils.functional import cached_property
 
 from annoying.fields import AutoOneToOneField
 
+from .access import AccessRights
 from .managers import UserProfileQuerySet
 
 class UserIpAddress(models.Model):
@@ -31,6 +33,10 @@ class UserProfile(models.Model):
     send_files_report = models.BooleanField(
         verbose_name="Envoi Rapport de Fichiers", default=True,
         help_text="Envoyer par email le rapport des fichiers déposés ?")
+    files_report_digest = models.BooleanField(
+        verbose_name="Rapport de Fichiers groupé", default=False,
+        help_text="Recevoir un seul email pour les fichiers déposés dans tous ses espaces de "
+                  "dépôt, au lieu d'un email par espace ?")
     agreed_to_tos = models.BooleanField(
         default=False, verbose_name="accepté CGU",
         help_text="Les Conditions Générales d'Utilisation ont-elles été acceptées ?")
@@ -49,21 +55,29 @@ class UserProfile(models.Model):
     def is_audited(self):
         return self.profile_type == self.AUDITED
 
+    @cached_property
+    def access_rights(self):
+        """
+        Access rights of the user on the controls, loaded once for this profile instance -
+        that is once per request for `request.user.profile`.
+        """
+        return AccessRights(self)
+
     @property
     def questionnaires(self):
         """
         Returns the questionnaires belonging to the user.
         """
         Questionnaire = apps.get_model('control.Questionnaire')
-        inspected_controls = self.user_controls('demandeur')
-        audited_controls = self.user_controls('repondant')
+        inspected_controls = self.access_rights.control_ids('demandeur', include_deleted=True)
+        audited_controls = self.access_rights.control_ids('repondant', include_deleted=True)
         inspected_questionnaires = Questionnaire.objects.filter(control__in=inspected_controls)
         audited_questionnaires = Questionnaire.objects.filter(Q(control__in=audited_controls) & Q(is_draft=False))
         return inspected_questionnaires | audited_questionnaires
 
     def user_controls(self, accesstype, active=False):
         """
-        Returns the controls by access belonging to the user.
+        Returns the controls by access belonging to the user, soft-deleted ones included.
         """
         Control = apps.get_model('control.Control')
         if accesstype == 'all':
@@ -65,7 +65,7 @@ class UserProfileSerializer(serializers.ModelSerializer, KeycloakAdmin):
         profile = UserProfile.objects.filter(user__email=email).first()
 
         session_user = self.context['request'].user
-        if control is not None and control not in session_user.profile.user_controls('demandeur'):
+        if control is not None and not session_user.profile.access_rights.is_demandeur(control):
             e = PermissionDenied(
                 detail=("Only Demandeur can create user."),
                 code=status.HTTP_403_FORBIDDEN,
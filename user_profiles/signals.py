@@ -1,12 +1,12 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models.signals import pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
 from actstream import action
 
 from .api_views import user_api_post_remove
-from .models import UserProfile
+from .models import Access, UserProfile
 from parametres.models import Parametre
 from .serializers import user_api_post_add, user_api_post_update
 from utils.email import send_email
@@ -24,6 +24,17 @@ def lowercase_username(sender, instance, *args, **kwargs):
     instance.email = instance.email.lower()
 
 
+@receiver(post_save, sender=Access)
+@receiver(post_delete, sender=Access)
+def reset_access_rights(sender, instance, **kwargs):
+    """
+    When an access changes, the access rights already loaded for its profile are stale.
+    """
+    profile = instance._state.fields_cache.get('userprofile')
+    if profile is not None and 'access_rights' in profile.__dict__:
+        profile.access_rights.reset()
+
+
 def add_log_entry(verb, session_user, user_profile, control=None):
     action_details = {
         'sender': session_user,
@@ -0,0 +1,69 @@
+from pytest import mark
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from control.permissions import OnlyDemandeurCanAccess, OnlyRepondantCanAccess
+from tests import factories, utils
+from user_profiles.models import Access
+
+
+pytestmark = mark.django_db
+
+
+def test_access_rights_by_control():
+    inspected = factories.ControlFactory()
+    audited = factories.ControlFactory()
+    other = factories.ControlFactory()
+    user = utils.make_inspector_user(inspected)
+    utils.add_control_to_user(user, audited, Access.REPONDANT)
+    access_rights = user.profile.access_rights
+    assert access_rights.is_demandeur(inspected)
+    assert not access_rights.is_repondant(inspected)
+    assert access_rights.is_repondant(audited.id)
+    assert access_rights.has_access(str(audited.id))
+    assert not access_rights.has_access(other)
+    assert not access_rights.has_access('not an id')
+    assert access_rights.control_ids() == {inspected.id, audited.id}
+    assert access_rights.control_ids('demandeur') == {inspected.id}
+    assert list(access_rights.controls('repondant')) == [audited]
+
+
+def test_access_rights_leave_out_deleted_controls():
+    control = factories.ControlFactory(is_deleted=True)
+    user = utils.make_inspector_user(control)
+    access_rights = user.profile.access_rights
+    assert not access_rights.has_access(control)
+    assert access_rights.control_ids() == set()
+    assert access_rights.is_demandeur(control, include_deleted=True)
+    assert access_rights.control_ids(include_deleted=True) == {control.id}
+
+
+def test_access_rights_are_loaded_once():
+    controls = [factories.ControlFactory() for _ in range(3)]
+    user = utils.make_inspector_user(controls[0])
+    for control in controls[1:]:
+        utils.add_control_to_user(user, control, Access.REPONDANT)
+    questionnaire = factories.QuestionnaireFactory(control=controls[0])
+    profile = user.profile
+    request = type('Request', (), {'user': user, 'method': 'GET'})
+    with CaptureQueriesContext(connection) as context:
+        for control in controls:
+            OnlyDemandeurCanAccess().has_object_permission(request, None, control)
+            OnlyRepondantCanAccess().has_object_permission(request, None, control)
+            profile.access_rights.control_ids('repondant')
+        assert OnlyDemandeurCanAccess().has_object_permission(request, None, questionnaire)
+    # user.profile opens a savepoint on each access, which is not a query.
+    queries = [
+        query for query in context.captured_queries if 'SAVEPOINT' not in query['sql']]
+    assert len(queries) == 1
+
+
+def test_access_rights_are_reset_when_an_access_changes():
+    control = factories.ControlFactory()
+    user = utils.make_inspector_user()
+    assert not user.profile.access_rights.has_access(control)
+    utils.add_control_to_user(user, control, Access.DEMANDEUR)
+    assert user.profile.access_rights.is_demandeur(control)
+    user.profile.access.get(control=control).delete()
+    assert not user.profile.access_rights.has_access(control)
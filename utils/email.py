@@ -1,50 +1,109 @@
+import logging
+
 from django.conf import settings
 from django.contrib.sites.models import Site
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template import loader
 
-from actstream import action
+from logs.actions import add_log_entries
+from logs.buffer import build_action
+
 
+logger = logging.getLogger(__name__)
 
-def add_log_entry(site, verb, to, cc, subject, error=''):
+
+def make_log_message(to, cc, subject, error=''):
     log_message = f'Envoi email "{subject}" à : {to}.'
     if cc:
         log_message += f' Email CC : {cc}.'
     if error:
         log_message += f' Erreur : {error}'
-    action_details = {
-        'sender': site,
-        'verb': verb,
-        'description': log_message,
-    }
-    action.send(**action_details)
+    return log_message
+
+
+class EmailBatch(object):
+    """
+    Emails sent over one SMTP connection, from templates compiled once. Their log entries
+    are saved together when the batch ends :
+
+        with EmailBatch(text_template, html_template) as batch:
+            batch.send(to=..., subject=..., extra_context=...)
+
+    The connection is opened by the batch, unless it is given already open.
+    """
+
+    def __init__(
+            self, text_template, html_template,
+            from_email=settings.DEFAULT_FROM_EMAIL, connection=None):
+        self.text_template = loader.get_template(text_template)
+        self.html_template = loader.get_template(html_template)
+        self.from_email = from_email
+        self.connection = connection or get_connection()
+        self.opened = False
+        self.site = Site.objects.get_current()
+        self.log_entries = []
+
+    def __enter__(self):
+        try:
+            self.opened = bool(self.connection.open())
+        except Exception:
+            # Each email then fails to open the connection, and is logged as not sent.
+            logger.exception('Connexion au serveur SMTP impossible')
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.opened:
+            self.connection.close()
+        add_log_entries(self.log_entries)
+        self.log_entries = []
+
+    def send(self, to, subject, cc=None, extra_context=None):
+        """
+        Send one email, and return the number of emails sent : 1, or 0 if it failed.
+        """
+        context = {'site': self.site}
+        if extra_context:
+            context.update(extra_context)
+        text_message = self.text_template.render(context)
+        html_message = self.html_template.render(context)
+        if settings.ENV_NAME != "" and not settings.ENV_NAME.startswith("production"):
+            subject = settings.ENV_NAME + ' - ' + subject
+        email = EmailMultiAlternatives(
+            to=to,
+            cc=cc or [],
+            subject=subject,
+            body=text_message,
+            from_email=self.from_email,
+            connection=self.connection,
+        )
+        email.attach_alternative(html_message, "text/html")
+        try:
+            number_of_sent_email = email.send(fail_silently=False)
+            self.add_log_entry(verb='email envoyé', to=to, cc=cc, subject=subject)
+        except Exception as e:
+            self.add_log_entry(
+                verb='email non envoyé', to=to, cc=cc, subject=subject, error=str(e))
+            number_of_sent_email = 0
+        return number_of_sent_email
+
+    def add_log_entry(self, verb, to, cc, subject, error=''):
+        self.log_entries.append(build_action(
+            self.site, verb, description=make_log_message(to, cc, subject, error)))
+
+
+def send_emails(
+        messages, text_template, html_template,
+        from_email=settings.DEFAULT_FROM_EMAIL, connection=None):
+    """
+    Send the messages, dicts of the arguments of EmailBatch.send, as one batch. Return the
+    number of emails sent for each message.
+    """
+    with EmailBatch(text_template, html_template, from_email, connection) as batch:
+        return [batch.send(**message) for message in messages]
 
 
 def send_email(
         to, subject, text_template, html_template,
-        cc=None, from_email=settings.DEFAULT_FROM_EMAIL, extra_context=None):
-    current_site = Site.objects.get_current()
-    context = {'site': current_site}
-    if extra_context:
-        context.update(extra_context)
-    text_message = loader.render_to_string(text_template, context)
-    html_message = loader.render_to_string(html_template, context)
-    if settings.ENV_NAME != "" and not settings.ENV_NAME.startswith("production"):
-        subject = settings.ENV_NAME + ' - ' + subject
-    email = EmailMultiAlternatives(
-        to=to,
-        cc=cc or [],
-        subject=subject,
-        body=text_message,
-        from_email=from_email,
-    )
-    email.attach_alternative(html_message, "text/html")
-    try:
-        number_of_sent_email = email.send(fail_silently=False)
-        add_log_entry(site=current_site, verb='email envoyé', to=to, cc=cc, subject=subject)
-    except Exception as e:
-        add_log_entry(
-            site=current_site, verb='email non envoyé', to=to, cc=cc, subject=subject,
-            error=str(e))
-        number_of_sent_email = 0
-    return number_of_sent_email
+        cc=None, from_email=settings.DEFAULT_FROM_EMAIL, extra_context=None, connection=None):
+    message = {'to': to, 'cc': cc, 'subject': subject, 'extra_context': extra_context}
+    return send_emails([message], text_template, html_template, from_email, connection)[0]
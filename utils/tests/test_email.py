@@ -0,0 +1,74 @@
+from pytest import mark
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from actstream.models import Action
+
+from utils import email
+from utils.email import send_emails
+
+
+pytestmark = mark.django_db
+
+
+class CountingEmailBackend(EmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return True
+
+
+def make_message(address):
+    return {
+        'to': [address],
+        'subject': 'Relance',
+        'extra_context': {'questionnaire': {'id': 1, 'title': 'Q1'}, 'jours_echeance': 7},
+    }
+
+
+def test_messages_are_sent_over_one_connection_and_logged_together(monkeypatch):
+    monkeypatch.setattr(CountingEmailBackend, 'opened', 0)
+    monkeypatch.setattr(email, 'get_connection', CountingEmailBackend)
+    count_emails_before = len(mail.outbox)
+
+    with CaptureQueriesContext(connection) as context:
+        results = send_emails(
+            [make_message('a@example.com'), make_message('b@example.com')],
+            text_template='reporting/email/notif_date_echeance.txt',
+            html_template='reporting/email/notif_date_echeance.html')
+
+    assert results == [1, 1]
+    assert CountingEmailBackend.opened == 1
+    assert [sent.to for sent in mail.outbox[count_emails_before:]] == [
+        ['a@example.com'], ['b@example.com']]
+    action_inserts = [
+        query for query in context.captured_queries
+        if query['sql'].startswith('INSERT INTO "actstream_action"')]
+    assert len(action_inserts) == 1
+    assert Action.objects.filter(verb='email envoyé').count() == 2
+
+
+def test_failed_message_is_logged_and_does_not_stop_the_batch(monkeypatch):
+    sent = []
+
+    def send_messages(self, messages):
+        if messages[0].to == ['a@example.com']:
+            raise OSError('refusé')
+        sent.extend(messages)
+        return len(messages)
+
+    monkeypatch.setattr(EmailBackend, 'send_messages', send_messages)
+
+    results = send_emails(
+        [make_message('a@example.com'), make_message('b@example.com')],
+        text_template='reporting/email/notif_date_echeance.txt',
+        html_template='reporting/email/notif_date_echeance.html')
+
+    assert results == [0, 1]
+    assert [message.to for message in sent] == [['b@example.com']]
+    failure = Action.objects.get(verb='email non envoyé')
+    assert 'refusé' in failure.description